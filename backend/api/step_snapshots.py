@@ -8,7 +8,7 @@ from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer
 
-from database import get_db
+from repositories import repository
 from models import (
     StepSnapshot,
     StepSnapshotCreate,
@@ -54,58 +54,27 @@ async def create_snapshot(
         # 将快照数据序列化为JSON字符串
         snapshot_json = json.dumps(snapshot_data.snapshot_data, ensure_ascii=False)
 
-        # 插入数据库
-        async with get_db() as db:
-            # 先删除该用户在相同步骤的旧快照（保留离当前时间最近的）
-            await db.execute(
-                """
-                DELETE FROM step_snapshots
-                WHERE user_id = ? AND step_index = ?
-                """,
-                (user_id, snapshot_data.step_index)
-            )
-
-            # 插入新快照
-            cursor = await db.execute(
-                """
-                INSERT INTO step_snapshots
-                (user_id, step_index, step_route, snapshot_data, name, description, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    user_id,
-                    snapshot_data.step_index,
-                    snapshot_data.step_route,
-                    snapshot_json,
-                    snapshot_data.name,
-                    snapshot_data.description,
-                    datetime.now().isoformat()
-                )
-            )
+        # 插入数据库，先删除该用户在相同步骤的旧快照（保留离当前时间最近的）
+        row = await repository.create_snapshot(
+            user_id,
+            snapshot_data.step_index,
+            snapshot_data.step_route,
+            snapshot_json,
+            name=snapshot_data.name,
+            description=snapshot_data.description,
+            updated_at=datetime.now().isoformat(),
+            replace_step=True
+        )
 
-            snapshot_id = cursor.lastrowid
-            await db.commit()
-
-            # 获取创建的快照
-            cursor = await db.execute(
-                """
-                SELECT id, step_index, step_route, name, description, created_at, updated_at
-                FROM step_snapshots
-                WHERE id = ?
-                """,
-                (snapshot_id,)
-            )
-            row = await cursor.fetchone()
-
-            return StepSnapshotResponse(
-                id=row["id"],
-                step_index=row["step_index"],
-                step_route=row["step_route"],
-                created_at=datetime.fromisoformat(row["created_at"]),
-                updated_at=datetime.fromisoformat(row["updated_at"]),
-                name=row["name"],
-                description=row["description"]
-            )
+        return StepSnapshotResponse(
+            id=row["id"],
+            step_index=row["step_index"],
+            step_route=row["step_route"],
+            created_at=datetime.fromisoformat(row["created_at"]),
+            updated_at=datetime.fromisoformat(row["updated_at"]),
+            name=row["name"],
+            description=row["description"]
+        )
 
     except Exception as e:
         raise HTTPException(
@@ -122,33 +91,23 @@ async def get_snapshots(
     获取用户的所有步骤快照列表
     """
     try:
-        async with get_db() as db:
-            cursor = await db.execute(
-                """
-                SELECT id, step_index, step_route, name, created_at
-                FROM step_snapshots
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-                """,
-                (user_id,)
-            )
-            rows = await cursor.fetchall()
-
-            snapshots = []
-            for row in rows:
-                step_name = STEP_NAMES.get(row["step_index"], f"步骤 {row['step_index'] + 1}")
-                snapshots.append(
-                    SnapshotListItem(
-                        id=row["id"],
-                        step_index=row["step_index"],
-                        step_route=row["step_route"],
-                        step_name=step_name,
-                        created_at=datetime.fromisoformat(row["created_at"]),
-                        name=row["name"]
-                    )
+        rows = await repository.list_snapshots(user_id)
+
+        snapshots = []
+        for row in rows:
+            step_name = STEP_NAMES.get(row["step_index"], f"步骤 {row['step_index'] + 1}")
+            snapshots.append(
+                SnapshotListItem(
+                    id=row["id"],
+                    step_index=row["step_index"],
+                    step_route=row["step_route"],
+                    step_name=step_name,
+                    created_at=datetime.fromisoformat(row["created_at"]),
+                    name=row["name"]
                 )
+            )
 
-            return snapshots
+        return snapshots
 
     except Exception as e:
         raise HTTPException(
@@ -166,39 +125,29 @@ async def get_snapshot(
     获取特定的步骤快照详情
     """
     try:
-        async with get_db() as db:
-            cursor = await db.execute(
-                """
-                SELECT id, user_id, step_index, step_route, snapshot_data,
-                       name, description, created_at, updated_at
-                FROM step_snapshots
-                WHERE id = ? AND user_id = ?
-                """,
-                (snapshot_id, user_id)
-            )
-            row = await cursor.fetchone()
-
-            if not row:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Snapshot not found"
-                )
+        row = await repository.get_snapshot(user_id, snapshot_id)
 
-            # 解析快照数据
-            snapshot_data = json.loads(row["snapshot_data"])
-
-            return StepSnapshot(
-                id=row["id"],
-                user_id=row["user_id"],
-                step_index=row["step_index"],
-                step_route=row["step_route"],
-                snapshot_data=snapshot_data,
-                created_at=datetime.fromisoformat(row["created_at"]),
-                updated_at=datetime.fromisoformat(row["updated_at"]),
-                name=row["name"],
-                description=row["description"]
+        if not row:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Snapshot not found"
             )
 
+        # 解析快照数据
+        snapshot_data = json.loads(row["snapshot_data"])
+
+        return StepSnapshot(
+            id=row["id"],
+            user_id=row["user_id"],
+            step_index=row["step_index"],
+            step_route=row["step_route"],
+            snapshot_data=snapshot_data,
+            created_at=datetime.fromisoformat(row["created_at"]),
+            updated_at=datetime.fromisoformat(row["updated_at"]),
+            name=row["name"],
+            description=row["description"]
+        )
+
     except HTTPException:
         raise
     except Exception as e:
@@ -217,20 +166,12 @@ async def delete_snapshot(
     删除步骤快照
     """
     try:
-        async with get_db() as db:
-            cursor = await db.execute(
-                "DELETE FROM step_snapshots WHERE id = ? AND user_id = ?",
-                (snapshot_id, user_id)
+        if not await repository.delete_snapshot(user_id, snapshot_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Snapshot not found"
             )
 
-            if cursor.rowcount == 0:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Snapshot not found"
-                )
-
-            await db.commit()
-
     except HTTPException:
         raise
     except Exception as e:
@@ -259,55 +200,35 @@ async def restore_snapshot(
 
     try:
         # 先检查用户积分是否足够
-        async with get_db() as db:
-            cursor = await db.execute(
-                "SELECT credits_balance FROM users WHERE id = ?",
-                (user_id,)
-            )
-            user_row = await cursor.fetchone()
+        user_row = await repository.get_user(user_id)
 
-            if not user_row:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="User not found"
-                )
-
-            current_credits = user_row[0]
-
-            if current_credits < RESTORE_COST:
-                raise HTTPException(
-                    status_code=status.HTTP_402_PAYMENT_REQUIRED,
-                    detail=f"积分不足，恢复快照需要{RESTORE_COST}积分，当前余额：{current_credits}积分"
-                )
+        if not user_row:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
 
-            # 扣除积分
-            balance_before = current_credits
-            balance_after = current_credits - RESTORE_COST
+        current_credits = user_row["credits_balance"]
 
-            await db.execute(
-                "UPDATE users SET credits_balance = ?, updated_at = ? WHERE id = ?",
-                (balance_after, datetime.now().isoformat(), user_id)
+        if current_credits < RESTORE_COST:
+            raise HTTPException(
+                status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                detail=f"积分不足，恢复快照需要{RESTORE_COST}积分，当前余额：{current_credits}积分"
             )
 
-            # 记录积分变动历史
-            await db.execute(
-                """
-                INSERT INTO credit_history
-                (user_id, amount, type, reason, balance_before, balance_after, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    user_id,
-                    -RESTORE_COST,
-                    'spend',
-                    f'恢复步骤快照 (ID: {snapshot_id})',
-                    balance_before,
-                    balance_after,
-                    datetime.now().isoformat()
-                )
-            )
+        # 扣除积分并记录积分变动历史（扣除时再次校验余额）
+        balance_before = current_credits
+        balance_after = current_credits - RESTORE_COST
 
-            await db.commit()
+        changed = await repository.change_credits(
+            user_id, 'spend', -RESTORE_COST, f'恢复步骤快照 (ID: {snapshot_id})',
+            balance_before, balance_after, require_balance=RESTORE_COST
+        )
+        if not changed:
+            raise HTTPException(
+                status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                detail=f"积分不足，恢复快照需要{RESTORE_COST}积分"
+            )
 
         # 获取快照详情
         snapshot = await get_snapshot(snapshot_id, user_id)
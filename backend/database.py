@@ -2,147 +2,313 @@
 数据库配置和连接
 """
 import aiosqlite
+import asyncio
 import os
+import re
+from collections import OrderedDict
 from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
+
+from migrations import run_migrations, migrate
+from config import (
+    DB_READ_POOL_SIZE, DB_STATEMENT_CACHE_SIZE, DB_BUSY_TIMEOUT_MS,
+    DB_CACHE_SIZE_KB, DB_MMAP_SIZE,
+    PROJECT_SHARDS_ENABLED, PROJECT_DB_DIR, DB_SHARD_READ_POOL_SIZE, DB_SHARD_MAX_OPEN
+)
 
 DATABASE_PATH = os.path.join(os.path.dirname(__file__), "inspection.db")
 
+# 项目ID只允许字母、数字、下划线和连字符（用作分库文件名）
+PROJECT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
 
 async def init_db():
-    """初始化数据库表"""
+    """初始化数据库：按版本顺序执行尚未应用的迁移脚本"""
     async with aiosqlite.connect(DATABASE_PATH) as db:
-        # 项目表
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS projects (
-                id TEXT PRIMARY KEY,
-                name TEXT,
-                location TEXT,
-                inspection_date TEXT,
-                inspector TEXT,
-                company TEXT,
-                scene_type TEXT,
-                template_id TEXT,
-                status TEXT DEFAULT 'uploading',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # 图片表
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS images (
-                id TEXT PRIMARY KEY,
-                project_id TEXT,
-                filename TEXT,
-                original_name TEXT,
-                file_path TEXT,
-                file_size INTEGER,
-                width INTEGER,
-                height INTEGER,
-                gps_lat REAL,
-                gps_lng REAL,
-                captured_at TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (project_id) REFERENCES projects(id)
-            )
-        """)
-        
-        # 检测结果表
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS detection_results (
-                id TEXT PRIMARY KEY,
-                image_id TEXT,
-                project_id TEXT,
-                confidence REAL,
-                status TEXT,
-                suggestion TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (image_id) REFERENCES images(id),
-                FOREIGN KEY (project_id) REFERENCES projects(id)
-            )
-        """)
-        
-        # 问题/缺陷表
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS issues (
-                id TEXT PRIMARY KEY,
-                detection_id TEXT,
-                issue_type TEXT,
-                name TEXT,
-                severity TEXT,
-                description TEXT,
-                confidence REAL,
-                bbox_x REAL,
-                bbox_y REAL,
-                bbox_width REAL,
-                bbox_height REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (detection_id) REFERENCES detection_results(id)
-            )
-        """)
-
-        # 用户表
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE,
-                email TEXT UNIQUE,
-                password_hash TEXT,
-                credits INTEGER DEFAULT 100,
-                level INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # 积��历史表
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS credit_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                amount INTEGER,
-                type TEXT,
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        """)
-
-        # 步骤快照表
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS step_snapshots (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                step_index INTEGER NOT NULL CHECK(step_index >= 0 AND step_index <= 5),
-                step_route TEXT NOT NULL,
-                snapshot_data TEXT NOT NULL,
-                name TEXT,
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        """)
-
-        # 创建索引
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_step_snapshots_user_id ON step_snapshots(user_id)
-        """)
-
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_step_snapshots_created_at ON step_snapshots(created_at DESC)
-        """)
-
-        await db.commit()
+        await run_migrations(db)
+
+
+class ConnectionPool:
+    """
+    SQLite连接池
+    固定数量的只读连接 + 一个串行化的写连接，WAL模式下读写互不阻塞
+    """
+
+    def __init__(self, path: str, readers: int = DB_READ_POOL_SIZE):
+        self.path = path
+        self.reader_count = max(1, readers)
+        self.readers: Optional[asyncio.Queue] = None
+        self.reader_connections: List[aiosqlite.Connection] = []
+        self.writer: Optional[aiosqlite.Connection] = None
+        self.write_lock = asyncio.Lock()
+        self.open_lock = asyncio.Lock()
+        # 借用计数，归零时 idle 置位
+        self.active = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    @property
+    def is_open(self) -> bool:
+        return self.writer is not None
+
+    async def connect(self, readonly: bool) -> aiosqlite.Connection:
+        """创建一个长连接并设置性能相关的PRAGMA"""
+        db = await aiosqlite.connect(self.path, cached_statements=DB_STATEMENT_CACHE_SIZE)
+        db.row_factory = aiosqlite.Row
+        pragmas = [
+            f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}",
+            "PRAGMA synchronous = NORMAL",
+            f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}",
+            f"PRAGMA mmap_size = {DB_MMAP_SIZE}",
+            "PRAGMA temp_store = MEMORY"
+        ]
+        if readonly:
+            pragmas.append("PRAGMA query_only = ON")
+        # executescript 会把每条语句执行完毕，避免未结束的语句继续持有锁
+        await db.executescript(";".join(pragmas))
+        return db
+
+    async def open(self):
+        """打开连接池（重复调用无副作用）"""
+        async with self.open_lock:
+            if self.is_open:
+                return
+            self.write_lock = asyncio.Lock()
+            writer = await self.connect(readonly=False)
+            await writer.executescript("PRAGMA journal_mode = WAL")
+            self.readers = asyncio.Queue()
+            for _ in range(self.reader_count):
+                reader = await self.connect(readonly=True)
+                self.reader_connections.append(reader)
+                self.readers.put_nowait(reader)
+            self.writer = writer
+
+    async def close(self):
+        """关闭所有连接"""
+        async with self.open_lock:
+            if not self.is_open:
+                return
+            async with self.write_lock:
+                await self.writer.close()
+                self.writer = None
+            for reader in self.reader_connections:
+                await reader.close()
+            self.reader_connections = []
+            self.readers = None
+
+    def retain(self):
+        """增加借用计数，借用中的连接池不会被分库管理关闭"""
+        self.active += 1
+        self.idle.clear()
+
+    def release(self):
+        """减少借用计数"""
+        self.active -= 1
+        if self.active == 0:
+            self.idle.set()
+
+    @asynccontextmanager
+    async def acquire(self, readonly: bool = False):
+        """借出连接；写连接同一时刻只借给一个调用方"""
+        self.retain()
+        try:
+            if not self.is_open:
+                await self.open()
+            async with self.borrow(readonly) as db:
+                yield db
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def borrow(self, readonly: bool):
+        """从只读连接队列或写连接取出连接，用完归还"""
+        if readonly:
+            readers = self.readers
+            db = await readers.get()
+            try:
+                yield db
+            finally:
+                if db.in_transaction:
+                    await db.rollback()
+                readers.put_nowait(db)
+        else:
+            async with self.write_lock:
+                db = self.writer
+                try:
+                    yield db
+                finally:
+                    # 未提交的事务不能泄漏给下一个调用方
+                    if db.in_transaction:
+                        await db.rollback()
+
+
+# 全局连接池，应用启动时打开、退出时关闭
+db_pool = ConnectionPool(DATABASE_PATH)
 
 
 @asynccontextmanager
-async def get_db():
-    """获取数据库连接"""
-    db = await aiosqlite.connect(DATABASE_PATH)
-    db.row_factory = aiosqlite.Row
-    try:
+async def get_db(readonly: bool = False):
+    """
+    获取数据库连接（从连接池借出）
+    readonly=True 使用只读连接，可与写操作并发；默认使用串行化的写连接
+    写连接使用期间不要再嵌套获取写连接
+    """
+    async with db_pool.acquire(readonly) as db:
         yield db
-    finally:
-        await db.close()
 
+
+async def get_read_db():
+    """FastAPI依赖：只读连接"""
+    async with db_pool.acquire(readonly=True) as db:
+        yield db
+
+
+async def get_write_db():
+    """FastAPI依赖：写连接"""
+    async with db_pool.acquire(readonly=False) as db:
+        yield db
+
+
+class ProjectShards:
+    """
+    按项目分库：每个项目的 images/detection_results/issues 存放在独立的SQLite文件中，
+    主库只保留用户、积分及项目索引；不同项目的写操作互不阻塞，删除项目只需删除文件
+    """
+
+    def __init__(self, directory: str, max_open: int = DB_SHARD_MAX_OPEN):
+        self.directory = directory
+        self.max_open = max_open
+        self.pools: "OrderedDict[str, ConnectionPool]" = OrderedDict()
+        self.lock = asyncio.Lock()
+
+    def get_path(self, project_id: str) -> str:
+        """项目分库文件路径"""
+        if not PROJECT_ID_PATTERN.match(project_id):
+            raise ValueError(f"非法的项目ID: {project_id}")
+        return os.path.join(self.directory, f"{project_id}.db")
+
+    def exists(self, project_id: str) -> bool:
+        return os.path.exists(self.get_path(project_id))
+
+    @asynccontextmanager
+    async def lease(self, project_id: str, create: bool = False):
+        """
+        借用项目分库的连接池（分库不存在且 create=False 时为 None）
+        在分库锁内增加借用计数，借用期间不会被淘汰或删除；借用期间不要再借用其他分库
+        """
+        async with self.lock:
+            pool = await self.get_pool(project_id, create)
+            if pool is not None:
+                pool.retain()
+        try:
+            yield pool
+        finally:
+            if pool is not None:
+                pool.release()
+
+    async def get_pool(self, project_id: str, create: bool) -> Optional[ConnectionPool]:
+        """取出或打开项目分库的连接池，需持有 self.lock（外部使用 lease）"""
+        pool = self.pools.get(project_id)
+        if pool is not None:
+            self.pools.move_to_end(project_id)
+            return pool
+
+        path = self.get_path(project_id)
+        if not os.path.exists(path):
+            if not create:
+                return None
+            os.makedirs(self.directory, exist_ok=True)
+        await migrate(path, project_scope=True)
+
+        pool = ConnectionPool(path, readers=DB_SHARD_READ_POOL_SIZE)
+        await pool.open()
+        self.pools[project_id] = pool
+        await self.evict()
+        return pool
+
+    async def evict(self):
+        """关闭超出上限且空闲的分库连接池（最久未使用优先）"""
+        for project_id in list(self.pools):
+            if len(self.pools) <= self.max_open:
+                break
+            pool = self.pools[project_id]
+            if pool.active == 0:
+                del self.pools[project_id]
+                await pool.close()
+
+    async def drop(self, project_id: str) -> bool:
+        """等待借用结束后关闭并删除项目分库，返回是否存在分库"""
+        async with self.lock:
+            pool = self.pools.pop(project_id, None)
+            if pool is not None:
+                # 持有分库锁等待，期间不会有新的借用
+                await pool.idle.wait()
+                await pool.close()
+            path = self.get_path(project_id)
+            existed = os.path.exists(path)
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            return existed
+
+    def list_projects(self) -> List[Tuple[str, float]]:
+        """已有分库的项目：[(项目ID, 分库文件修改时间)]"""
+        projects = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    project_id, ext = os.path.splitext(entry.name)
+                    if ext == ".db" and PROJECT_ID_PATTERN.match(project_id):
+                        projects.append((project_id, entry.stat().st_mtime))
+        except FileNotFoundError:
+            pass
+        return projects
+
+    async def close(self):
+        """关闭所有分库连接"""
+        async with self.lock:
+            for pool in self.pools.values():
+                await pool.close()
+            self.pools.clear()
+
+
+# 项目分库管理（仅在启用分库时使用）
+project_shards = ProjectShards(PROJECT_DB_DIR)
+
+
+async def create_project_db(project_id: str):
+    """新建项目时创建其分库（未启用分库时无操作）"""
+    if PROJECT_SHARDS_ENABLED:
+        async with project_shards.lease(project_id, create=True):
+            pass
+
+
+def is_project_sharded(project_id: str) -> bool:
+    """
+    项目图片及检测数据是否存放在分库中
+    启用分库且项目已有分库时为分库，否则（未启用分库或启用前创建的项目）为主库
+    """
+    return bool(PROJECT_SHARDS_ENABLED and PROJECT_ID_PATTERN.match(project_id)
+                and project_shards.exists(project_id))
+
+
+@asynccontextmanager
+async def get_project_db(project_id: str, readonly: bool = False):
+    """
+    获取存放项目图片及检测数据的数据库连接（分库或主库，见 is_project_sharded）
+    与 get_db 一样不要在写连接使用期间嵌套获取
+    """
+    if not (PROJECT_SHARDS_ENABLED and PROJECT_ID_PATTERN.match(project_id)):
+        async with db_pool.acquire(readonly) as db:
+            yield db
+        return
+    async with project_shards.lease(project_id) as pool:
+        async with (pool or db_pool).acquire(readonly) as db:
+            yield db
+
+
+async def drop_project_db(project_id: str) -> bool:
+    """删除项目分库，返回是否存在分库（存在时主库中无需再删除该项目的图片及检测数据）"""
+    if not PROJECT_SHARDS_ENABLED or not PROJECT_ID_PATTERN.match(project_id):
+        return False
+    return await project_shards.drop(project_id)
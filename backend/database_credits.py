@@ -1,71 +1,22 @@
 """
 创建积分相关数据库表
 """
+import asyncio
 import sqlite3
 import os
 
+from migrations import migrate
+
 def create_credit_tables(db_path):
-    """创建积分相关的数据库表"""
+    """创建积分相关的数据库表并写入默认用户"""
+
+    # 表结构统一由迁移脚本维护
+    asyncio.run(migrate(db_path))
 
     # 连接数据库
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
-    # 创建用户表（如果不存在）
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL UNIQUE,
-            avatar TEXT,
-            join_date TEXT NOT NULL,
-            total_projects INTEGER DEFAULT 0,
-            total_reports INTEGER DEFAULT 0,
-            last_login TEXT,
-            credits_balance INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # 创建积分历史记录表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS credit_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            type TEXT NOT NULL CHECK (type IN ('earn', 'spend')),
-            amount INTEGER NOT NULL,
-            reason TEXT NOT NULL,
-            balance_before INTEGER NOT NULL,
-            balance_after INTEGER NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-
-    # 创建步骤快照表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS step_snapshots (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            step INTEGER NOT NULL,
-            step_name TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            image_count INTEGER DEFAULT 0,
-            template_name TEXT,
-            data TEXT, -- JSON格式的快照数据
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-
-    # 创建索引
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_credit_history_user_id ON credit_history(user_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_credit_history_timestamp ON credit_history(timestamp)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_step_snapshots_user_id ON step_snapshots(user_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_step_snapshots_timestamp ON step_snapshots(timestamp)')
-
     # 检查是否已有用户，如果没有则创建默认用户
     cursor.execute('SELECT COUNT(*) FROM users')
     user_count = cursor.fetchone()[0]
@@ -95,7 +46,7 @@ def create_credit_tables(db_path):
 
     conn.commit()
     conn.close()
-    print(f"积分相关表创建完成: {db_path}")
+    print(f"积分相关表已就绪: {db_path}")
 
 if __name__ == "__main__":
     db_path = os.path.join(os.path.dirname(__file__), 'inspection.db')
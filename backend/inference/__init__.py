@@ -0,0 +1,48 @@
+"""
+推理层
+按 INFERENCE_BACKEND 配置选择推理后端，检测任务统一通过 inference_backend 推理；
+更换模型只需实现新的 InferenceBackend
+"""
+from config import (
+    INFERENCE_BACKEND, INFERENCE_BATCH_SIZE, INFERENCE_SCORE_THRESHOLD,
+    ONNX_MODEL_PATH, ONNX_INPUT_SIZE, ONNX_THREADS, ONNX_LABELS,
+    INFERENCE_TILING, INFERENCE_TILE_SIZE, INFERENCE_TILE_OVERLAP, INFERENCE_TILE_FULL_FRAME,
+    INFERENCE_MERGE_METHOD, INFERENCE_MERGE_METRIC, INFERENCE_MERGE_THRESHOLD,
+    MOCK_INFERENCE_SEED, MOCK_BATCH_WAIT_MS, MOCK_IMAGE_WAIT_MS, MOCK_BATCH_CPU_MS, MOCK_IMAGE_CPU_MS,
+    MOCK_LATENCY_JITTER
+)
+from inference.base import InferenceBackend, decode_image, summarize
+from inference.tiling import Tiler
+
+
+def create_tiler() -> Tiler:
+    """按配置创建分块推理"""
+    return Tiler(INFERENCE_TILE_SIZE, INFERENCE_TILE_OVERLAP, full_frame=INFERENCE_TILE_FULL_FRAME,
+                 merge=INFERENCE_MERGE_METHOD, metric=INFERENCE_MERGE_METRIC,
+                 threshold=INFERENCE_MERGE_THRESHOLD)
+
+
+def create_backend(backend: str = INFERENCE_BACKEND, batch_size: int = INFERENCE_BATCH_SIZE,
+                   threads: int = ONNX_THREADS, tiling: bool = INFERENCE_TILING) -> InferenceBackend:
+    """创建指定类型的推理后端（模型在 load 时加载），tiling=True 时启用分块推理"""
+    if backend == "mock":
+        from inference.mock import MockBackend, MockLatency
+        latency = MockLatency(MOCK_BATCH_WAIT_MS, MOCK_IMAGE_WAIT_MS, MOCK_BATCH_CPU_MS, MOCK_IMAGE_CPU_MS,
+                              jitter=MOCK_LATENCY_JITTER)
+        instance = MockBackend(batch_size, seed=MOCK_INFERENCE_SEED, latency=latency)
+    elif backend == "onnx":
+        from inference.onnx_runtime import OnnxBackend
+        instance = OnnxBackend(ONNX_MODEL_PATH, ONNX_INPUT_SIZE, batch_size, ONNX_LABELS,
+                               INFERENCE_SCORE_THRESHOLD, threads=threads)
+    else:
+        raise RuntimeError(f"不支持的推理后端: {backend}")
+    if tiling:
+        instance.tiler = create_tiler()
+    return instance
+
+
+# 全局推理后端
+inference_backend = create_backend()
+
+__all__ = ["InferenceBackend", "Tiler", "create_backend", "create_tiler", "decode_image", "summarize",
+           "inference_backend"]
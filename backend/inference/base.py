@@ -0,0 +1,166 @@
+"""
+推理后端接口
+检测任务将图片解码为后端要求边长的RGB数组，按 batch_size 分批调用 infer_batch；
+后端只负责推理，检测结论（状态、建议）由 summarize 统一生成
+"""
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+
+def decode_image(path: str, size: int) -> np.ndarray:
+    """
+    解码图片并缩放为 size×size 的RGB数组（HWC，uint8）
+    问题框使用百分比坐标，拉伸缩放不影响换算回原图
+    """
+    with Image.open(path) as img:
+        # JPEG草稿模式：解码时直接按比例缩小
+        img.draft("RGB", (size, size))
+        # 按EXIF方向旋转，与预览图方向一致
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        return np.asarray(img.resize((size, size), Image.BILINEAR))
+
+
+def summarize(image_id: str, result: Dict) -> Dict:
+    """根据推理结果生成检测结论"""
+    issues = result["issues"]
+    if not issues:
+        status = "success"
+        suggestion = "状态良好，无需处理"
+    elif any(i["severity"] == "danger" for i in issues):
+        status = "danger"
+        suggestion = "存在严重问题，建议立即处理"
+    else:
+        status = "warning"
+        suggestion = "存在一般问题，建议安排检修"
+
+    return {
+        "image_id": image_id,
+        "confidence": result["confidence"],
+        "status": status,
+        "issues": issues,
+        "suggestion": suggestion
+    }
+
+
+class InferenceBackend(ABC):
+    """推理后端基类"""
+
+    # 后端名称及模型输入边长
+    name = ""
+    input_size = 0
+
+    def __init__(self, batch_size: int):
+        self.batch_size = max(1, batch_size)
+        self.loaded = False
+        # 分块推理（inference.tiling.Tiler），为 None 时整图推理
+        self.tiler = None
+
+        # 统计
+        self.batches = 0
+        self.images = 0
+        self.tiles = 0
+        self.infer_seconds = 0.0
+        self.decode_failures = 0
+
+    @property
+    def model_version(self) -> str:
+        """模型版本标识"""
+        return self.name
+
+    def cache_params(self) -> Dict:
+        """影响推理结果的参数（与模型版本、场景类型一起组成检测结果缓存键）"""
+        return {
+            "backend": self.name,
+            "input_size": self.input_size,
+            "tiling": self.tiler.params() if self.tiler is not None else None
+        }
+
+    def load(self):
+        """加载模型（启动时调用一次）"""
+        self.loaded = True
+
+    def warmup(self):
+        """以空白图片执行一次整批推理，避免首个任务承担初始化开销"""
+        blank = np.zeros((self.input_size, self.input_size, 3), dtype=np.uint8)
+        self.infer_batch([blank] * self.batch_size, "building")
+
+    @abstractmethod
+    def infer_batch(self, images: Sequence[np.ndarray], scene_type: str,
+                    keys: Optional[Sequence[str]] = None) -> List[Dict]:
+        """
+        对一批图片推理，返回与输入一一对应的结果 {"confidence", "issues"}
+        问题框 bbox 为相对图片宽高的百分比坐标；keys 为与输入对应的图片ID（分块时为 图片ID#分块序号），
+        模拟后端据此生成可复现的结果
+        """
+
+    def detect(self, images: Sequence[dict], scene_type: str) -> List[Dict]:
+        """
+        解码图片（{"id", "file_path"}）并分批推理，返回检测结果（阻塞执行）
+        无法解码的图片记录日志后跳过
+        """
+        if self.tiler is not None:
+            return self.detect_tiled(images, scene_type)
+
+        detections = []
+        for start in range(0, len(images), self.batch_size):
+            ids, decoded = [], []
+            for image in images[start:start + self.batch_size]:
+                try:
+                    decoded.append(decode_image(image["file_path"], self.input_size))
+                    ids.append(image["id"])
+                except Exception as e:
+                    self.record_decode_failure(image["id"], e)
+            if not decoded:
+                continue
+
+            started = time.perf_counter()
+            results = self.infer_batch(decoded, scene_type, keys=ids)
+            self.record(len(decoded), time.perf_counter() - started)
+            detections += [summarize(image_id, result) for image_id, result in zip(ids, results)]
+        return detections
+
+    def detect_tiled(self, images: Sequence[dict], scene_type: str) -> List[Dict]:
+        """逐张解码并分块推理（各图片的分块按 batch_size 分批）"""
+        detections = []
+        for image in images:
+            try:
+                frame, tile = self.tiler.open(image["file_path"], self.input_size)
+            except Exception as e:
+                self.record_decode_failure(image["id"], e)
+                continue
+            result, tiles, batches, seconds = self.tiler.detect(self, frame, tile, scene_type, key=image["id"])
+            self.record(1, seconds, batches=batches, tiles=tiles)
+            detections.append(summarize(image["id"], result))
+        return detections
+
+    def record(self, images: int, seconds: float, batches: int = 1, tiles: int = 0):
+        """记录推理的图片数（分块推理时另有分块数）、批次数及耗时"""
+        self.batches += batches
+        self.images += images
+        self.tiles += tiles
+        self.infer_seconds += seconds
+
+    def record_decode_failure(self, image_id: str, error):
+        self.decode_failures += 1
+        logger.warning("图片解码失败，跳过检测: %s (%s)", image_id, error)
+
+    def stats(self) -> dict:
+        """推理统计"""
+        return {
+            "backend": self.name,
+            "model_version": self.model_version,
+            "loaded": self.loaded,
+            "batch_size": self.batch_size,
+            "batches": self.batches,
+            "images": self.images,
+            "tiles": self.tiles if self.tiler is not None else None,
+            "decode_failures": self.decode_failures,
+            "avg_batch_ms": round(self.infer_seconds / self.batches * 1000, 2) if self.batches else None
+        }
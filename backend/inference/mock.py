@@ -0,0 +1,86 @@
+"""
+模拟推理后端
+不读取像素，按场景生成问题，用于演示、开发环境及压测：
+设定种子时每张图片的结果由种子与图片ID决定（多次运行、多个进程间结果一致），
+并可按批次与图片数模拟推理耗时（等待或占用CPU），无需模型即可测试检测流程的整体吞吐
+"""
+import random
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from inference.base import InferenceBackend
+from services.mock_ai import MockAIService
+
+
+class MockLatency:
+    """模拟推理耗时（毫秒）：每批固定开销加每张图片开销，wait 为等待，cpu 为忙循环"""
+
+    def __init__(self, batch_wait_ms: float = 0, image_wait_ms: float = 0,
+                 batch_cpu_ms: float = 0, image_cpu_ms: float = 0, jitter: float = 0):
+        self.batch_wait_ms = max(0.0, batch_wait_ms)
+        self.image_wait_ms = max(0.0, image_wait_ms)
+        self.batch_cpu_ms = max(0.0, batch_cpu_ms)
+        self.image_cpu_ms = max(0.0, image_cpu_ms)
+        self.jitter = min(max(0.0, jitter), 1.0)
+
+    @property
+    def enabled(self) -> bool:
+        return any((self.batch_wait_ms, self.image_wait_ms, self.batch_cpu_ms, self.image_cpu_ms))
+
+    def apply(self, count: int, rng: random.Random):
+        """模拟一批 count 张图片的推理耗时（阻塞）"""
+        scale = 1 + rng.uniform(-self.jitter, self.jitter) if self.jitter else 1
+        cpu_seconds = (self.batch_cpu_ms + self.image_cpu_ms * count) * scale / 1000
+        wait_seconds = (self.batch_wait_ms + self.image_wait_ms * count) * scale / 1000
+        if cpu_seconds > 0:
+            deadline = time.perf_counter() + cpu_seconds
+            while time.perf_counter() < deadline:
+                pass
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+
+    def params(self) -> Dict:
+        return {
+            "batch_wait_ms": self.batch_wait_ms,
+            "image_wait_ms": self.image_wait_ms,
+            "batch_cpu_ms": self.batch_cpu_ms,
+            "image_cpu_ms": self.image_cpu_ms,
+            "jitter": self.jitter
+        }
+
+
+class MockBackend(InferenceBackend):
+    """模拟推理后端"""
+
+    name = "mock"
+    # 模拟结果与像素无关，解码为小图即可
+    input_size = 64
+
+    def __init__(self, batch_size: int, seed: Optional[str] = None, latency: Optional[MockLatency] = None):
+        super().__init__(batch_size)
+        # 为 None 时结果每次随机
+        self.seed = seed
+        self.latency = latency or MockLatency()
+        # 耗时波动（按种子可复现）
+        self.latency_rng = random.Random(seed)
+
+    def cache_params(self) -> Dict:
+        return {**super().cache_params(), "seed": self.seed}
+
+    def image_rng(self, scene_type: str, key: Optional[str]) -> Optional[random.Random]:
+        """按种子、场景类型及图片ID设定种子的随机数生成器；未设定种子或没有图片ID时为 None"""
+        if self.seed is None or key is None:
+            return None
+        return random.Random(f"{self.seed}:{scene_type}:{key}")
+
+    def infer_batch(self, images: Sequence[np.ndarray], scene_type: str,
+                    keys: Optional[Sequence[str]] = None) -> List[Dict]:
+        if self.latency.enabled:
+            self.latency.apply(len(images), self.latency_rng)
+        keys = keys if keys is not None else [None] * len(images)
+        return [MockAIService.generate_issues(scene_type, self.image_rng(scene_type, key)) for key in keys]
+
+    def stats(self) -> dict:
+        return {**super().stats(), "seed": self.seed, "latency": self.latency.params()}
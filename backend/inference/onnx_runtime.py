@@ -0,0 +1,127 @@
+"""
+ONNX Runtime 推理后端（CPU）
+模型输入为 NCHW float32（RGB，0~1），输出 [N, K, 6]：每行为输入像素坐标下的
+x1, y1, x2, y2, 置信度, 类别序号（已做过NMS的检测模型导出格式）
+"""
+import hashlib
+import os
+import uuid
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from inference.base import InferenceBackend
+from services.mock_ai import MockAIService
+
+
+def issue_template(scene_type: str, issue_type: str) -> Dict:
+    """问题类型的名称、严重程度及描述：优先取当前场景，其次其他场景"""
+    scenes = [scene_type] + [s for s in MockAIService.ISSUE_TYPES if s != scene_type]
+    for scene in scenes:
+        for template in MockAIService.ISSUE_TYPES.get(scene, []):
+            if template["type"] == issue_type:
+                return template
+    return {"type": issue_type, "name": issue_type, "severity": "warning", "description": ""}
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime CPU 推理后端"""
+
+    name = "onnx"
+
+    def __init__(self, model_path: str, input_size: int, batch_size: int,
+                 labels: Sequence[str], score_threshold: float, threads: int = 0):
+        super().__init__(batch_size)
+        self.model_path = model_path
+        self.input_size = input_size
+        self.labels = list(labels)
+        self.score_threshold = score_threshold
+        self.threads = threads
+        self.session = None
+        self.input_name = ""
+        # 模型输入的批次维度固定时（如导出为1）按该大小拆分并补齐
+        self.fixed_batch: Optional[int] = None
+        self.version = ""
+
+    @property
+    def model_version(self) -> str:
+        return self.version or self.name
+
+    def cache_params(self) -> Dict:
+        return {
+            **super().cache_params(),
+            "labels": self.labels,
+            "score_threshold": self.score_threshold
+        }
+
+    def load(self):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("使用 ONNX 推理后端需要安装 onnxruntime")
+        if not self.model_path or not os.path.isfile(self.model_path):
+            raise RuntimeError(f"ONNX 模型文件不存在: {self.model_path or '未配置 ONNX_MODEL_PATH'}")
+
+        options = onnxruntime.SessionOptions()
+        if self.threads > 0:
+            options.intra_op_num_threads = self.threads
+        self.session = onnxruntime.InferenceSession(
+            self.model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.fixed_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+
+        # 模型文件名加内容摘要作为版本标识
+        digest = hashlib.sha256()
+        with open(self.model_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        self.version = f"{os.path.basename(self.model_path)}@{digest.hexdigest()[:12]}"
+        self.loaded = True
+
+    def infer_batch(self, images: Sequence[np.ndarray], scene_type: str,
+                    keys: Optional[Sequence[str]] = None) -> List[Dict]:
+        batch = np.ascontiguousarray(np.stack(images).transpose(0, 3, 1, 2), dtype=np.float32) / 255.0
+        step = self.fixed_batch or len(batch)
+        outputs = []
+        for start in range(0, len(batch), step):
+            chunk = batch[start:start + step]
+            count = len(chunk)
+            if count < step:
+                chunk = np.concatenate([chunk, np.zeros((step - count,) + chunk.shape[1:], dtype=np.float32)])
+            outputs.append(self.session.run(None, {self.input_name: chunk})[0][:count])
+        return [self.parse(rows, scene_type) for rows in np.concatenate(outputs)]
+
+    def parse(self, rows: np.ndarray, scene_type: str) -> Dict:
+        """将单张图片的输出行转换为问题列表"""
+        rows = rows.reshape(-1, 6)
+        kept = rows[rows[:, 4] >= self.score_threshold]
+        issues = [self.issue(row, scene_type) for row in kept]
+        # 无问题时以最高候选分数的补数作为"无问题"的置信度
+        confidence = float(kept[:, 4].max()) if len(kept) else 1.0 - float(rows[:, 4].max(initial=0.0))
+        return {"confidence": round(confidence, 2), "issues": issues}
+
+    def issue(self, row: np.ndarray, scene_type: str) -> Dict:
+        x1, y1, x2, y2 = np.clip(row[:4] / self.input_size * 100, 0, 100).tolist()
+        index = int(row[5])
+        issue_type = self.labels[index] if 0 <= index < len(self.labels) else f"class_{index}"
+        template = issue_template(scene_type, issue_type)
+        # 模板描述含需要量测的变量时使用通用描述
+        description = template["description"]
+        if not description or "{" in description:
+            description = f"检测到{template['name']}"
+        return {
+            "id": f"issue-{uuid.uuid4().hex[:8]}",
+            "type": issue_type,
+            "name": template["name"],
+            "severity": template["severity"],
+            "description": description,
+            "confidence": round(float(row[4]), 2),
+            "bbox": {
+                "x": round(x1, 1),
+                "y": round(y1, 1),
+                "width": round(x2 - x1, 1),
+                "height": round(y2 - y1, 1)
+            }
+        }
@@ -0,0 +1,193 @@
+"""
+分块推理
+高分辨率航拍图整图缩放到模型输入尺寸后，细小裂缝、热斑只剩几个像素；分块推理将图片按
+tile_size 像素的方块（相邻块重叠 overlap）切分，各块缩放到模型输入尺寸后分批推理，
+问题框从分块百分比坐标换算回整图百分比坐标，再合并相邻分块重复检出的框
+"""
+import math
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from inference.base import InferenceBackend
+
+# 重复框合并方式及重叠度量
+MERGE_METHODS = ("nms", "wbf")
+MERGE_METRICS = ("iou", "ios")
+
+# 合并时按类别平移坐标，使不同类别的框互不重叠（坐标为 0~100 的百分比）
+CLASS_OFFSET = 1000.0
+
+
+def tile_starts(length: int, tile: int, stride: int) -> np.ndarray:
+    """一个方向上各分块的起点，最后一块与边缘对齐"""
+    if length <= tile:
+        return np.zeros(1, dtype=np.int64)
+    return np.append(np.arange(0, length - tile, stride), length - tile)
+
+
+def box_overlaps(box: np.ndarray, boxes: np.ndarray, metric: str) -> np.ndarray:
+    """一个框（x1, y1, x2, y2）与一组框的重叠度：iou 为交并比，ios 为交集与较小框面积之比"""
+    width = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    height = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    inter = width * height
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if metric == "iou":
+        denom = area + areas - inter
+    else:
+        denom = np.minimum(area, areas)
+    return inter / np.maximum(denom, 1e-9)
+
+
+def group_boxes(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray,
+                threshold: float, metric: str) -> List[Tuple[int, np.ndarray]]:
+    """
+    贪心分组：按置信度从高到低取保留框，同类别中与其重叠度不低于 threshold 的框归入该组
+    框按左边界排序后，每个保留框只与左边界落在 [x1 - 最大框宽, x2] 内的窗口以向量运算比较，
+    不做两两比较；排序及二分查找为 O(n log n)，窗口大小取决于框的局部密度
+    返回 [(保留框序号, 组内其他框序号)]
+    """
+    shifted = boxes + classes[:, None] * CLASS_OFFSET
+    by_left = np.argsort(shifted[:, 0], kind="stable")
+    lefts = shifted[by_left, 0]
+    max_width = float((shifted[:, 2] - shifted[:, 0]).max())
+    alive = np.ones(len(boxes), dtype=bool)
+
+    groups = []
+    for keep in np.argsort(-scores, kind="stable"):
+        if not alive[keep]:
+            continue
+        alive[keep] = False
+        box = shifted[keep]
+        window = by_left[np.searchsorted(lefts, box[0] - max_width):np.searchsorted(lefts, box[2], "right")]
+        window = window[alive[window]]
+        matched = window[box_overlaps(box, shifted[window], metric) >= threshold]
+        alive[matched] = False
+        groups.append((int(keep), matched))
+    return groups
+
+
+class Tiler:
+    """分块切分、推理及合并"""
+
+    def __init__(self, tile_size: int, overlap: float, full_frame: bool = True,
+                 merge: str = "nms", metric: str = "ios", threshold: float = 0.5):
+        if merge not in MERGE_METHODS:
+            raise RuntimeError(f"不支持的合并方式: {merge}")
+        if metric not in MERGE_METRICS:
+            raise RuntimeError(f"不支持的重叠度量: {metric}")
+        self.tile_size = tile_size
+        self.overlap = min(max(overlap, 0.0), 0.9)
+        self.full_frame = full_frame
+        self.merge = merge
+        self.metric = metric
+        self.threshold = threshold
+
+    def params(self) -> Dict:
+        """影响推理结果的分块参数"""
+        return {
+            "tile_size": self.tile_size,
+            "overlap": self.overlap,
+            "full_frame": self.full_frame,
+            "merge": self.merge,
+            "metric": self.metric,
+            "threshold": self.threshold
+        }
+
+    def grid(self, width: int, height: int, tile: int) -> np.ndarray:
+        """分块区域（像素坐标 x1, y1, x2, y2）"""
+        stride = max(1, int(tile * (1 - self.overlap)))
+        xs, ys = np.meshgrid(tile_starts(width, tile, stride), tile_starts(height, tile, stride))
+        x1, y1 = xs.ravel(), ys.ravel()
+        return np.stack([x1, y1, np.minimum(x1 + tile, width), np.minimum(y1 + tile, height)], axis=1)
+
+    def open(self, path: str, input_size: int) -> Tuple[Image.Image, int]:
+        """
+        解码图片，返回按EXIF方向旋转后的RGB图及解码后的分块边长
+        分块会缩小到模型输入尺寸，JPEG按相同比例以草稿模式解码
+        """
+        with Image.open(path) as img:
+            longest = max(img.size)
+            scale = min(1.0, input_size / self.tile_size)
+            img.draft("RGB", (math.ceil(img.size[0] * scale), math.ceil(img.size[1] * scale)))
+            frame = ImageOps.exif_transpose(img).convert("RGB")
+        tile = max(1, round(self.tile_size * max(frame.size) / longest))
+        return frame, tile
+
+    def tiles(self, frame: Image.Image, tile: int, input_size: int,
+              batch_size: int) -> Iterator[Tuple[List[np.ndarray], np.ndarray]]:
+        """按批次生成分块图像及其在整图中的区域（百分比坐标 x, y, 宽, 高）"""
+        width, height = frame.size
+        boxes = self.grid(width, height, tile)
+        if self.full_frame and len(boxes) > 1:
+            boxes = np.vstack([boxes, [0, 0, width, height]])
+        regions = np.column_stack([
+            boxes[:, 0] / width, boxes[:, 1] / height,
+            (boxes[:, 2] - boxes[:, 0]) / width, (boxes[:, 3] - boxes[:, 1]) / height
+        ]) * 100
+        for start in range(0, len(boxes), batch_size):
+            batch = [
+                np.asarray(frame.crop(tuple(int(v) for v in box)).resize((input_size, input_size), Image.BILINEAR))
+                for box in boxes[start:start + batch_size]
+            ]
+            yield batch, regions[start:start + batch_size]
+
+    def detect(self, backend: InferenceBackend, frame: Image.Image, tile: int, scene_type: str,
+               key: Optional[str] = None) -> Tuple[Dict, int, int, float]:
+        """
+        分块推理单张图片（key 为图片ID），返回合并后的推理结果 {"confidence", "issues"}、
+        分块数、推理批次数及推理耗时
+        """
+        issues: List[Dict] = []
+        regions: List[np.ndarray] = []
+        confidences = []
+        tiles = batches = 0
+        seconds = 0.0
+        for batch, batch_regions in self.tiles(frame, tile, backend.input_size, backend.batch_size):
+            started = time.perf_counter()
+            keys = [f"{key}#{tiles + index}" for index in range(len(batch))] if key is not None else None
+            results = backend.infer_batch(batch, scene_type, keys=keys)
+            seconds += time.perf_counter() - started
+            tiles += len(batch)
+            batches += 1
+            for result, region in zip(results, batch_regions):
+                confidences.append(result["confidence"])
+                issues += result["issues"]
+                regions += [region] * len(result["issues"])
+
+        merged = self.merge_issues(issues, np.array(regions).reshape(-1, 4))
+        confidence = max(i["confidence"] for i in merged) if merged else min(confidences, default=1.0)
+        return {"confidence": confidence, "issues": merged}, tiles, batches, seconds
+
+    def merge_issues(self, issues: Sequence[Dict], regions: np.ndarray) -> List[Dict]:
+        """将分块百分比坐标的问题框换算到整图并合并重复框"""
+        if not issues:
+            return []
+        local = np.array([[i["bbox"]["x"], i["bbox"]["y"], i["bbox"]["width"], i["bbox"]["height"]]
+                          for i in issues], dtype=np.float64) / 100
+        x1 = regions[:, 0] + local[:, 0] * regions[:, 2]
+        y1 = regions[:, 1] + local[:, 1] * regions[:, 3]
+        boxes = np.column_stack([x1, y1, x1 + local[:, 2] * regions[:, 2], y1 + local[:, 3] * regions[:, 3]])
+        scores = np.array([i["confidence"] for i in issues], dtype=np.float64)
+        _, classes = np.unique([i["type"] for i in issues], return_inverse=True)
+
+        merged = []
+        for keep, others in group_boxes(boxes, scores, classes, self.threshold, self.metric):
+            box, score = boxes[keep], scores[keep]
+            if self.merge == "wbf" and others.size:
+                # 组内各框按置信度加权平均坐标，置信度取组内平均
+                members = np.append(others, keep)
+                weights = scores[members]
+                box = (boxes[members] * weights[:, None]).sum(axis=0) / weights.sum()
+                score = weights.mean()
+            x1, y1, x2, y2 = np.clip(box, 0, 100).tolist()
+            merged.append({
+                **issues[keep],
+                "confidence": round(float(score), 2),
+                "bbox": {"x": round(x1, 1), "y": round(y1, 1),
+                         "width": round(x2 - x1, 1), "height": round(y2 - y1, 1)}
+            })
+        return merged
@@ -4,16 +4,42 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
 import os
 
+from config import UPLOAD_DIR
+from repositories import repository, CachedRepository
+from services.worker_pool import shutdown_process_pool
+from services.detection_writer import detection_writer
+from services.detection_jobs import detection_jobs
+from services.detection_cache import detection_cache
+from services.reclaimer import project_reclaimer
+from services.admission import upload_admission
 from routes import upload, analysis, report, export, credits, advanced, supplementary, user_db as user
 from api import step_snapshots
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时确保数据库结构为最新并打开连接池，退出时释放连接和工作进程"""
+    await repository.open()
+    await detection_writer.start()
+    await detection_jobs.start()
+    await project_reclaimer.start()
+    yield
+    await project_reclaimer.stop()
+    await detection_jobs.stop()
+    await detection_writer.stop()
+    await repository.close()
+    shutdown_process_pool()
+
+
 # 创建FastAPI应用
 app = FastAPI(
     title="智巡 AI巡检平台",
     description="基于AI的无人机巡检图像处理平台",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # CORS配置
@@ -26,7 +52,6 @@ app.add_middleware(
 )
 
 # 确保uploads目录存在
-UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # 静态文件服务
@@ -54,6 +79,19 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/api/metrics")
+async def metrics():
+    """运行指标：检测任务、检测结果缓存、检测结果写入队列、上传准入、读缓存及删除回收状态"""
+    return {
+        "detection_jobs": detection_jobs.stats(),
+        "detection_cache": detection_cache.stats(),
+        "detection_writer": detection_writer.stats(),
+        "upload_admission": upload_admission.stats(),
+        "read_cache": repository.cache.stats() if isinstance(repository, CachedRepository) else None,
+        "reclaimer": project_reclaimer.stats()
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
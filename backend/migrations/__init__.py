@@ -0,0 +1,98 @@
+"""
+数据库迁移
+迁移脚本按版本号顺序存放在本包中（m0001_xxx.py），每个脚本提供 async upgrade(db)，
+已应用的版本记录在 schema_migrations 表，启动时只执行尚未应用的脚本；
+项目分库只存放 images/detection_results/issues，只执行脚本中的 upgrade_project(db)（没有则跳过）
+"""
+import importlib
+import logging
+import pkgutil
+import re
+from typing import List, Tuple
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_PATTERN = re.compile(r"^m(\d{4})_(\w+)$")
+
+
+def load_migrations() -> List[Tuple[int, str, object]]:
+    """按版本号顺序加载迁移脚本，返回 (版本号, 名称, 模块)"""
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        match = MIGRATION_PATTERN.match(module_info.name)
+        if not match:
+            continue
+        module = importlib.import_module(f"{__name__}.{module_info.name}")
+        migrations.append((int(match.group(1)), match.group(2), module))
+    migrations.sort(key=lambda item: item[0])
+
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"迁移脚本版本号重复: {versions}")
+    return migrations
+
+
+async def get_applied_versions(db) -> set:
+    """已应用的迁移版本"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await db.commit()
+    cursor = await db.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in await cursor.fetchall()}
+
+
+async def run_migrations(db, project_scope: bool = False) -> List[int]:
+    """
+    执行尚未应用的迁移，每个脚本在独立事务中执行，返回本次应用的版本号
+    project_scope=True 时（项目分库）只执行项目数据部分，没有该部分的脚本也记录为已应用
+    """
+    applied = await get_applied_versions(db)
+    newly_applied = []
+
+    for version, name, module in load_migrations():
+        if version in applied:
+            continue
+        await db.execute("BEGIN")
+        try:
+            if not project_scope:
+                await module.upgrade(db)
+            elif hasattr(module, "upgrade_project"):
+                await module.upgrade_project(db)
+            await db.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (?, ?)",
+                (version, name)
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            # 继续抛出，迁移未完成时应用不启动
+            logger.exception("数据库迁移失败: m%04d_%s", version, name)
+            raise
+        newly_applied.append(version)
+
+    return newly_applied
+
+
+async def migrate(db_path: str, project_scope: bool = False) -> List[int]:
+    """对指定数据库文件执行迁移"""
+    async with aiosqlite.connect(db_path) as db:
+        return await run_migrations(db, project_scope)
+
+
+async def table_columns(db, table: str) -> set:
+    """表的现有列名（表不存在时为空）"""
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in await cursor.fetchall()}
+
+
+async def ensure_column(db, table: str, column: str, definition: str):
+    """为已存在的表补充缺失的列"""
+    if column not in await table_columns(db, table):
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
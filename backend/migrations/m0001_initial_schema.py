@@ -0,0 +1,145 @@
+"""
+初始表结构：项目、图片、检测结果、问题及断点续传会话
+对迁移系统引入前创建的旧库补充后续新增的列
+"""
+from migrations import ensure_column
+
+
+async def upgrade(db):
+    # 项目表
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS projects (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            location TEXT,
+            inspection_date TEXT,
+            inspector TEXT,
+            company TEXT,
+            scene_type TEXT,
+            template_id TEXT,
+            scene_confidence REAL,
+            status TEXT DEFAULT 'uploading',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await ensure_column(db, "projects", "scene_confidence", "REAL")
+
+    await upgrade_project(db)
+
+    # 断点续传会话表
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            project_id TEXT,
+            original_name TEXT,
+            total_size INTEGER,
+            chunk_size INTEGER,
+            total_chunks INTEGER,
+            sha256 TEXT,
+            status TEXT DEFAULT 'uploading',
+            image_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (project_id) REFERENCES projects(id)
+        )
+    """)
+    
+    # 断点续传已接收分块表
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS upload_session_chunks (
+            session_id TEXT,
+            chunk_index INTEGER,
+            offset INTEGER,
+            size INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (session_id, chunk_index),
+            FOREIGN KEY (session_id) REFERENCES upload_sessions(id)
+        )
+    """)
+
+
+async def upgrade_project(db):
+    """项目数据表（主库及项目分库）"""
+    # 图片表
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS images (
+            id TEXT PRIMARY KEY,
+            project_id TEXT,
+            filename TEXT,
+            original_name TEXT,
+            file_path TEXT,
+            file_size INTEGER,
+            width INTEGER,
+            height INTEGER,
+            gps_lat REAL,
+            gps_lng REAL,
+            captured_at TEXT,
+            sha256 TEXT,
+            thumbnail_sizes TEXT,
+            gps_alt REAL,
+            relative_altitude REAL,
+            gimbal_pitch REAL,
+            gimbal_yaw REAL,
+            gimbal_roll REAL,
+            focal_length REAL,
+            camera_make TEXT,
+            camera_model TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (project_id) REFERENCES projects(id)
+        )
+    """)
+    
+    # 旧库补充新增列
+    await ensure_column(db, "images", "sha256", "TEXT")
+    await ensure_column(db, "images", "thumbnail_sizes", "TEXT")
+    for column, definition in (
+        ("gps_alt", "REAL"), ("relative_altitude", "REAL"),
+        ("gimbal_pitch", "REAL"), ("gimbal_yaw", "REAL"), ("gimbal_roll", "REAL"),
+        ("focal_length", "REAL"), ("camera_make", "TEXT"), ("camera_model", "TEXT")
+    ):
+        await ensure_column(db, "images", column, definition)
+    await ensure_column(db, "images", "status", "TEXT DEFAULT 'pending'")
+    
+    # 项目图片按拍摄时间排序、按经纬度范围筛选
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_images_project_captured ON images(project_id, captured_at)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_images_project_gps ON images(project_id, gps_lat, gps_lng)"
+    )
+    
+    # 检测结果表
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS detection_results (
+            id TEXT PRIMARY KEY,
+            image_id TEXT,
+            project_id TEXT,
+            confidence REAL,
+            status TEXT,
+            suggestion TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (image_id) REFERENCES images(id),
+            FOREIGN KEY (project_id) REFERENCES projects(id)
+        )
+    """)
+    
+    # 问题/缺陷表
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS issues (
+            id TEXT PRIMARY KEY,
+            detection_id TEXT,
+            issue_type TEXT,
+            name TEXT,
+            severity TEXT,
+            description TEXT,
+            confidence REAL,
+            bbox_x REAL,
+            bbox_y REAL,
+            bbox_width REAL,
+            bbox_height REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (detection_id) REFERENCES detection_results(id)
+        )
+    """)
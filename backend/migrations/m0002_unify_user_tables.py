@@ -0,0 +1,116 @@
+"""
+统一用户、积分历史及步骤快照表结构
+database.py 与 database_credits.py 曾各自创建过不同结构的同名表，
+以路由实际使用的结构为准：users/credit_history 取积分版本，step_snapshots 取快照API版本，
+旧结构的库补齐列或重建表并迁移数据
+"""
+from migrations import ensure_column, table_columns
+
+
+async def upgrade(db):
+    # 用户表
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            avatar TEXT,
+            join_date TEXT NOT NULL,
+            total_projects INTEGER DEFAULT 0,
+            total_reports INTEGER DEFAULT 0,
+            last_login TEXT,
+            credits_balance INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # 旧版用户表（username/credits）补齐列并迁移数据
+    columns = await table_columns(db, "users")
+    if "credits_balance" not in columns:
+        for column, definition in (
+            ("name", "TEXT"), ("avatar", "TEXT"), ("join_date", "TEXT"),
+            ("total_projects", "INTEGER DEFAULT 0"), ("total_reports", "INTEGER DEFAULT 0"),
+            ("last_login", "TEXT"), ("credits_balance", "INTEGER DEFAULT 0")
+        ):
+            await ensure_column(db, "users", column, definition)
+        await db.execute("""
+            UPDATE users SET
+                name = COALESCE(name, username),
+                join_date = COALESCE(join_date, DATE(created_at)),
+                credits_balance = COALESCE(credits, 0)
+        """)
+
+    # 积分历史表
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS credit_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL CHECK (type IN ('earn', 'spend')),
+            amount INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            balance_before INTEGER NOT NULL,
+            balance_after INTEGER NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+
+    # 旧版积分历史表（description）补齐列并迁移数据
+    columns = await table_columns(db, "credit_history")
+    if "reason" not in columns:
+        for column, definition in (
+            ("reason", "TEXT"), ("balance_before", "INTEGER DEFAULT 0"),
+            ("balance_after", "INTEGER DEFAULT 0"), ("timestamp", "TIMESTAMP")
+        ):
+            await ensure_column(db, "credit_history", column, definition)
+        await db.execute("""
+            UPDATE credit_history SET
+                reason = COALESCE(reason, description, ''),
+                timestamp = COALESCE(timestamp, created_at)
+        """)
+
+    # 步骤快照表
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS step_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            step_index INTEGER NOT NULL CHECK(step_index >= 0 AND step_index <= 5),
+            step_route TEXT NOT NULL,
+            snapshot_data TEXT NOT NULL,
+            name TEXT,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+
+    # 旧版快照表（step/step_name/data）重建为新结构
+    columns = await table_columns(db, "step_snapshots")
+    if "step_index" not in columns:
+        await db.execute("DROP INDEX IF EXISTS idx_step_snapshots_user_id")
+        await db.execute("DROP INDEX IF EXISTS idx_step_snapshots_timestamp")
+        await db.execute("ALTER TABLE step_snapshots RENAME TO step_snapshots_legacy")
+        await db.execute("""
+            CREATE TABLE step_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                step_index INTEGER NOT NULL CHECK(step_index >= 0 AND step_index <= 5),
+                step_route TEXT NOT NULL,
+                snapshot_data TEXT NOT NULL,
+                name TEXT,
+                description TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        """)
+        await db.execute("""
+            INSERT INTO step_snapshots (id, user_id, step_index, step_route, snapshot_data, name, description, created_at)
+            SELECT id, user_id, MIN(MAX(step, 0), 5), '', COALESCE(data, '{}'), step_name, template_name,
+                   COALESCE(timestamp, created_at)
+            FROM step_snapshots_legacy
+        """)
+        await db.execute("DROP TABLE step_snapshots_legacy")
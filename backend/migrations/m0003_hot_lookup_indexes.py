@@ -0,0 +1,46 @@
+"""
+热点查询索引
+按项目、图片、检测结果及用户查找的列建立索引，统计类查询使用覆盖索引避免回表
+"""
+
+
+async def upgrade(db):
+    await upgrade_project(db)
+
+    # 用户积分历史按时间倒序分页
+    await db.execute("DROP INDEX IF EXISTS idx_credit_history_user_id")
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_credit_history_user_timestamp ON credit_history(user_id, timestamp DESC)"
+    )
+
+    # 用户快照列表（按创建时间倒序）及按步骤覆盖旧快照
+    await db.execute("DROP INDEX IF EXISTS idx_step_snapshots_user_id")
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_step_snapshots_user_created ON step_snapshots(user_id, created_at DESC)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_step_snapshots_user_step ON step_snapshots(user_id, step_index)"
+    )
+
+
+async def upgrade_project(db):
+    """项目图片、检测结果及问题的索引（主库及项目分库）"""
+    # 项目图片列表及按状态计数（增量分析）
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_images_project_status ON images(project_id, status)"
+    )
+
+    # 项目检测结果及统计（状态计数、平均置信度）
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_detection_results_project ON detection_results(project_id, status, confidence)"
+    )
+
+    # 按图片查找检测结果（增量检测、结果更新）
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_detection_results_image ON detection_results(image_id)"
+    )
+
+    # 每条检测结果的问题列表
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_issues_detection ON issues(detection_id)"
+    )
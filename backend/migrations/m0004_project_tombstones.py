@@ -0,0 +1,14 @@
+"""
+项目删除标记
+删除项目时只写入 deleted_at，文件及数据由后台回收任务分批清理
+"""
+from migrations import ensure_column
+
+
+async def upgrade(db):
+    await ensure_column(db, "projects", "deleted_at", "TIMESTAMP")
+
+    # 回收任务按删除时间取待回收项目，部分索引只包含已删除的项目
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_projects_deleted ON projects(deleted_at) WHERE deleted_at IS NOT NULL"
+    )
@@ -0,0 +1,44 @@
+"""
+检测任务
+检测以任务方式在后台执行，按图片ID顺序处理并记录已处理到的图片（last_image_id），
+重启后从该位置继续
+"""
+
+
+async def upgrade(db):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS detection_jobs (
+            id TEXT PRIMARY KEY,
+            project_id TEXT NOT NULL,
+            scene_type TEXT,
+            force INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'queued',
+            total_images INTEGER DEFAULT 0,
+            processed_images INTEGER DEFAULT 0,
+            last_image_id TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+
+    # 启动时恢复未完成的任务
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_detection_jobs_status ON detection_jobs(status, created_at)"
+    )
+
+    # 项目的检测任务
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_detection_jobs_project ON detection_jobs(project_id, created_at DESC)"
+    )
+
+    await upgrade_project(db)
+
+
+async def upgrade_project(db):
+    """按图片ID顺序分批取待检测图片（主库及项目分库）"""
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_images_project_id ON images(project_id, id)"
+    )
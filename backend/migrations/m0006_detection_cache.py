@@ -0,0 +1,22 @@
+"""
+检测结果缓存
+推理结果按（图片SHA-256、模型版本、场景类型、推理参数）组成的键缓存，size 为结果文本的字节数，
+超出容量时按 last_used_at 淘汰最久未使用的条目
+"""
+
+
+async def upgrade(db):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS detection_cache (
+            key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # 淘汰最久未使用的条目
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_detection_cache_last_used ON detection_cache(last_used_at)"
+    )
@@ -0,0 +1,46 @@
+"""
+检测任务单飞、执行租约与问题记录清理
+每个项目同时最多一个未完成（排队中或执行中）的检测任务，由部分唯一索引保证，
+重复提交的检测请求返回已有任务；执行中的任务记录执行者及租约到期时间，
+执行者定期续约，租约过期的任务可由其他进程接手；早期版本重新检测时未删除旧的问题记录，在此一并清理
+"""
+from migrations import ensure_column
+
+
+async def upgrade(db):
+    # 已存在多个未完成任务的项目只保留最早的一个
+    await db.execute("""
+        UPDATE detection_jobs
+        SET status = 'cancelled', error = '重复的检测任务', finished_at = CURRENT_TIMESTAMP
+        WHERE status IN ('queued', 'running')
+          AND EXISTS (
+              SELECT 1 FROM detection_jobs earlier
+              WHERE earlier.project_id = detection_jobs.project_id
+                AND earlier.status IN ('queued', 'running')
+                AND (earlier.created_at < detection_jobs.created_at
+                     OR (earlier.created_at = detection_jobs.created_at AND earlier.id < detection_jobs.id))
+          )
+    """)
+    await db.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_detection_jobs_active
+        ON detection_jobs(project_id) WHERE status IN ('queued', 'running')
+    """)
+
+    await ensure_column(db, "detection_jobs", "owner", "TEXT")
+    await ensure_column(db, "detection_jobs", "lease_expires_at", "TIMESTAMP")
+
+    await upgrade_project(db)
+
+
+async def upgrade_project(db):
+    """清理问题记录（主库及项目分库）"""
+    # 检测结果已不存在的问题记录
+    await db.execute("""
+        DELETE FROM issues
+        WHERE NOT EXISTS (SELECT 1 FROM detection_results dr WHERE dr.id = issues.detection_id)
+    """)
+    # 重新检测前写入的旧问题记录（检测结果被替换时创建时间随之更新）
+    await db.execute("""
+        DELETE FROM issues
+        WHERE created_at < (SELECT dr.created_at FROM detection_results dr WHERE dr.id = issues.detection_id)
+    """)
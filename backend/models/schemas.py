@@ -28,6 +28,14 @@ class UploadResponse(BaseModel):
     total_size: int
 
 
+class UploadSessionCreate(BaseModel):
+    filename: str
+    total_size: int
+    chunk_size: int = 8 * 1024 * 1024
+    project_id: Optional[str] = None  # 为空时创建新项目，续传时传入已有项目
+    sha256: Optional[str] = None  # 可选，完成时校验整个文件
+
+
 # ============ 场景分析相关 ============
 
 class Algorithm(BaseModel):
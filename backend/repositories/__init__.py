@@ -0,0 +1,33 @@
+"""
+数据访问层
+按 DATABASE_BACKEND 配置选择 SQLite 或 PostgreSQL 实现，路由统一通过 repository 读写数据；
+启用 READ_CACHE 时外层包装读缓存
+"""
+from config import (
+    DATABASE_BACKEND, DATABASE_URL, DB_PG_POOL_MIN_SIZE, DB_PG_POOL_MAX_SIZE,
+    READ_CACHE_ENABLED, READ_CACHE_TTL, READ_CACHE_MAX_ENTRIES
+)
+from repositories.base import Repository, PROJECT_FIELDS
+from repositories.cached import CachedRepository
+from services.cache import TTLCache
+
+
+def create_repository(backend: str = DATABASE_BACKEND, dsn: str = DATABASE_URL) -> Repository:
+    """创建指定后端的仓储"""
+    if backend == "sqlite":
+        from repositories.sqlite import SQLiteRepository
+        return SQLiteRepository()
+    if backend in ("postgres", "postgresql"):
+        if not dsn:
+            raise RuntimeError("PostgreSQL 后端需要配置 DATABASE_URL")
+        from repositories.postgres import PostgresRepository
+        return PostgresRepository(dsn, min_size=DB_PG_POOL_MIN_SIZE, max_size=DB_PG_POOL_MAX_SIZE)
+    raise RuntimeError(f"不支持的数据库后端: {backend}")
+
+
+# 全局仓储实例
+repository = create_repository()
+if READ_CACHE_ENABLED:
+    repository = CachedRepository(repository, TTLCache(READ_CACHE_MAX_ENTRIES, READ_CACHE_TTL))
+
+__all__ = ["Repository", "CachedRepository", "PROJECT_FIELDS", "create_repository", "repository"]
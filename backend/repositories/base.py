@@ -0,0 +1,307 @@
+"""
+数据访问接口
+项目、图片、检测结果、问题、续传会话、积分及步骤快照的全部读写都经由仓储完成，
+路由层不直接拼写SQL；各数据库后端实现同一组方法，返回普通字典
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence
+
+# 允许通过 update_project 修改的项目字段
+PROJECT_FIELDS = (
+    "name", "location", "inspection_date", "inspector", "company",
+    "scene_type", "scene_confidence", "template_id", "status"
+)
+
+# 允许通过 update_detection_job 修改的检测任务字段
+DETECTION_JOB_FIELDS = ("status", "processed_images", "last_image_id", "error")
+
+# 检测任务的结束状态
+DETECTION_JOB_FINISHED = ("completed", "failed", "cancelled")
+
+
+class Repository(ABC):
+    """仓储基类"""
+
+    async def open(self):
+        """建立连接并确保表结构为最新"""
+
+    async def close(self):
+        """释放连接"""
+
+    # ============ 项目 ============
+
+    @abstractmethod
+    async def create_project(self, project_id: str, status: str, images: Optional[List[dict]] = None):
+        """创建项目，可同时写入首批图片；中途失败不会留下缺少图片的项目记录"""
+
+    @abstractmethod
+    async def get_project(self, project_id: str) -> Optional[dict]:
+        """获取项目，不存在时返回 None"""
+
+    @abstractmethod
+    async def update_project(self, project_id: str, **fields) -> bool:
+        """更新项目字段（见 PROJECT_FIELDS）及更新时间，返回项目是否存在"""
+
+    @abstractmethod
+    async def advance_project_status(self, project_id: str, status: str, expected: str) -> bool:
+        """仅当项目处于 expected 状态时更新为 status"""
+
+    @abstractmethod
+    async def delete_project(self, project_id: str):
+        """删除项目及其图片、检测结果和问题"""
+
+    # ============ 删除回收 ============
+
+    @abstractmethod
+    async def mark_project_deleted(self, project_id: str) -> bool:
+        """
+        标记项目已删除（之后 get_project 返回 None），数据由回收任务清理
+        返回是否新标记（项目不存在或已标记时为 False）
+        """
+
+    @abstractmethod
+    async def list_deleted_projects(self, limit: int) -> List[str]:
+        """已标记删除、等待回收的项目ID（按删除时间先后）"""
+
+    @abstractmethod
+    async def purge_project_images(self, project_id: str, limit: int) -> int:
+        """
+        删除项目的一批图片及其检测结果和问题，返回删除的图片数（为 0 时已清理完）
+        项目数据位于独立分库时直接返回 0，由 delete_project 删除整个分库
+        """
+
+    @abstractmethod
+    async def find_missing_projects(self, project_ids: List[str]) -> List[str]:
+        """给定ID中没有项目记录的ID（已标记删除的项目视为存在）"""
+
+    @abstractmethod
+    async def list_orphan_projects(self, before: str, limit: int) -> List[str]:
+        """
+        需要回收的孤儿数据：有图片或检测结果但没有项目记录、且 before（UTC时间文本）之后
+        没有再写入数据的项目ID，以及 before 之前创建、上传未完成且没有任何图片的项目
+        """
+
+    # ============ 图片 ============
+
+    @abstractmethod
+    async def add_images(self, project_id: str, images: List[dict]):
+        """向已有项目追加图片并更新项目的更新时间"""
+
+    @abstractmethod
+    async def list_images(self, project_id: str) -> List[dict]:
+        """项目的全部图片；项目不存在或已标记删除时为空"""
+
+    @abstractmethod
+    async def get_image(self, project_id: str, image_id: str) -> Optional[dict]:
+        """获取单张图片；图片或项目不存在、项目已标记删除时返回 None"""
+
+    @abstractmethod
+    async def count_images(self, project_id: str) -> Dict[str, int]:
+        """图片总数及待处理（pending）图片数：{"count", "pending_count"}"""
+
+    @abstractmethod
+    async def set_images_status(self, project_id: str, status: str, from_status: str) -> int:
+        """将项目中处于 from_status 的图片更新为 status，返回更新数量"""
+
+    @abstractmethod
+    async def list_images_to_detect(self, project_id: str, force: bool = False,
+                                    after: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        """
+        待检测的图片（按图片ID排序）：默认只返回尚无检测结果的图片，force=True 返回全部
+        after/limit 用于分批读取：只返回ID大于 after 的前 limit 张
+        """
+
+    @abstractmethod
+    async def count_images_to_detect(self, project_id: str, force: bool = False) -> int:
+        """待检测的图片数（范围同 list_images_to_detect）"""
+
+    # ============ 检测结果与问题 ============
+
+    @abstractmethod
+    async def save_detections(self, project_id: str, detections: List[dict]):
+        """在一个事务中保存检测结果（替换已有结果的问题）并将图片标记为已检测"""
+
+    async def save_detection_batches(self, batches: Dict[str, List[dict]]):
+        """
+        保存多个项目的检测结果（项目ID -> 检测结果列表）
+        默认逐个项目保存，各后端可合并为更少的事务
+        """
+        for project_id, detections in batches.items():
+            await self.save_detections(project_id, detections)
+
+    async def group_detection_batches(self, project_ids: Sequence[str]) -> List[List[str]]:
+        """
+        按写入的数据库对项目分组，同组项目的检测结果可由 save_detection_batches 在一个事务中写入
+        默认每个项目单独一组
+        """
+        return [[project_id] for project_id in project_ids]
+
+    @abstractmethod
+    async def list_detections(self, project_id: str) -> List[dict]:
+        """项目的检测结果（含图片文件信息），每条带 issues 列表"""
+
+    @abstractmethod
+    async def list_detections_page(self, project_id: str, after: Optional[str], limit: int) -> List[dict]:
+        """按图片ID分页的检测结果（格式同 list_detections），只返回图片ID大于 after 的前 limit 条"""
+
+    @abstractmethod
+    async def update_detection(self, project_id: str, image_id: str, status: str,
+                               suggestion: str, issues: List[dict]) -> bool:
+        """替换单张图片的检测问题及结论，检测结果不存在时返回 False"""
+
+    @abstractmethod
+    async def get_statistics(self, project_id: str) -> dict:
+        """项目统计：图片数、已检测数、各状态数量、问题总数、平均置信度"""
+
+    # ============ 检测任务 ============
+
+    @abstractmethod
+    async def create_detection_job(self, job_id: str, project_id: str, scene_type: str,
+                                   force: bool, total_images: int) -> dict:
+        """
+        创建排队中（queued）的检测任务并返回新记录；
+        项目已有未完成的任务时不创建，返回已有任务（调用方按 id 区分）
+        """
+
+    @abstractmethod
+    async def get_detection_job(self, job_id: str) -> Optional[dict]:
+        """获取检测任务，不存在时返回 None"""
+
+    @abstractmethod
+    async def get_active_detection_job(self, project_id: str) -> Optional[dict]:
+        """项目未完成（排队中或执行中）的检测任务，没有时返回 None"""
+
+    @abstractmethod
+    async def list_detection_jobs(self, statuses: Sequence[str], limit: int) -> List[dict]:
+        """处于指定状态的检测任务（按创建时间先后）"""
+
+    @abstractmethod
+    async def list_claimable_detection_jobs(self, limit: int) -> List[dict]:
+        """可领取的检测任务：排队中，或执行中但租约已过期（按创建时间先后）"""
+
+    @abstractmethod
+    async def claim_detection_job(self, job_id: str, owner: str, lease_seconds: int) -> Optional[dict]:
+        """
+        领取检测任务：仅当任务排队中，或执行中但租约已过期时，将其置为执行中并记录执行者及租约到期时间，
+        返回领取后的任务；任务由其他执行者持有或已结束时返回 None
+        """
+
+    @abstractmethod
+    async def renew_detection_job(self, job_id: str, owner: str, lease_seconds: int) -> bool:
+        """
+        延长执行中任务的租约（lease_seconds 为 0 时立即释放），
+        任务已不由 owner 执行（已结束或被其他执行者接手）时返回 False
+        """
+
+    @abstractmethod
+    async def update_detection_job(self, job_id: str, expected: Optional[Sequence[str]] = None,
+                                   owner: Optional[str] = None, **fields) -> bool:
+        """
+        更新检测任务字段（见 DETECTION_JOB_FIELDS）及更新时间；
+        状态变为 running 时记录开始时间，变为结束状态时记录结束时间。
+        传入 expected 时仅当任务处于其中某个状态才更新，传入 owner 时仅当任务由其执行才更新，返回是否更新；
+        恢复为未完成状态时若项目已有其他未完成任务则不更新
+        """
+
+    # ============ 检测结果缓存 ============
+
+    @abstractmethod
+    async def get_cached_results(self, keys: Sequence[str]) -> Dict[str, str]:
+        """按缓存键取推理结果（JSON文本），命中的条目更新最近使用时间"""
+
+    @abstractmethod
+    async def save_cached_results(self, entries: Dict[str, str]):
+        """写入推理结果（缓存键 -> JSON文本），已存在的键覆盖"""
+
+    @abstractmethod
+    async def get_cache_usage(self) -> Dict[str, int]:
+        """缓存条目数及结果总字节数：{"entries", "bytes"}"""
+
+    @abstractmethod
+    async def evict_cached_results(self, max_bytes: int, batch_size: int) -> Dict[str, int]:
+        """
+        按最近使用时间从旧到新每次取 batch_size 条淘汰，直到总字节数不超过 max_bytes
+        返回淘汰条数及剩余字节数：{"evicted", "bytes"}
+        """
+
+    # ============ 断点续传会话 ============
+
+    @abstractmethod
+    async def create_upload_session(self, session: dict):
+        """创建续传会话"""
+
+    @abstractmethod
+    async def get_upload_session(self, session_id: str) -> Optional[dict]:
+        """获取续传会话"""
+
+    @abstractmethod
+    async def list_received_chunks(self, session_id: str) -> List[int]:
+        """已接收的分块序号（升序）"""
+
+    @abstractmethod
+    async def record_chunk(self, session_id: str, chunk_index: int, offset: int, size: int):
+        """记录已接收的分块（重复上传时覆盖）"""
+
+    @abstractmethod
+    async def advance_upload_session_status(self, session_id: str, status: str, expected: str) -> bool:
+        """仅当会话处于 expected 状态时更新状态，返回是否更新（并发请求中只有一个成功）"""
+
+    @abstractmethod
+    async def complete_upload_session(self, session_id: str, project_id: str, image: dict):
+        """写入会话对应的图片并将会话标记为已完成；失败时两者都不生效，可以重试"""
+
+    @abstractmethod
+    async def abort_upload_session(self, session_id: str):
+        """将会话标记为已取消并清除分块记录"""
+
+    # ============ 用户与积分 ============
+
+    @abstractmethod
+    async def create_user(self, name: str, email: str, join_date: str, credits_balance: int = 0) -> dict:
+        """创建用户并返回新记录"""
+
+    @abstractmethod
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        """获取用户，不存在时返回 None"""
+
+    @abstractmethod
+    async def change_credits(self, user_id: int, record_type: str, amount: int, reason: str,
+                             balance_before: int, balance_after: int,
+                             require_balance: int = 0, timestamp: Optional[str] = None) -> Optional[bool]:
+        """
+        在一个事务中记录积分变动并更新余额
+        用户不存在返回 None；当前余额低于 require_balance 时不做修改并返回 False
+        """
+
+    @abstractmethod
+    async def list_credit_history(self, user_id: int, limit: int, offset: int = 0) -> List[dict]:
+        """积分历史（按时间倒序）"""
+
+    @abstractmethod
+    async def count_credit_history(self, user_id: int) -> int:
+        """积分历史记录数"""
+
+    # ============ 步骤快照 ============
+
+    @abstractmethod
+    async def create_snapshot(self, user_id: int, step_index: int, step_route: str, snapshot_data: str,
+                              name: Optional[str] = None, description: Optional[str] = None,
+                              updated_at: Optional[str] = None, replace_step: bool = False,
+                              max_per_user: Optional[int] = None) -> dict:
+        """
+        保存快照并返回新记录
+        replace_step=True 时先删除该用户同一步骤的旧快照；
+        max_per_user 限制每个用户的快照数，超出时删除最早的快照
+        """
+
+    @abstractmethod
+    async def list_snapshots(self, user_id: int, limit: Optional[int] = None) -> List[dict]:
+        """用户的快照（按创建时间倒序）"""
+
+    @abstractmethod
+    async def get_snapshot(self, user_id: int, snapshot_id: int) -> Optional[dict]:
+        """获取用户的单个快照"""
+
+    @abstractmethod
+    async def delete_snapshot(self, user_id: int, snapshot_id: int) -> bool:
+        """删除快照，返回是否存在"""
@@ -0,0 +1,256 @@
+"""
+带读缓存的仓储
+项目记录、图片列表和检测结果是多数接口的入口查询，命中时不访问数据库；
+经由本仓储的写入会失效对应项目的缓存键。多进程部署时其他进程的写入
+最多在 READ_CACHE_TTL 秒后可见
+"""
+from typing import Dict, List, Optional, Sequence
+
+from repositories.base import Repository
+from services.cache import TTLCache
+
+
+class CachedRepository(Repository):
+    """
+    在内部仓储之外增加读缓存
+    缓存的字典与列表在调用方之间共享，调用方不得修改
+    """
+
+    def __init__(self, inner: Repository, cache: TTLCache):
+        self.inner = inner
+        self.cache = cache
+
+    def _invalidate(self, project_id: str, *kinds: str):
+        self.cache.invalidate(*((kind, project_id) for kind in kinds))
+
+    async def open(self):
+        await self.inner.open()
+
+    async def close(self):
+        self.cache.clear()
+        await self.inner.close()
+
+    # ============ 项目 ============
+
+    async def create_project(self, project_id: str, status: str, images: Optional[List[dict]] = None):
+        await self.inner.create_project(project_id, status, images)
+        self._invalidate(project_id, "project", "images")
+
+    async def get_project(self, project_id: str) -> Optional[dict]:
+        return await self.cache.get_or_load(("project", project_id),
+                                            lambda: self.inner.get_project(project_id))
+
+    async def update_project(self, project_id: str, **fields) -> bool:
+        try:
+            return await self.inner.update_project(project_id, **fields)
+        finally:
+            self._invalidate(project_id, "project")
+
+    async def advance_project_status(self, project_id: str, status: str, expected: str) -> bool:
+        try:
+            return await self.inner.advance_project_status(project_id, status, expected)
+        finally:
+            self._invalidate(project_id, "project")
+
+    async def delete_project(self, project_id: str):
+        try:
+            await self.inner.delete_project(project_id)
+        finally:
+            self._invalidate(project_id, "project", "images", "detections")
+
+    # ============ 删除回收 ============
+
+    async def mark_project_deleted(self, project_id: str) -> bool:
+        try:
+            return await self.inner.mark_project_deleted(project_id)
+        finally:
+            self._invalidate(project_id, "project", "images", "detections")
+
+    async def list_deleted_projects(self, limit: int) -> List[str]:
+        return await self.inner.list_deleted_projects(limit)
+
+    async def purge_project_images(self, project_id: str, limit: int) -> int:
+        try:
+            return await self.inner.purge_project_images(project_id, limit)
+        finally:
+            self._invalidate(project_id, "images", "detections")
+
+    async def find_missing_projects(self, project_ids: List[str]) -> List[str]:
+        return await self.inner.find_missing_projects(project_ids)
+
+    async def list_orphan_projects(self, before: str, limit: int) -> List[str]:
+        return await self.inner.list_orphan_projects(before, limit)
+
+    # ============ 图片 ============
+
+    async def add_images(self, project_id: str, images: List[dict]):
+        try:
+            await self.inner.add_images(project_id, images)
+        finally:
+            self._invalidate(project_id, "project", "images")
+
+    async def list_images(self, project_id: str) -> List[dict]:
+        return await self.cache.get_or_load(("images", project_id),
+                                            lambda: self.inner.list_images(project_id))
+
+    async def get_image(self, project_id: str, image_id: str) -> Optional[dict]:
+        return await self.inner.get_image(project_id, image_id)
+
+    async def count_images(self, project_id: str) -> Dict[str, int]:
+        return await self.inner.count_images(project_id)
+
+    async def set_images_status(self, project_id: str, status: str, from_status: str) -> int:
+        try:
+            return await self.inner.set_images_status(project_id, status, from_status)
+        finally:
+            self._invalidate(project_id, "images")
+
+    async def list_images_to_detect(self, project_id: str, force: bool = False,
+                                    after: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        return await self.inner.list_images_to_detect(project_id, force, after=after, limit=limit)
+
+    async def count_images_to_detect(self, project_id: str, force: bool = False) -> int:
+        return await self.inner.count_images_to_detect(project_id, force)
+
+    # ============ 检测结果与问题 ============
+
+    async def save_detections(self, project_id: str, detections: List[dict]):
+        try:
+            await self.inner.save_detections(project_id, detections)
+        finally:
+            self._invalidate(project_id, "images", "detections")
+
+    async def save_detection_batches(self, batches: Dict[str, List[dict]]):
+        try:
+            await self.inner.save_detection_batches(batches)
+        finally:
+            for project_id in batches:
+                self._invalidate(project_id, "images", "detections")
+
+    async def group_detection_batches(self, project_ids: Sequence[str]) -> List[List[str]]:
+        return await self.inner.group_detection_batches(project_ids)
+
+    async def list_detections(self, project_id: str) -> List[dict]:
+        return await self.cache.get_or_load(("detections", project_id),
+                                            lambda: self.inner.list_detections(project_id))
+
+    async def list_detections_page(self, project_id: str, after: Optional[str], limit: int) -> List[dict]:
+        return await self.inner.list_detections_page(project_id, after, limit)
+
+    async def update_detection(self, project_id: str, image_id: str, status: str,
+                               suggestion: str, issues: List[dict]) -> bool:
+        try:
+            return await self.inner.update_detection(project_id, image_id, status, suggestion, issues)
+        finally:
+            self._invalidate(project_id, "detections")
+
+    async def get_statistics(self, project_id: str) -> dict:
+        return await self.inner.get_statistics(project_id)
+
+    # ============ 检测任务 ============
+
+    async def create_detection_job(self, job_id: str, project_id: str, scene_type: str,
+                                   force: bool, total_images: int) -> dict:
+        return await self.inner.create_detection_job(job_id, project_id, scene_type, force, total_images)
+
+    async def get_detection_job(self, job_id: str) -> Optional[dict]:
+        return await self.inner.get_detection_job(job_id)
+
+    async def get_active_detection_job(self, project_id: str) -> Optional[dict]:
+        return await self.inner.get_active_detection_job(project_id)
+
+    async def list_detection_jobs(self, statuses: Sequence[str], limit: int) -> List[dict]:
+        return await self.inner.list_detection_jobs(statuses, limit)
+
+    async def list_claimable_detection_jobs(self, limit: int) -> List[dict]:
+        return await self.inner.list_claimable_detection_jobs(limit)
+
+    async def claim_detection_job(self, job_id: str, owner: str, lease_seconds: int) -> Optional[dict]:
+        return await self.inner.claim_detection_job(job_id, owner, lease_seconds)
+
+    async def renew_detection_job(self, job_id: str, owner: str, lease_seconds: int) -> bool:
+        return await self.inner.renew_detection_job(job_id, owner, lease_seconds)
+
+    async def update_detection_job(self, job_id: str, expected: Optional[Sequence[str]] = None,
+                                   owner: Optional[str] = None, **fields) -> bool:
+        return await self.inner.update_detection_job(job_id, expected, owner, **fields)
+
+    # ============ 检测结果缓存 ============
+
+    async def get_cached_results(self, keys: Sequence[str]) -> Dict[str, str]:
+        return await self.inner.get_cached_results(keys)
+
+    async def save_cached_results(self, entries: Dict[str, str]):
+        await self.inner.save_cached_results(entries)
+
+    async def get_cache_usage(self) -> Dict[str, int]:
+        return await self.inner.get_cache_usage()
+
+    async def evict_cached_results(self, max_bytes: int, batch_size: int) -> Dict[str, int]:
+        return await self.inner.evict_cached_results(max_bytes, batch_size)
+
+    # ============ 断点续传会话 ============
+
+    async def create_upload_session(self, session: dict):
+        await self.inner.create_upload_session(session)
+
+    async def get_upload_session(self, session_id: str) -> Optional[dict]:
+        return await self.inner.get_upload_session(session_id)
+
+    async def list_received_chunks(self, session_id: str) -> List[int]:
+        return await self.inner.list_received_chunks(session_id)
+
+    async def record_chunk(self, session_id: str, chunk_index: int, offset: int, size: int):
+        await self.inner.record_chunk(session_id, chunk_index, offset, size)
+
+    async def advance_upload_session_status(self, session_id: str, status: str, expected: str) -> bool:
+        return await self.inner.advance_upload_session_status(session_id, status, expected)
+
+    async def complete_upload_session(self, session_id: str, project_id: str, image: dict):
+        try:
+            await self.inner.complete_upload_session(session_id, project_id, image)
+        finally:
+            self._invalidate(project_id, "project", "images")
+
+    async def abort_upload_session(self, session_id: str):
+        await self.inner.abort_upload_session(session_id)
+
+    # ============ 用户与积分 ============
+
+    async def create_user(self, name: str, email: str, join_date: str, credits_balance: int = 0) -> dict:
+        return await self.inner.create_user(name, email, join_date, credits_balance)
+
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        return await self.inner.get_user(user_id)
+
+    async def change_credits(self, user_id: int, record_type: str, amount: int, reason: str,
+                             balance_before: int, balance_after: int,
+                             require_balance: int = 0, timestamp: Optional[str] = None) -> Optional[bool]:
+        return await self.inner.change_credits(user_id, record_type, amount, reason,
+                                               balance_before, balance_after,
+                                               require_balance=require_balance, timestamp=timestamp)
+
+    async def list_credit_history(self, user_id: int, limit: int, offset: int = 0) -> List[dict]:
+        return await self.inner.list_credit_history(user_id, limit, offset)
+
+    async def count_credit_history(self, user_id: int) -> int:
+        return await self.inner.count_credit_history(user_id)
+
+    # ============ 步骤快照 ============
+
+    async def create_snapshot(self, user_id: int, step_index: int, step_route: str, snapshot_data: str,
+                              name: Optional[str] = None, description: Optional[str] = None,
+                              updated_at: Optional[str] = None, replace_step: bool = False,
+                              max_per_user: Optional[int] = None) -> dict:
+        return await self.inner.create_snapshot(user_id, step_index, step_route, snapshot_data,
+                                                name=name, description=description, updated_at=updated_at,
+                                                replace_step=replace_step, max_per_user=max_per_user)
+
+    async def list_snapshots(self, user_id: int, limit: Optional[int] = None) -> List[dict]:
+        return await self.inner.list_snapshots(user_id, limit)
+
+    async def get_snapshot(self, user_id: int, snapshot_id: int) -> Optional[dict]:
+        return await self.inner.get_snapshot(user_id, snapshot_id)
+
+    async def delete_snapshot(self, user_id: int, snapshot_id: int) -> bool:
+        return await self.inner.delete_snapshot(user_id, snapshot_id)
@@ -0,0 +1,834 @@
+"""
+PostgreSQL 仓储实现（asyncpg）
+多个API节点可共享同一数据库并发写入；表结构与SQLite迁移后的结构一致，
+时间列保存为与SQLite CURRENT_TIMESTAMP 相同格式的UTC文本，两种后端返回的数据格式相同
+"""
+from typing import Dict, List, Optional, Sequence
+
+from repositories.base import Repository, PROJECT_FIELDS, DETECTION_JOB_FIELDS, DETECTION_JOB_FINISHED
+from services.persistence import IMAGE_COLUMNS, image_rows, issue_rows, detection_rows
+
+# 与SQLite CURRENT_TIMESTAMP 相同格式的当前UTC时间
+NOW = "to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')"
+
+# 可领取的检测任务：排队中，或执行中但租约已过期（执行者已退出）
+CLAIMABLE_JOB = f"""status IN ('queued', 'running')
+    AND (status = 'queued' OR lease_expires_at IS NULL OR lease_expires_at <= {NOW})"""
+
+# 建表语句（可重复执行）
+SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS projects (
+        id TEXT PRIMARY KEY,
+        name TEXT,
+        location TEXT,
+        inspection_date TEXT,
+        inspector TEXT,
+        company TEXT,
+        scene_type TEXT,
+        template_id TEXT,
+        scene_confidence DOUBLE PRECISION,
+        status TEXT DEFAULT 'uploading',
+        created_at TEXT DEFAULT {NOW},
+        updated_at TEXT DEFAULT {NOW}
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS images (
+        id TEXT PRIMARY KEY,
+        project_id TEXT REFERENCES projects(id),
+        filename TEXT,
+        original_name TEXT,
+        file_path TEXT,
+        file_size BIGINT,
+        width INTEGER,
+        height INTEGER,
+        gps_lat DOUBLE PRECISION,
+        gps_lng DOUBLE PRECISION,
+        captured_at TEXT,
+        sha256 TEXT,
+        thumbnail_sizes TEXT,
+        gps_alt DOUBLE PRECISION,
+        relative_altitude DOUBLE PRECISION,
+        gimbal_pitch DOUBLE PRECISION,
+        gimbal_yaw DOUBLE PRECISION,
+        gimbal_roll DOUBLE PRECISION,
+        focal_length DOUBLE PRECISION,
+        camera_make TEXT,
+        camera_model TEXT,
+        status TEXT DEFAULT 'pending',
+        created_at TEXT DEFAULT {NOW}
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS detection_results (
+        id TEXT PRIMARY KEY,
+        image_id TEXT REFERENCES images(id) ON DELETE CASCADE,
+        project_id TEXT REFERENCES projects(id) ON DELETE CASCADE,
+        confidence DOUBLE PRECISION,
+        status TEXT,
+        suggestion TEXT,
+        created_at TEXT DEFAULT {NOW}
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS issues (
+        id TEXT PRIMARY KEY,
+        detection_id TEXT REFERENCES detection_results(id) ON DELETE CASCADE,
+        issue_type TEXT,
+        name TEXT,
+        severity TEXT,
+        description TEXT,
+        confidence DOUBLE PRECISION,
+        bbox_x DOUBLE PRECISION,
+        bbox_y DOUBLE PRECISION,
+        bbox_width DOUBLE PRECISION,
+        bbox_height DOUBLE PRECISION,
+        created_at TEXT DEFAULT {NOW}
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS upload_sessions (
+        id TEXT PRIMARY KEY,
+        project_id TEXT REFERENCES projects(id) ON DELETE CASCADE,
+        original_name TEXT,
+        total_size BIGINT,
+        chunk_size BIGINT,
+        total_chunks INTEGER,
+        sha256 TEXT,
+        status TEXT DEFAULT 'uploading',
+        image_id TEXT,
+        created_at TEXT DEFAULT {NOW},
+        updated_at TEXT DEFAULT {NOW}
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS upload_session_chunks (
+        session_id TEXT REFERENCES upload_sessions(id) ON DELETE CASCADE,
+        chunk_index INTEGER,
+        "offset" BIGINT,
+        size BIGINT,
+        created_at TEXT DEFAULT {NOW},
+        PRIMARY KEY (session_id, chunk_index)
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL UNIQUE,
+        avatar TEXT,
+        join_date TEXT NOT NULL,
+        total_projects INTEGER DEFAULT 0,
+        total_reports INTEGER DEFAULT 0,
+        last_login TEXT,
+        credits_balance INTEGER DEFAULT 0,
+        created_at TEXT DEFAULT {NOW},
+        updated_at TEXT DEFAULT {NOW}
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS credit_history (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id),
+        type TEXT NOT NULL CHECK (type IN ('earn', 'spend')),
+        amount INTEGER NOT NULL,
+        reason TEXT NOT NULL,
+        balance_before INTEGER NOT NULL,
+        balance_after INTEGER NOT NULL,
+        "timestamp" TEXT DEFAULT {NOW},
+        created_at TEXT DEFAULT {NOW}
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS step_snapshots (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id),
+        step_index INTEGER NOT NULL CHECK (step_index >= 0 AND step_index <= 5),
+        step_route TEXT NOT NULL,
+        snapshot_data TEXT NOT NULL,
+        name TEXT,
+        description TEXT,
+        created_at TEXT DEFAULT {NOW},
+        updated_at TEXT DEFAULT {NOW}
+    )""",
+    "ALTER TABLE projects ADD COLUMN IF NOT EXISTS deleted_at TEXT",
+    f"""CREATE TABLE IF NOT EXISTS detection_jobs (
+        id TEXT PRIMARY KEY,
+        project_id TEXT NOT NULL,
+        scene_type TEXT,
+        force INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'queued',
+        total_images INTEGER DEFAULT 0,
+        processed_images INTEGER DEFAULT 0,
+        last_image_id TEXT,
+        error TEXT,
+        created_at TEXT DEFAULT {NOW},
+        updated_at TEXT DEFAULT {NOW},
+        started_at TEXT,
+        finished_at TEXT
+    )""",
+    "ALTER TABLE detection_jobs ADD COLUMN IF NOT EXISTS owner TEXT",
+    "ALTER TABLE detection_jobs ADD COLUMN IF NOT EXISTS lease_expires_at TEXT",
+    f"""CREATE TABLE IF NOT EXISTS detection_cache (
+        key TEXT PRIMARY KEY,
+        result TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at TEXT DEFAULT {NOW},
+        last_used_at TEXT DEFAULT {NOW}
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_images_project_status ON images(project_id, status)",
+    "CREATE INDEX IF NOT EXISTS idx_images_project_captured ON images(project_id, captured_at)",
+    "CREATE INDEX IF NOT EXISTS idx_images_project_gps ON images(project_id, gps_lat, gps_lng)",
+    "CREATE INDEX IF NOT EXISTS idx_detection_results_project ON detection_results(project_id, status, confidence)",
+    "CREATE INDEX IF NOT EXISTS idx_detection_results_image ON detection_results(image_id)",
+    "CREATE INDEX IF NOT EXISTS idx_issues_detection ON issues(detection_id)",
+    'CREATE INDEX IF NOT EXISTS idx_credit_history_user_timestamp ON credit_history(user_id, "timestamp" DESC)',
+    "CREATE INDEX IF NOT EXISTS idx_step_snapshots_user_created ON step_snapshots(user_id, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_step_snapshots_user_step ON step_snapshots(user_id, step_index)",
+    "CREATE INDEX IF NOT EXISTS idx_projects_deleted ON projects(deleted_at) WHERE deleted_at IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_detection_jobs_status ON detection_jobs(status, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_detection_jobs_project ON detection_jobs(project_id, created_at DESC)",
+    """CREATE UNIQUE INDEX IF NOT EXISTS idx_detection_jobs_active
+       ON detection_jobs(project_id) WHERE status IN ('queued', 'running')""",
+    "CREATE INDEX IF NOT EXISTS idx_images_project_id ON images(project_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_detection_cache_last_used ON detection_cache(last_used_at)",
+]
+
+# 多个节点同时启动时串行化建表
+SCHEMA_LOCK_ID = 7_146_301
+
+
+def to_dict(record) -> Optional[dict]:
+    return dict(record) if record is not None else None
+
+
+def affected(status: str) -> int:
+    """从 asyncpg 的命令状态（如 "UPDATE 3"）中取出影响行数"""
+    return int(status.rsplit(" ", 1)[-1])
+
+
+def lease_until(seconds_param: str) -> str:
+    """当前时间加上参数给出的秒数（租约到期时间，格式同 NOW）"""
+    return (f"to_char((now() + make_interval(secs => {seconds_param}::int)) AT TIME ZONE 'utc', "
+            f"'YYYY-MM-DD HH24:MI:SS')")
+
+
+class PostgresRepository(Repository):
+    """基于 asyncpg 连接池的仓储"""
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+
+    async def open(self):
+        try:
+            import asyncpg
+        except ImportError:
+            raise RuntimeError("使用 PostgreSQL 后端需要安装 asyncpg")
+
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", SCHEMA_LOCK_ID)
+                for statement in SCHEMA:
+                    await conn.execute(statement)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    # ============ 项目 ============
+
+    async def create_project(self, project_id: str, status: str, images: Optional[List[dict]] = None):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "INSERT INTO projects (id, status) VALUES ($1, $2)",
+                    project_id, status
+                )
+                if images:
+                    await self._insert_images(conn, project_id, images)
+
+    async def get_project(self, project_id: str) -> Optional[dict]:
+        return to_dict(await self.pool.fetchrow(
+            "SELECT * FROM projects WHERE id = $1 AND deleted_at IS NULL",
+            project_id
+        ))
+
+    async def update_project(self, project_id: str, **fields) -> bool:
+        unknown = set(fields) - set(PROJECT_FIELDS)
+        if unknown:
+            raise ValueError(f"不支持更新的项目字段: {sorted(unknown)}")
+        assignments = "".join(f"{column} = ${i}, " for i, column in enumerate(fields, start=2))
+        status = await self.pool.execute(
+            f"UPDATE projects SET {assignments}updated_at = {NOW} WHERE id = $1 AND deleted_at IS NULL",
+            project_id, *fields.values()
+        )
+        return affected(status) > 0
+
+    async def advance_project_status(self, project_id: str, status: str, expected: str) -> bool:
+        result = await self.pool.execute(
+            "UPDATE projects SET status = $1 WHERE id = $2 AND status = $3 AND deleted_at IS NULL",
+            status, project_id, expected
+        )
+        return affected(result) > 0
+
+    async def delete_project(self, project_id: str):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # 检测结果、问题及续传会话随外键级联删除
+                await conn.execute("DELETE FROM images WHERE project_id = $1", project_id)
+                await conn.execute("DELETE FROM upload_sessions WHERE project_id = $1", project_id)
+                await conn.execute("DELETE FROM detection_results WHERE project_id = $1", project_id)
+                await conn.execute("DELETE FROM detection_jobs WHERE project_id = $1", project_id)
+                await conn.execute("DELETE FROM projects WHERE id = $1", project_id)
+
+    # ============ 删除回收 ============
+
+    async def mark_project_deleted(self, project_id: str) -> bool:
+        result = await self.pool.execute(
+            f"UPDATE projects SET deleted_at = {NOW} WHERE id = $1 AND deleted_at IS NULL",
+            project_id
+        )
+        return affected(result) > 0
+
+    async def list_deleted_projects(self, limit: int) -> List[str]:
+        rows = await self.pool.fetch(
+            "SELECT id FROM projects WHERE deleted_at IS NOT NULL ORDER BY deleted_at LIMIT $1",
+            limit
+        )
+        return [row["id"] for row in rows]
+
+    async def purge_project_images(self, project_id: str, limit: int) -> int:
+        # 检测结果及问题随外键级联删除
+        result = await self.pool.execute(
+            """DELETE FROM images WHERE id IN (
+                   SELECT id FROM images WHERE project_id = $1 LIMIT $2
+               )""",
+            project_id, limit
+        )
+        return affected(result)
+
+    async def find_missing_projects(self, project_ids: List[str]) -> List[str]:
+        if not project_ids:
+            return []
+        rows = await self.pool.fetch(
+            """SELECT ids.id FROM unnest($1::text[]) AS ids(id)
+               WHERE NOT EXISTS (SELECT 1 FROM projects p WHERE p.id = ids.id)""",
+            project_ids
+        )
+        return [row["id"] for row in rows]
+
+    async def list_orphan_projects(self, before: str, limit: int) -> List[str]:
+        # 图片及检测结果的项目外键保证不会出现没有项目记录的数据，只需查找未完成上传的空项目
+        rows = await self.pool.fetch(
+            """SELECT p.id FROM projects p
+               WHERE p.status = 'uploading' AND p.deleted_at IS NULL AND p.created_at < $1
+                 AND NOT EXISTS (SELECT 1 FROM images i WHERE i.project_id = p.id)
+                 AND NOT EXISTS (SELECT 1 FROM upload_sessions s
+                                 WHERE s.project_id = p.id AND s.updated_at >= $1)
+               LIMIT $2""",
+            before, limit
+        )
+        return [row["id"] for row in rows]
+
+    # ============ 图片 ============
+
+    async def _insert_images(self, conn, project_id: str, images: List[dict]):
+        placeholders = ", ".join(f"${i}" for i in range(1, len(IMAGE_COLUMNS) + 1))
+        await conn.executemany(
+            f"INSERT INTO images ({', '.join(IMAGE_COLUMNS)}) VALUES ({placeholders})",
+            image_rows(project_id, images)
+        )
+
+    async def add_images(self, project_id: str, images: List[dict]):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await self._insert_images(conn, project_id, images)
+                await conn.execute(f"UPDATE projects SET updated_at = {NOW} WHERE id = $1", project_id)
+
+    async def list_images(self, project_id: str) -> List[dict]:
+        # 已标记删除（等待回收）的项目不返回图片
+        rows = await self.pool.fetch(
+            """SELECT i.* FROM images i JOIN projects p ON p.id = i.project_id
+               WHERE i.project_id = $1 AND p.deleted_at IS NULL""",
+            project_id
+        )
+        return [dict(row) for row in rows]
+
+    async def get_image(self, project_id: str, image_id: str) -> Optional[dict]:
+        return to_dict(await self.pool.fetchrow(
+            """SELECT i.* FROM images i JOIN projects p ON p.id = i.project_id
+               WHERE i.id = $1 AND i.project_id = $2 AND p.deleted_at IS NULL""",
+            image_id, project_id
+        ))
+
+    async def count_images(self, project_id: str) -> Dict[str, int]:
+        row = await self.pool.fetchrow(
+            """SELECT COUNT(*) AS count,
+                      COUNT(*) FILTER (WHERE status = 'pending') AS pending_count
+               FROM images WHERE project_id = $1""",
+            project_id
+        )
+        return {"count": row["count"], "pending_count": row["pending_count"]}
+
+    async def set_images_status(self, project_id: str, status: str, from_status: str) -> int:
+        result = await self.pool.execute(
+            "UPDATE images SET status = $1 WHERE project_id = $2 AND status = $3",
+            status, project_id, from_status
+        )
+        return affected(result)
+
+    async def list_images_to_detect(self, project_id: str, force: bool = False,
+                                    after: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        # LIMIT NULL 即不限制数量
+        if force:
+            rows = await self.pool.fetch(
+                """SELECT id, filename, file_path, sha256, thumbnail_sizes FROM images
+                   WHERE project_id = $1 AND ($2::text IS NULL OR id > $2)
+                   ORDER BY id LIMIT $3""",
+                project_id, after, limit
+            )
+        else:
+            rows = await self.pool.fetch(
+                """SELECT i.id, i.filename, i.file_path, i.sha256, i.thumbnail_sizes
+                   FROM images i
+                   LEFT JOIN detection_results dr ON dr.image_id = i.id
+                   WHERE i.project_id = $1 AND ($2::text IS NULL OR i.id > $2) AND dr.id IS NULL
+                   ORDER BY i.id LIMIT $3""",
+                project_id, after, limit
+            )
+        return [dict(row) for row in rows]
+
+    async def count_images_to_detect(self, project_id: str, force: bool = False) -> int:
+        return await self.pool.fetchval(
+            """SELECT COUNT(*) FROM images i
+               WHERE i.project_id = $1
+                 AND ($2 OR NOT EXISTS (SELECT 1 FROM detection_results dr WHERE dr.image_id = i.id))""",
+            project_id, force
+        )
+
+    # ============ 检测结果与问题 ============
+
+    async def _save_detections(self, conn, project_id: str, detections: List[dict]):
+        result_rows, issues = detection_rows(project_id, detections)
+        # 重新检测时替换原有的问题记录
+        await conn.execute(
+            "DELETE FROM issues WHERE detection_id = ANY($1::text[])",
+            [row[0] for row in result_rows]
+        )
+        await conn.executemany(
+            """INSERT INTO detection_results (id, image_id, project_id, confidence, status, suggestion)
+               VALUES ($1, $2, $3, $4, $5, $6)
+               ON CONFLICT (id) DO UPDATE SET
+                   image_id = EXCLUDED.image_id, project_id = EXCLUDED.project_id,
+                   confidence = EXCLUDED.confidence, status = EXCLUDED.status,
+                   suggestion = EXCLUDED.suggestion, created_at = EXCLUDED.created_at""",
+            result_rows
+        )
+        await self._insert_issues(conn, issues)
+        await conn.execute(
+            "UPDATE images SET status = 'detected' WHERE id = ANY($1::text[])",
+            [detection["image_id"] for detection in detections]
+        )
+
+    async def save_detections(self, project_id: str, detections: List[dict]):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await self._save_detections(conn, project_id, detections)
+
+    async def save_detection_batches(self, batches: Dict[str, List[dict]]):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                for project_id, detections in batches.items():
+                    await self._save_detections(conn, project_id, detections)
+
+    async def group_detection_batches(self, project_ids: Sequence[str]) -> List[List[str]]:
+        return [list(project_ids)] if project_ids else []
+
+    async def _insert_issues(self, conn, rows):
+        await conn.executemany(
+            """INSERT INTO issues
+               (id, detection_id, issue_type, name, severity, description, confidence,
+                bbox_x, bbox_y, bbox_width, bbox_height)
+               VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)""",
+            rows
+        )
+
+    async def _attach_issues(self, conn, detections: List[dict]):
+        # 一次查询取出全部问题后按检测结果分组
+        issue_records = await conn.fetch(
+            "SELECT * FROM issues WHERE detection_id = ANY($1::text[])",
+            [detection["id"] for detection in detections]
+        )
+        grouped: Dict[str, List[dict]] = {}
+        for row in issue_records:
+            grouped.setdefault(row["detection_id"], []).append(dict(row))
+        for detection in detections:
+            detection["issues"] = grouped.get(detection["id"], [])
+
+    async def list_detections(self, project_id: str) -> List[dict]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                """SELECT dr.*, i.filename, i.original_name, i.sha256, i.thumbnail_sizes
+                   FROM detection_results dr
+                   JOIN images i ON dr.image_id = i.id
+                   WHERE dr.project_id = $1""",
+                project_id
+            )
+            detections = [dict(row) for row in rows]
+            await self._attach_issues(conn, detections)
+        return detections
+
+    async def list_detections_page(self, project_id: str, after: Optional[str], limit: int) -> List[dict]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                """SELECT dr.*, i.filename, i.original_name, i.sha256, i.thumbnail_sizes
+                   FROM detection_results dr
+                   JOIN images i ON dr.image_id = i.id
+                   WHERE dr.project_id = $1 AND dr.image_id > $2
+                   ORDER BY dr.image_id LIMIT $3""",
+                project_id, after or "", limit
+            )
+            detections = [dict(row) for row in rows]
+            await self._attach_issues(conn, detections)
+        return detections
+
+    async def update_detection(self, project_id: str, image_id: str, status: str,
+                               suggestion: str, issues: List[dict]) -> bool:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                detection_id = await conn.fetchval(
+                    "SELECT id FROM detection_results WHERE project_id = $1 AND image_id = $2 FOR UPDATE",
+                    project_id, image_id
+                )
+                if detection_id is None:
+                    return False
+
+                await conn.execute("DELETE FROM issues WHERE detection_id = $1", detection_id)
+                await self._insert_issues(conn, issue_rows(detection_id, issues))
+                await conn.execute(
+                    "UPDATE detection_results SET status = $1, suggestion = $2 WHERE id = $3",
+                    status, suggestion, detection_id
+                )
+        return True
+
+    async def get_statistics(self, project_id: str) -> dict:
+        async with self.pool.acquire() as conn:
+            image_count = await conn.fetchval(
+                "SELECT COUNT(*) FROM images WHERE project_id = $1", project_id
+            )
+            stats = await conn.fetchrow(
+                """SELECT
+                   COUNT(*) AS total,
+                   COUNT(*) FILTER (WHERE status = 'danger') AS danger_count,
+                   COUNT(*) FILTER (WHERE status = 'warning') AS warning_count,
+                   COUNT(*) FILTER (WHERE status = 'success') AS success_count,
+                   AVG(confidence) AS avg_confidence
+                   FROM detection_results WHERE project_id = $1""",
+                project_id
+            )
+            issue_count = await conn.fetchval(
+                """SELECT COUNT(*) FROM issues
+                   WHERE detection_id IN (SELECT id FROM detection_results WHERE project_id = $1)""",
+                project_id
+            )
+
+        return {
+            "total_images": image_count,
+            "detected_images": stats["total"],
+            "danger_count": stats["danger_count"],
+            "warning_count": stats["warning_count"],
+            "success_count": stats["success_count"],
+            "total_issues": issue_count,
+            "avg_confidence": stats["avg_confidence"] or 0
+        }
+
+    # ============ 检测任务 ============
+
+    async def create_detection_job(self, job_id: str, project_id: str, scene_type: str,
+                                   force: bool, total_images: int) -> dict:
+        async with self.pool.acquire() as conn:
+            while True:
+                job = await conn.fetchrow(
+                    """INSERT INTO detection_jobs (id, project_id, scene_type, force, total_images)
+                       VALUES ($1, $2, $3, $4, $5)
+                       ON CONFLICT (project_id) WHERE status IN ('queued', 'running') DO NOTHING
+                       RETURNING *""",
+                    job_id, project_id, scene_type, int(force), total_images
+                )
+                if job is None:
+                    # 项目已有未完成的任务；该任务在两条语句之间结束时重新插入
+                    job = await conn.fetchrow(
+                        "SELECT * FROM detection_jobs WHERE project_id = $1 AND status IN ('queued', 'running')",
+                        project_id
+                    )
+                if job is not None:
+                    return dict(job)
+
+    async def get_detection_job(self, job_id: str) -> Optional[dict]:
+        return to_dict(await self.pool.fetchrow("SELECT * FROM detection_jobs WHERE id = $1", job_id))
+
+    async def get_active_detection_job(self, project_id: str) -> Optional[dict]:
+        return to_dict(await self.pool.fetchrow(
+            "SELECT * FROM detection_jobs WHERE project_id = $1 AND status IN ('queued', 'running')",
+            project_id
+        ))
+
+    async def list_detection_jobs(self, statuses: Sequence[str], limit: int) -> List[dict]:
+        rows = await self.pool.fetch(
+            """SELECT * FROM detection_jobs WHERE status = ANY($1::text[])
+               ORDER BY created_at LIMIT $2""",
+            list(statuses), limit
+        )
+        return [dict(row) for row in rows]
+
+    async def list_claimable_detection_jobs(self, limit: int) -> List[dict]:
+        rows = await self.pool.fetch(
+            f"SELECT * FROM detection_jobs WHERE {CLAIMABLE_JOB} ORDER BY created_at LIMIT $1",
+            limit
+        )
+        return [dict(row) for row in rows]
+
+    async def claim_detection_job(self, job_id: str, owner: str, lease_seconds: int) -> Optional[dict]:
+        return to_dict(await self.pool.fetchrow(
+            f"""UPDATE detection_jobs
+                SET status = 'running', owner = $2, lease_expires_at = {lease_until("$3")},
+                    started_at = COALESCE(started_at, {NOW}), updated_at = {NOW}
+                WHERE id = $1 AND {CLAIMABLE_JOB}
+                RETURNING *""",
+            job_id, owner, lease_seconds
+        ))
+
+    async def renew_detection_job(self, job_id: str, owner: str, lease_seconds: int) -> bool:
+        result = await self.pool.execute(
+            f"""UPDATE detection_jobs SET lease_expires_at = {lease_until("$3")}
+                WHERE id = $1 AND owner = $2 AND status = 'running'""",
+            job_id, owner, lease_seconds
+        )
+        return affected(result) > 0
+
+    async def update_detection_job(self, job_id: str, expected: Optional[Sequence[str]] = None,
+                                   owner: Optional[str] = None, **fields) -> bool:
+        unknown = set(fields) - set(DETECTION_JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"不支持更新的检测任务字段: {sorted(unknown)}")
+        assignments = "".join(f"{column} = ${i}, " for i, column in enumerate(fields, start=4))
+        status = fields.get("status")
+        if status == "running":
+            assignments += f"started_at = COALESCE(started_at, {NOW}), "
+        elif status in DETECTION_JOB_FINISHED:
+            assignments += f"finished_at = {NOW}, "
+        import asyncpg
+
+        try:
+            result = await self.pool.execute(
+                f"""UPDATE detection_jobs SET {assignments}updated_at = {NOW}
+                    WHERE id = $1 AND ($2::text[] IS NULL OR status = ANY($2::text[]))
+                      AND ($3::text IS NULL OR owner = $3)""",
+                job_id, list(expected) if expected else None, owner, *fields.values()
+            )
+        except asyncpg.UniqueViolationError:
+            # 项目已有其他未完成的任务
+            return False
+        return affected(result) > 0
+
+    # ============ 检测结果缓存 ============
+
+    async def get_cached_results(self, keys: Sequence[str]) -> Dict[str, str]:
+        rows = await self.pool.fetch(
+            f"""UPDATE detection_cache SET last_used_at = {NOW}
+                WHERE key = ANY($1::text[]) RETURNING key, result""",
+            list(keys)
+        )
+        return {row["key"]: row["result"] for row in rows}
+
+    async def save_cached_results(self, entries: Dict[str, str]):
+        await self.pool.executemany(
+            f"""INSERT INTO detection_cache (key, result, size) VALUES ($1, $2, $3)
+                ON CONFLICT (key) DO UPDATE SET result = EXCLUDED.result, size = EXCLUDED.size,
+                    last_used_at = {NOW}""",
+            [(key, result, len(result.encode())) for key, result in entries.items()]
+        )
+
+    async def get_cache_usage(self) -> Dict[str, int]:
+        row = await self.pool.fetchrow(
+            "SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS bytes FROM detection_cache"
+        )
+        return {"entries": row["entries"], "bytes": int(row["bytes"])}
+
+    async def evict_cached_results(self, max_bytes: int, batch_size: int) -> Dict[str, int]:
+        evicted = 0
+        async with self.pool.acquire() as conn:
+            total = int(await conn.fetchval("SELECT COALESCE(SUM(size), 0) FROM detection_cache"))
+            while total > max_bytes:
+                rows = await conn.fetch(
+                    "SELECT key, size FROM detection_cache ORDER BY last_used_at LIMIT $1", batch_size
+                )
+                if not rows:
+                    break
+                keys = []
+                for row in rows:
+                    if total <= max_bytes:
+                        break
+                    keys.append(row["key"])
+                    total -= row["size"]
+                await conn.execute("DELETE FROM detection_cache WHERE key = ANY($1::text[])", keys)
+                evicted += len(keys)
+        return {"evicted": evicted, "bytes": total}
+
+    # ============ 断点续传会话 ============
+
+    async def create_upload_session(self, session: dict):
+        await self.pool.execute(
+            """INSERT INTO upload_sessions
+               (id, project_id, original_name, total_size, chunk_size, total_chunks, sha256)
+               VALUES ($1, $2, $3, $4, $5, $6, $7)""",
+            session["id"], session["project_id"], session["original_name"], session["total_size"],
+            session["chunk_size"], session["total_chunks"], session.get("sha256")
+        )
+
+    async def get_upload_session(self, session_id: str) -> Optional[dict]:
+        return to_dict(await self.pool.fetchrow("SELECT * FROM upload_sessions WHERE id = $1", session_id))
+
+    async def list_received_chunks(self, session_id: str) -> List[int]:
+        rows = await self.pool.fetch(
+            "SELECT chunk_index FROM upload_session_chunks WHERE session_id = $1 ORDER BY chunk_index",
+            session_id
+        )
+        return [row["chunk_index"] for row in rows]
+
+    async def record_chunk(self, session_id: str, chunk_index: int, offset: int, size: int):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    f"""INSERT INTO upload_session_chunks (session_id, chunk_index, "offset", size)
+                        VALUES ($1, $2, $3, $4)
+                        ON CONFLICT (session_id, chunk_index) DO UPDATE SET
+                            "offset" = EXCLUDED."offset", size = EXCLUDED.size, created_at = {NOW}""",
+                    session_id, chunk_index, offset, size
+                )
+                await conn.execute(
+                    f"UPDATE upload_sessions SET updated_at = {NOW} WHERE id = $1", session_id
+                )
+
+    async def advance_upload_session_status(self, session_id: str, status: str, expected: str) -> bool:
+        result = await self.pool.execute(
+            f"UPDATE upload_sessions SET status = $1, updated_at = {NOW} WHERE id = $2 AND status = $3",
+            status, session_id, expected
+        )
+        return affected(result) > 0
+
+    async def complete_upload_session(self, session_id: str, project_id: str, image: dict):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await self._insert_images(conn, project_id, [image])
+                await conn.execute(
+                    f"""UPDATE upload_sessions SET status = 'completed', image_id = $1, updated_at = {NOW}
+                        WHERE id = $2""",
+                    image["id"], session_id
+                )
+                await conn.execute("DELETE FROM upload_session_chunks WHERE session_id = $1", session_id)
+
+    async def abort_upload_session(self, session_id: str):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    f"UPDATE upload_sessions SET status = 'aborted', updated_at = {NOW} WHERE id = $1",
+                    session_id
+                )
+                await conn.execute("DELETE FROM upload_session_chunks WHERE session_id = $1", session_id)
+
+    # ============ 用户与积分 ============
+
+    async def create_user(self, name: str, email: str, join_date: str, credits_balance: int = 0) -> dict:
+        row = await self.pool.fetchrow(
+            """INSERT INTO users (name, email, join_date, credits_balance)
+               VALUES ($1, $2, $3, $4) RETURNING *""",
+            name, email, join_date, credits_balance
+        )
+        return dict(row)
+
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        return to_dict(await self.pool.fetchrow("SELECT * FROM users WHERE id = $1", user_id))
+
+    async def change_credits(self, user_id: int, record_type: str, amount: int, reason: str,
+                             balance_before: int, balance_after: int,
+                             require_balance: int = 0, timestamp: Optional[str] = None) -> Optional[bool]:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # 行锁保证多个节点并发扣减时余额检查与更新之间不被插入
+                balance = await conn.fetchval(
+                    "SELECT credits_balance FROM users WHERE id = $1 FOR UPDATE", user_id
+                )
+                if balance is None:
+                    return None
+                if balance < require_balance:
+                    return False
+
+                await conn.execute(
+                    f"""INSERT INTO credit_history
+                        (user_id, type, amount, reason, balance_before, balance_after, "timestamp")
+                        VALUES ($1, $2, $3, $4, $5, $6, COALESCE($7::text, {NOW}))""",
+                    user_id, record_type, amount, reason, balance_before, balance_after, timestamp
+                )
+                await conn.execute(
+                    f"UPDATE users SET credits_balance = $1, updated_at = {NOW} WHERE id = $2",
+                    balance_after, user_id
+                )
+        return True
+
+    async def list_credit_history(self, user_id: int, limit: int, offset: int = 0) -> List[dict]:
+        rows = await self.pool.fetch(
+            """SELECT * FROM credit_history
+               WHERE user_id = $1
+               ORDER BY "timestamp" DESC
+               LIMIT $2 OFFSET $3""",
+            user_id, limit, offset
+        )
+        return [dict(row) for row in rows]
+
+    async def count_credit_history(self, user_id: int) -> int:
+        return await self.pool.fetchval("SELECT COUNT(*) FROM credit_history WHERE user_id = $1", user_id)
+
+    # ============ 步骤快照 ============
+
+    async def create_snapshot(self, user_id: int, step_index: int, step_route: str, snapshot_data: str,
+                              name: Optional[str] = None, description: Optional[str] = None,
+                              updated_at: Optional[str] = None, replace_step: bool = False,
+                              max_per_user: Optional[int] = None) -> dict:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if replace_step:
+                    await conn.execute(
+                        "DELETE FROM step_snapshots WHERE user_id = $1 AND step_index = $2",
+                        user_id, step_index
+                    )
+                if max_per_user:
+                    # 删除超出数量上限的最早快照（为新快照留出位置）
+                    await conn.execute(
+                        """DELETE FROM step_snapshots WHERE id IN (
+                               SELECT id FROM step_snapshots WHERE user_id = $1
+                               ORDER BY created_at DESC, id DESC OFFSET $2
+                           )""",
+                        user_id, max_per_user - 1
+                    )
+
+                row = await conn.fetchrow(
+                    f"""INSERT INTO step_snapshots
+                        (user_id, step_index, step_route, snapshot_data, name, description, updated_at)
+                        VALUES ($1, $2, $3, $4, $5, $6, COALESCE($7::text, {NOW}))
+                        RETURNING *""",
+                    user_id, step_index, step_route, snapshot_data, name, description, updated_at
+                )
+        return dict(row)
+
+    async def list_snapshots(self, user_id: int, limit: Optional[int] = None) -> List[dict]:
+        rows = await self.pool.fetch(
+            """SELECT * FROM step_snapshots
+               WHERE user_id = $1
+               ORDER BY created_at DESC
+               LIMIT $2""",
+            user_id, limit
+        )
+        return [dict(row) for row in rows]
+
+    async def get_snapshot(self, user_id: int, snapshot_id: int) -> Optional[dict]:
+        return to_dict(await self.pool.fetchrow(
+            "SELECT * FROM step_snapshots WHERE id = $1 AND user_id = $2",
+            snapshot_id, user_id
+        ))
+
+    async def delete_snapshot(self, user_id: int, snapshot_id: int) -> bool:
+        result = await self.pool.execute(
+            "DELETE FROM step_snapshots WHERE id = $1 AND user_id = $2",
+            snapshot_id, user_id
+        )
+        return affected(result) > 0
@@ -0,0 +1,774 @@
+"""
+SQLite 仓储实现
+主库使用连接池（database.get_db），项目图片及检测数据使用 database.get_project_db（可按项目分库）
+"""
+import json
+import sqlite3
+from typing import Dict, List, Optional, Sequence
+
+from database import (
+    init_db, db_pool, project_shards, get_db, get_project_db, is_project_sharded,
+    create_project_db, drop_project_db
+)
+from config import BULK_WRITE_BATCH_SIZE
+from repositories.base import Repository, PROJECT_FIELDS, DETECTION_JOB_FIELDS, DETECTION_JOB_FINISHED
+from services.persistence import (
+    execute_batched, insert_images, save_detections, insert_issues, issue_rows
+)
+
+
+# 可领取的检测任务：排队中，或执行中但租约已过期（执行者已退出）
+CLAIMABLE_JOB = """status IN ('queued', 'running')
+    AND (status = 'queued' OR lease_expires_at IS NULL OR lease_expires_at <= CURRENT_TIMESTAMP)"""
+
+
+def to_dict(row) -> Optional[dict]:
+    return dict(row) if row is not None else None
+
+
+class SQLiteRepository(Repository):
+    """基于 aiosqlite 连接池的仓储"""
+
+    async def open(self):
+        await init_db()
+        await db_pool.open()
+
+    async def close(self):
+        await project_shards.close()
+        await db_pool.close()
+
+    # ============ 项目 ============
+
+    async def create_project(self, project_id: str, status: str, images: Optional[List[dict]] = None):
+        await create_project_db(project_id)
+        sharded = is_project_sharded(project_id)
+        async with get_db() as db:
+            await db.execute(
+                "INSERT INTO projects (id, status) VALUES (?, ?)",
+                (project_id, status)
+            )
+            # 未分库时项目与图片在同一事务中写入
+            if images and not sharded:
+                await insert_images(db, project_id, images)
+            await db.commit()
+
+        # 分库项目先写入项目记录再写入图片，不会出现没有项目记录的图片
+        if images and sharded:
+            async with get_project_db(project_id) as db:
+                await insert_images(db, project_id, images)
+                await db.commit()
+
+    async def get_project(self, project_id: str) -> Optional[dict]:
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute(
+                "SELECT * FROM projects WHERE id = ? AND deleted_at IS NULL",
+                (project_id,)
+            )
+            return to_dict(await cursor.fetchone())
+
+    async def update_project(self, project_id: str, **fields) -> bool:
+        unknown = set(fields) - set(PROJECT_FIELDS)
+        if unknown:
+            raise ValueError(f"不支持更新的项目字段: {sorted(unknown)}")
+        assignments = "".join(f"{column} = ?, " for column in fields)
+        async with get_db() as db:
+            cursor = await db.execute(
+                f"""UPDATE projects SET {assignments}updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND deleted_at IS NULL""",
+                (*fields.values(), project_id)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+
+    async def advance_project_status(self, project_id: str, status: str, expected: str) -> bool:
+        async with get_db() as db:
+            cursor = await db.execute(
+                "UPDATE projects SET status = ? WHERE id = ? AND status = ? AND deleted_at IS NULL",
+                (status, project_id, expected)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+
+    async def delete_project(self, project_id: str):
+        # 项目分库直接删除文件
+        sharded = await drop_project_db(project_id)
+        async with get_db() as db:
+            if not sharded:
+                await db.execute("DELETE FROM issues WHERE detection_id IN (SELECT id FROM detection_results WHERE project_id = ?)", (project_id,))
+                await db.execute("DELETE FROM detection_results WHERE project_id = ?", (project_id,))
+                await db.execute("DELETE FROM images WHERE project_id = ?", (project_id,))
+            await db.execute("DELETE FROM detection_jobs WHERE project_id = ?", (project_id,))
+            await db.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+            await db.commit()
+
+    # ============ 删除回收 ============
+
+    async def mark_project_deleted(self, project_id: str) -> bool:
+        async with get_db() as db:
+            cursor = await db.execute(
+                "UPDATE projects SET deleted_at = CURRENT_TIMESTAMP WHERE id = ? AND deleted_at IS NULL",
+                (project_id,)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+
+    async def list_deleted_projects(self, limit: int) -> List[str]:
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute(
+                "SELECT id FROM projects WHERE deleted_at IS NOT NULL ORDER BY deleted_at LIMIT ?",
+                (limit,)
+            )
+            return [row["id"] for row in await cursor.fetchall()]
+
+    async def purge_project_images(self, project_id: str, limit: int) -> int:
+        if is_project_sharded(project_id):
+            return 0
+
+        async with get_db() as db:
+            cursor = await db.execute(
+                "SELECT id FROM images WHERE project_id = ? LIMIT ?",
+                (project_id, limit)
+            )
+            image_ids = [(row["id"],) for row in await cursor.fetchall()]
+            await execute_batched(
+                db,
+                "DELETE FROM issues WHERE detection_id IN (SELECT id FROM detection_results WHERE image_id = ?)",
+                image_ids
+            )
+            await execute_batched(db, "DELETE FROM detection_results WHERE image_id = ?", image_ids)
+            await execute_batched(db, "DELETE FROM images WHERE id = ?", image_ids)
+            await db.commit()
+        return len(image_ids)
+
+    async def find_missing_projects(self, project_ids: List[str]) -> List[str]:
+        if not project_ids:
+            return []
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute(
+                """SELECT ids.value AS id FROM json_each(?) AS ids
+                   WHERE NOT EXISTS (SELECT 1 FROM projects p WHERE p.id = ids.value)""",
+                (json.dumps(project_ids),)
+            )
+            return [row["id"] for row in await cursor.fetchall()]
+
+    async def list_orphan_projects(self, before: str, limit: int) -> List[str]:
+        async with get_db(readonly=True) as db:
+            # 宽限期内写入过数据的项目可能正在创建（分库项目的项目记录与图片分两次提交），不回收
+            cursor = await db.execute(
+                """SELECT project_id FROM images
+                   WHERE project_id NOT IN (SELECT id FROM projects)
+                   GROUP BY project_id HAVING MAX(created_at) < ?
+                   UNION
+                   SELECT project_id FROM detection_results
+                   WHERE project_id NOT IN (SELECT id FROM projects)
+                   GROUP BY project_id HAVING MAX(created_at) < ?
+                   LIMIT ?""",
+                (before, before, limit)
+            )
+            orphans = [row["project_id"] for row in await cursor.fetchall()]
+
+            cursor = await db.execute(
+                """SELECT p.id FROM projects p
+                   WHERE p.status = 'uploading' AND p.deleted_at IS NULL AND p.created_at < ?
+                     AND NOT EXISTS (SELECT 1 FROM images i WHERE i.project_id = p.id)
+                     AND NOT EXISTS (SELECT 1 FROM upload_sessions s
+                                     WHERE s.project_id = p.id AND s.updated_at >= ?)
+                   LIMIT ?""",
+                (before, before, max(0, limit - len(orphans)))
+            )
+            candidates = [row["id"] for row in await cursor.fetchall()]
+
+        # 分库项目的图片不在主库中，需在分库中确认没有图片
+        for project_id in candidates:
+            if is_project_sharded(project_id):
+                if (await self.count_images(project_id))["count"]:
+                    continue
+            orphans.append(project_id)
+        return orphans
+
+    # ============ 图片 ============
+
+    async def add_images(self, project_id: str, images: List[dict]):
+        async with get_project_db(project_id) as db:
+            await insert_images(db, project_id, images)
+            await db.commit()
+
+        async with get_db() as db:
+            await db.execute(
+                "UPDATE projects SET updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (project_id,)
+            )
+            await db.commit()
+
+    async def list_images(self, project_id: str) -> List[dict]:
+        # 项目记录在主库，图片可能在分库，先确认项目未删除
+        if await self.get_project(project_id) is None:
+            return []
+        async with get_project_db(project_id, readonly=True) as db:
+            cursor = await db.execute(
+                "SELECT * FROM images WHERE project_id = ?",
+                (project_id,)
+            )
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def get_image(self, project_id: str, image_id: str) -> Optional[dict]:
+        if await self.get_project(project_id) is None:
+            return None
+        async with get_project_db(project_id, readonly=True) as db:
+            cursor = await db.execute(
+                "SELECT * FROM images WHERE id = ? AND project_id = ?",
+                (image_id, project_id)
+            )
+            return to_dict(await cursor.fetchone())
+
+    async def count_images(self, project_id: str) -> Dict[str, int]:
+        async with get_project_db(project_id, readonly=True) as db:
+            cursor = await db.execute(
+                """SELECT COUNT(*) as count,
+                          SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END) as pending_count
+                   FROM images WHERE project_id = ?""",
+                (project_id,)
+            )
+            row = await cursor.fetchone()
+        return {"count": row["count"], "pending_count": row["pending_count"] or 0}
+
+    async def set_images_status(self, project_id: str, status: str, from_status: str) -> int:
+        async with get_project_db(project_id) as db:
+            cursor = await db.execute(
+                "UPDATE images SET status = ? WHERE project_id = ? AND status = ?",
+                (status, project_id, from_status)
+            )
+            await db.commit()
+            return cursor.rowcount
+
+    async def list_images_to_detect(self, project_id: str, force: bool = False,
+                                    after: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        conditions = "i.project_id = ?" + (" AND i.id > ?" if after is not None else "")
+        params = (project_id,) + ((after,) if after is not None else ()) + (limit if limit is not None else -1,)
+        async with get_project_db(project_id, readonly=True) as db:
+            if force:
+                cursor = await db.execute(
+                    f"""SELECT i.id, i.filename, i.file_path, i.sha256, i.thumbnail_sizes FROM images i
+                        WHERE {conditions} ORDER BY i.id LIMIT ?""",
+                    params
+                )
+            else:
+                cursor = await db.execute(
+                    f"""SELECT i.id, i.filename, i.file_path, i.sha256, i.thumbnail_sizes
+                        FROM images i
+                        LEFT JOIN detection_results dr ON dr.image_id = i.id
+                        WHERE {conditions} AND dr.id IS NULL
+                        ORDER BY i.id LIMIT ?""",
+                    params
+                )
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def count_images_to_detect(self, project_id: str, force: bool = False) -> int:
+        condition = "" if force else \
+            " AND NOT EXISTS (SELECT 1 FROM detection_results dr WHERE dr.image_id = i.id)"
+        async with get_project_db(project_id, readonly=True) as db:
+            cursor = await db.execute(
+                f"SELECT COUNT(*) AS count FROM images i WHERE i.project_id = ?{condition}",
+                (project_id,)
+            )
+            return (await cursor.fetchone())["count"]
+
+    # ============ 检测结果与问题 ============
+
+    async def save_detections(self, project_id: str, detections: List[dict]):
+        async with get_project_db(project_id) as db:
+            await save_detections(db, project_id, detections)
+            await db.commit()
+
+    async def save_detection_batches(self, batches: Dict[str, List[dict]]):
+        # 位于同一数据库文件的项目（未分库的项目都在主库）合并为一个事务
+        shared = {}
+        for project_id, detections in batches.items():
+            if is_project_sharded(project_id):
+                await self.save_detections(project_id, detections)
+            else:
+                shared[project_id] = detections
+
+        if shared:
+            async with get_db() as db:
+                for project_id, detections in shared.items():
+                    await save_detections(db, project_id, detections)
+                await db.commit()
+
+    async def group_detection_batches(self, project_ids: Sequence[str]) -> List[List[str]]:
+        shared = [project_id for project_id in project_ids if not is_project_sharded(project_id)]
+        groups = [[project_id] for project_id in project_ids if is_project_sharded(project_id)]
+        return [shared] + groups if shared else groups
+
+    async def _attach_issues(self, db, detections: List[dict]):
+        """一次查询取出一批检测结果的问题列表"""
+        by_id = {detection["id"]: detection for detection in detections}
+        for detection in detections:
+            detection["issues"] = []
+        ids = list(by_id)
+        for start in range(0, len(ids), BULK_WRITE_BATCH_SIZE):
+            chunk = ids[start:start + BULK_WRITE_BATCH_SIZE]
+            cursor = await db.execute(
+                f"SELECT * FROM issues WHERE detection_id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            for row in await cursor.fetchall():
+                by_id[row["detection_id"]]["issues"].append(dict(row))
+
+    async def list_detections(self, project_id: str) -> List[dict]:
+        async with get_project_db(project_id, readonly=True) as db:
+            cursor = await db.execute(
+                """SELECT dr.*, i.filename, i.original_name, i.sha256, i.thumbnail_sizes
+                   FROM detection_results dr
+                   JOIN images i ON dr.image_id = i.id
+                   WHERE dr.project_id = ?""",
+                (project_id,)
+            )
+            detections = [dict(row) for row in await cursor.fetchall()]
+            await self._attach_issues(db, detections)
+        return detections
+
+    async def list_detections_page(self, project_id: str, after: Optional[str], limit: int) -> List[dict]:
+        async with get_project_db(project_id, readonly=True) as db:
+            cursor = await db.execute(
+                """SELECT dr.*, i.filename, i.original_name, i.sha256, i.thumbnail_sizes
+                   FROM detection_results dr
+                   JOIN images i ON dr.image_id = i.id
+                   WHERE dr.project_id = ? AND dr.image_id > ?
+                   ORDER BY dr.image_id LIMIT ?""",
+                (project_id, after or "", limit)
+            )
+            detections = [dict(row) for row in await cursor.fetchall()]
+            await self._attach_issues(db, detections)
+        return detections
+
+    async def update_detection(self, project_id: str, image_id: str, status: str,
+                               suggestion: str, issues: List[dict]) -> bool:
+        async with get_project_db(project_id) as db:
+            cursor = await db.execute(
+                "SELECT id FROM detection_results WHERE project_id = ? AND image_id = ?",
+                (project_id, image_id)
+            )
+            det = await cursor.fetchone()
+            if not det:
+                return False
+
+            detection_id = det["id"]
+            await db.execute("DELETE FROM issues WHERE detection_id = ?", (detection_id,))
+            await insert_issues(db, issue_rows(detection_id, issues))
+            await db.execute(
+                "UPDATE detection_results SET status = ?, suggestion = ? WHERE id = ?",
+                (status, suggestion, detection_id)
+            )
+            await db.commit()
+        return True
+
+    async def get_statistics(self, project_id: str) -> dict:
+        async with get_project_db(project_id, readonly=True) as db:
+            cursor = await db.execute(
+                "SELECT COUNT(*) as count FROM images WHERE project_id = ?",
+                (project_id,)
+            )
+            image_count = (await cursor.fetchone())["count"]
+
+            cursor = await db.execute(
+                """SELECT
+                   COUNT(*) as total,
+                   SUM(CASE WHEN status = 'danger' THEN 1 ELSE 0 END) as danger_count,
+                   SUM(CASE WHEN status = 'warning' THEN 1 ELSE 0 END) as warning_count,
+                   SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) as success_count,
+                   AVG(confidence) as avg_confidence
+                   FROM detection_results WHERE project_id = ?""",
+                (project_id,)
+            )
+            stats = await cursor.fetchone()
+
+            cursor = await db.execute(
+                """SELECT COUNT(*) as count FROM issues
+                   WHERE detection_id IN (SELECT id FROM detection_results WHERE project_id = ?)""",
+                (project_id,)
+            )
+            issue_count = (await cursor.fetchone())["count"]
+
+        return {
+            "total_images": image_count,
+            "detected_images": stats["total"] or 0,
+            "danger_count": stats["danger_count"] or 0,
+            "warning_count": stats["warning_count"] or 0,
+            "success_count": stats["success_count"] or 0,
+            "total_issues": issue_count,
+            "avg_confidence": stats["avg_confidence"] or 0
+        }
+
+    # ============ 检测任务 ============
+
+    async def create_detection_job(self, job_id: str, project_id: str, scene_type: str,
+                                   force: bool, total_images: int) -> dict:
+        async with get_db() as db:
+            # 未完成任务的部分唯一索引冲突时忽略插入；在同一写事务中读取，
+            # 冲突的任务不会在两条语句之间结束
+            await db.execute(
+                """INSERT OR IGNORE INTO detection_jobs (id, project_id, scene_type, force, total_images)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (job_id, project_id, scene_type, int(force), total_images)
+            )
+            cursor = await db.execute(
+                "SELECT * FROM detection_jobs WHERE project_id = ? AND status IN ('queued', 'running')",
+                (project_id,)
+            )
+            job = dict(await cursor.fetchone())
+            await db.commit()
+            return job
+
+    async def get_detection_job(self, job_id: str) -> Optional[dict]:
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute("SELECT * FROM detection_jobs WHERE id = ?", (job_id,))
+            return to_dict(await cursor.fetchone())
+
+    async def get_active_detection_job(self, project_id: str) -> Optional[dict]:
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute(
+                "SELECT * FROM detection_jobs WHERE project_id = ? AND status IN ('queued', 'running')",
+                (project_id,)
+            )
+            return to_dict(await cursor.fetchone())
+
+    async def list_detection_jobs(self, statuses: Sequence[str], limit: int) -> List[dict]:
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute(
+                f"""SELECT * FROM detection_jobs
+                    WHERE status IN ({", ".join("?" * len(statuses))})
+                    ORDER BY created_at LIMIT ?""",
+                (*statuses, limit)
+            )
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def list_claimable_detection_jobs(self, limit: int) -> List[dict]:
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute(
+                f"SELECT * FROM detection_jobs WHERE {CLAIMABLE_JOB} ORDER BY created_at LIMIT ?",
+                (limit,)
+            )
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def claim_detection_job(self, job_id: str, owner: str, lease_seconds: int) -> Optional[dict]:
+        async with get_db() as db:
+            cursor = await db.execute(
+                f"""UPDATE detection_jobs
+                    SET status = 'running', owner = ?, lease_expires_at = datetime('now', ?),
+                        started_at = COALESCE(started_at, CURRENT_TIMESTAMP), updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND {CLAIMABLE_JOB}
+                    RETURNING *""",
+                (owner, f"+{lease_seconds} seconds", job_id)
+            )
+            job = to_dict(await cursor.fetchone())
+            await db.commit()
+            return job
+
+    async def renew_detection_job(self, job_id: str, owner: str, lease_seconds: int) -> bool:
+        async with get_db() as db:
+            cursor = await db.execute(
+                """UPDATE detection_jobs SET lease_expires_at = datetime('now', ?)
+                   WHERE id = ? AND owner = ? AND status = 'running'""",
+                (f"+{lease_seconds} seconds", job_id, owner)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+
+    async def update_detection_job(self, job_id: str, expected: Optional[Sequence[str]] = None,
+                                   owner: Optional[str] = None, **fields) -> bool:
+        unknown = set(fields) - set(DETECTION_JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"不支持更新的检测任务字段: {sorted(unknown)}")
+        assignments = "".join(f"{column} = ?, " for column in fields)
+        status = fields.get("status")
+        if status == "running":
+            assignments += "started_at = COALESCE(started_at, CURRENT_TIMESTAMP), "
+        elif status in DETECTION_JOB_FINISHED:
+            assignments += "finished_at = CURRENT_TIMESTAMP, "
+        condition = f" AND status IN ({', '.join('?' * len(expected))})" if expected else ""
+        if owner is not None:
+            condition += " AND owner = ?"
+
+        async with get_db() as db:
+            try:
+                cursor = await db.execute(
+                    f"UPDATE detection_jobs SET {assignments}updated_at = CURRENT_TIMESTAMP WHERE id = ?{condition}",
+                    (*fields.values(), job_id, *(expected or ()), *(() if owner is None else (owner,)))
+                )
+            except sqlite3.IntegrityError:
+                # 项目已有其他未完成的任务
+                return False
+            await db.commit()
+            return cursor.rowcount > 0
+
+    # ============ 检测结果缓存 ============
+
+    async def get_cached_results(self, keys: Sequence[str]) -> Dict[str, str]:
+        keys = list(keys)
+        found = {}
+        async with get_db(readonly=True) as db:
+            for start in range(0, len(keys), BULK_WRITE_BATCH_SIZE):
+                chunk = keys[start:start + BULK_WRITE_BATCH_SIZE]
+                cursor = await db.execute(
+                    f"SELECT key, result FROM detection_cache WHERE key IN ({', '.join('?' * len(chunk))})",
+                    chunk
+                )
+                found.update((row["key"], row["result"]) for row in await cursor.fetchall())
+        if found:
+            async with get_db() as db:
+                await execute_batched(
+                    db,
+                    "UPDATE detection_cache SET last_used_at = CURRENT_TIMESTAMP WHERE key = ?",
+                    [(key,) for key in found]
+                )
+                await db.commit()
+        return found
+
+    async def save_cached_results(self, entries: Dict[str, str]):
+        async with get_db() as db:
+            await execute_batched(
+                db,
+                """INSERT INTO detection_cache (key, result, size) VALUES (?, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET result = excluded.result, size = excluded.size,
+                       last_used_at = CURRENT_TIMESTAMP""",
+                [(key, result, len(result.encode())) for key, result in entries.items()]
+            )
+            await db.commit()
+
+    async def get_cache_usage(self) -> Dict[str, int]:
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM detection_cache")
+            entries, size = await cursor.fetchone()
+            return {"entries": entries, "bytes": size}
+
+    async def evict_cached_results(self, max_bytes: int, batch_size: int) -> Dict[str, int]:
+        evicted = 0
+        async with get_db() as db:
+            cursor = await db.execute("SELECT COALESCE(SUM(size), 0) FROM detection_cache")
+            total = (await cursor.fetchone())[0]
+            while total > max_bytes:
+                cursor = await db.execute(
+                    "SELECT key, size FROM detection_cache ORDER BY last_used_at LIMIT ?", (batch_size,)
+                )
+                rows = await cursor.fetchall()
+                if not rows:
+                    break
+                keys = []
+                for key, size in rows:
+                    if total <= max_bytes:
+                        break
+                    keys.append((key,))
+                    total -= size
+                await execute_batched(db, "DELETE FROM detection_cache WHERE key = ?", keys)
+                evicted += len(keys)
+            await db.commit()
+        return {"evicted": evicted, "bytes": total}
+
+    # ============ 断点续传会话 ============
+
+    async def create_upload_session(self, session: dict):
+        async with get_db() as db:
+            await db.execute(
+                """INSERT INTO upload_sessions
+                   (id, project_id, original_name, total_size, chunk_size, total_chunks, sha256)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (session["id"], session["project_id"], session["original_name"], session["total_size"],
+                 session["chunk_size"], session["total_chunks"], session.get("sha256"))
+            )
+            await db.commit()
+
+    async def get_upload_session(self, session_id: str) -> Optional[dict]:
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute("SELECT * FROM upload_sessions WHERE id = ?", (session_id,))
+            return to_dict(await cursor.fetchone())
+
+    async def list_received_chunks(self, session_id: str) -> List[int]:
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute(
+                "SELECT chunk_index FROM upload_session_chunks WHERE session_id = ? ORDER BY chunk_index",
+                (session_id,)
+            )
+            return [row["chunk_index"] for row in await cursor.fetchall()]
+
+    async def record_chunk(self, session_id: str, chunk_index: int, offset: int, size: int):
+        async with get_db() as db:
+            await db.execute(
+                """INSERT OR REPLACE INTO upload_session_chunks (session_id, chunk_index, offset, size)
+                   VALUES (?, ?, ?, ?)""",
+                (session_id, chunk_index, offset, size)
+            )
+            await db.execute(
+                "UPDATE upload_sessions SET updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (session_id,)
+            )
+            await db.commit()
+
+    async def advance_upload_session_status(self, session_id: str, status: str, expected: str) -> bool:
+        async with get_db() as db:
+            cursor = await db.execute(
+                """UPDATE upload_sessions SET status = ?, updated_at = CURRENT_TIMESTAMP
+                   WHERE id = ? AND status = ?""",
+                (status, session_id, expected)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+
+    async def complete_upload_session(self, session_id: str, project_id: str, image: dict):
+        if not is_project_sharded(project_id):
+            # 图片与会话在同一个库中，一个事务内完成
+            async with get_db() as db:
+                await insert_images(db, project_id, [image])
+                await self._finish_upload_session(db, session_id, image["id"])
+            return
+
+        async with get_project_db(project_id) as db:
+            await insert_images(db, project_id, [image])
+            await db.commit()
+        try:
+            async with get_db() as db:
+                await self._finish_upload_session(db, session_id, image["id"])
+        except BaseException:
+            # 会话未能更新时删除刚写入的图片，重试时重新写入
+            async with get_project_db(project_id) as db:
+                await db.execute("DELETE FROM images WHERE id = ?", (image["id"],))
+                await db.commit()
+            raise
+
+    async def _finish_upload_session(self, db, session_id: str, image_id: str):
+        await db.execute(
+            """UPDATE upload_sessions SET status = ?, image_id = ?, updated_at = CURRENT_TIMESTAMP
+               WHERE id = ?""",
+            ("completed", image_id, session_id)
+        )
+        await db.execute("DELETE FROM upload_session_chunks WHERE session_id = ?", (session_id,))
+        await db.commit()
+
+    async def abort_upload_session(self, session_id: str):
+        async with get_db() as db:
+            await db.execute(
+                "UPDATE upload_sessions SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                ("aborted", session_id)
+            )
+            await db.execute("DELETE FROM upload_session_chunks WHERE session_id = ?", (session_id,))
+            await db.commit()
+
+    # ============ 用户与积分 ============
+
+    async def create_user(self, name: str, email: str, join_date: str, credits_balance: int = 0) -> dict:
+        async with get_db() as db:
+            cursor = await db.execute(
+                "INSERT INTO users (name, email, join_date, credits_balance) VALUES (?, ?, ?, ?)",
+                (name, email, join_date, credits_balance)
+            )
+            user_id = cursor.lastrowid
+            await db.commit()
+
+            cursor = await db.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+            return dict(await cursor.fetchone())
+
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+            return to_dict(await cursor.fetchone())
+
+    async def change_credits(self, user_id: int, record_type: str, amount: int, reason: str,
+                             balance_before: int, balance_after: int,
+                             require_balance: int = 0, timestamp: Optional[str] = None) -> Optional[bool]:
+        async with get_db() as db:
+            cursor = await db.execute("SELECT credits_balance FROM users WHERE id = ?", (user_id,))
+            user_row = await cursor.fetchone()
+            if not user_row:
+                return None
+            if user_row["credits_balance"] < require_balance:
+                return False
+
+            await db.execute(
+                """INSERT INTO credit_history (user_id, type, amount, reason, balance_before, balance_after, timestamp)
+                   VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))""",
+                (user_id, record_type, amount, reason, balance_before, balance_after, timestamp)
+            )
+            await db.execute(
+                "UPDATE users SET credits_balance = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (balance_after, user_id)
+            )
+            await db.commit()
+        return True
+
+    async def list_credit_history(self, user_id: int, limit: int, offset: int = 0) -> List[dict]:
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute(
+                """SELECT * FROM credit_history
+                   WHERE user_id = ?
+                   ORDER BY timestamp DESC
+                   LIMIT ? OFFSET ?""",
+                (user_id, limit, offset)
+            )
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def count_credit_history(self, user_id: int) -> int:
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM credit_history WHERE user_id = ?", (user_id,))
+            return (await cursor.fetchone())[0]
+
+    # ============ 步骤快照 ============
+
+    async def create_snapshot(self, user_id: int, step_index: int, step_route: str, snapshot_data: str,
+                              name: Optional[str] = None, description: Optional[str] = None,
+                              updated_at: Optional[str] = None, replace_step: bool = False,
+                              max_per_user: Optional[int] = None) -> dict:
+        async with get_db() as db:
+            if replace_step:
+                await db.execute(
+                    "DELETE FROM step_snapshots WHERE user_id = ? AND step_index = ?",
+                    (user_id, step_index)
+                )
+            if max_per_user:
+                # 删除超出数量上限的最早快照（为新快照留出位置）
+                await db.execute(
+                    """DELETE FROM step_snapshots WHERE id IN (
+                           SELECT id FROM step_snapshots WHERE user_id = ?
+                           ORDER BY created_at DESC, id DESC LIMIT -1 OFFSET ?
+                       )""",
+                    (user_id, max_per_user - 1)
+                )
+
+            cursor = await db.execute(
+                """INSERT INTO step_snapshots
+                   (user_id, step_index, step_route, snapshot_data, name, description, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))""",
+                (user_id, step_index, step_route, snapshot_data, name, description, updated_at)
+            )
+            snapshot_id = cursor.lastrowid
+            await db.commit()
+
+            cursor = await db.execute("SELECT * FROM step_snapshots WHERE id = ?", (snapshot_id,))
+            return dict(await cursor.fetchone())
+
+    async def list_snapshots(self, user_id: int, limit: Optional[int] = None) -> List[dict]:
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute(
+                """SELECT * FROM step_snapshots
+                   WHERE user_id = ?
+                   ORDER BY created_at DESC
+                   LIMIT ?""",
+                (user_id, limit if limit is not None else -1)
+            )
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def get_snapshot(self, user_id: int, snapshot_id: int) -> Optional[dict]:
+        async with get_db(readonly=True) as db:
+            cursor = await db.execute(
+                "SELECT * FROM step_snapshots WHERE id = ? AND user_id = ?",
+                (snapshot_id, user_id)
+            )
+            return to_dict(await cursor.fetchone())
+
+    async def delete_snapshot(self, user_id: int, snapshot_id: int) -> bool:
+        async with get_db() as db:
+            cursor = await db.execute(
+                "DELETE FROM step_snapshots WHERE id = ? AND user_id = ?",
+                (snapshot_id, user_id)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
@@ -4,7 +4,7 @@
 from fastapi import APIRouter, HTTPException
 
 from services.mock_ai import mock_ai
-from database import get_db
+from repositories import repository
 
 router = APIRouter()
 
@@ -13,36 +13,57 @@ router = APIRouter()
 async def analyze_scene(project_id: str):
     """
     分析项目图片的场景类型
+    只分析尚未分析过的（待处理）图片；已有场景类型的项目追加图片后保持原场景
     """
     # 获取项目图片数量
-    async with get_db() as db:
-        cursor = await db.execute(
-            "SELECT COUNT(*) as count FROM images WHERE project_id = ?",
-            (project_id,)
-        )
-        row = await cursor.fetchone()
-        
-        if not row or row["count"] == 0:
-            raise HTTPException(status_code=404, detail="项目不存在或没有图片")
-        
-        image_count = row["count"]
+    counts = await repository.count_images(project_id)
+    if counts["count"] == 0:
+        raise HTTPException(status_code=404, detail="项目不存在或没有图片")
     
-    # 模拟场景分析
-    result = mock_ai.analyze_scene(image_count)
+    image_count = counts["count"]
+    pending_count = counts["pending_count"]
     
-    # 更新项目的场景类型
-    async with get_db() as db:
-        await db.execute(
-            "UPDATE projects SET scene_type = ?, status = ? WHERE id = ?",
-            (result["primary_scene"]["id"], "analyzed", project_id)
-        )
-        await db.commit()
+    project = await repository.get_project(project_id)
+    
+    current_scene = None
+    if project and project["scene_type"]:
+        current_scene = next((s for s in mock_ai.SCENE_TYPES if s["id"] == project["scene_type"]), None)
+    
+    # 没有新图片时直接返回已有的分析结果
+    if pending_count == 0 and current_scene:
+        primary_scene = {**current_scene, "confidence": project["scene_confidence"]}
+        return {
+            "project_id": project_id,
+            "image_count": image_count,
+            "analyzed_count": 0,
+            "primary_scene": primary_scene,
+            "all_scenes": [primary_scene]
+        }
+    
+    # 模拟场景分析（仅分析待处理图片）
+    result = mock_ai.analyze_scene(pending_count or image_count)
+    primary_scene = result["primary_scene"]
+    all_scenes = result["all_scenes"]
+    
+    # 已有场景类型的项目保持原场景
+    if current_scene:
+        primary_scene = next(s for s in all_scenes if s["id"] == current_scene["id"])
+    
+    # 更新项目的场景类型，并将待处理图片标记为已分析
+    await repository.update_project(
+        project_id,
+        scene_type=primary_scene["id"],
+        scene_confidence=primary_scene["confidence"],
+        status="analyzed"
+    )
+    await repository.set_images_status(project_id, "analyzed", from_status="pending")
     
     return {
         "project_id": project_id,
         "image_count": image_count,
-        "primary_scene": result["primary_scene"],
-        "all_scenes": result["all_scenes"]
+        "analyzed_count": pending_count,
+        "primary_scene": primary_scene,
+        "all_scenes": all_scenes
     }
 
 
@@ -87,16 +108,8 @@ async def update_scene(project_id: str, scene_type: str):
         raise HTTPException(status_code=400, detail="无效的场景类型")
     
     # 更新数据库
-    async with get_db() as db:
-        cursor = await db.execute(
-            "UPDATE projects SET scene_type = ? WHERE id = ?",
-            (scene_type, project_id)
-        )
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="项目不存在")
-        
-        await db.commit()
+    if not await repository.update_project(project_id, scene_type=scene_type):
+        raise HTTPException(status_code=404, detail="项目不存在")
     
     return {"message": "场景类型已更新", "scene_type": scene_type}
 
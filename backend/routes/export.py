@@ -12,7 +12,7 @@ from datetime import datetime
 # PIL imports for image processing
 from PIL import Image as PILImage, ImageDraw, ImageFont
 
-from database import get_db
+from repositories import repository
 from models.schemas import ProjectInfo, ExportRequest
 from services.metadata_extractor import MetadataExtractor
 
@@ -660,16 +660,15 @@ async def update_project_info(project_id: str, info: ProjectInfo):
     """
     更新项目信息
     """
-    async with get_db() as db:
-        await db.execute(
-            """UPDATE projects SET 
-               name = ?, location = ?, inspection_date = ?, 
-               inspector = ?, company = ?, status = ?
-               WHERE id = ?""",
-            (info.name, info.location, info.inspection_date,
-             info.inspector, info.company, "info_updated", project_id)
-        )
-        await db.commit()
+    await repository.update_project(
+        project_id,
+        name=info.name,
+        location=info.location,
+        inspection_date=info.inspection_date,
+        inspector=info.inspector,
+        company=info.company,
+        status="info_updated"
+    )
     
     return {"message": "项目信息已更新"}
 
@@ -679,28 +678,22 @@ async def get_project_info(project_id: str):
     """
     获取项目信息
     """
-    async with get_db() as db:
-        cursor = await db.execute(
-            "SELECT * FROM projects WHERE id = ?",
-            (project_id,)
-        )
-        project = await cursor.fetchone()
-        
-        if not project:
-            raise HTTPException(status_code=404, detail="项目不存在")
-        
-        return {
-            "id": project["id"],
-            "name": project["name"],
-            "location": project["location"],
-            "inspection_date": project["inspection_date"],
-            "inspector": project["inspector"],
-            "company": project["company"],
-            "scene_type": project["scene_type"],
-            "template_id": project["template_id"],
-            "status": project["status"],
-            "created_at": project["created_at"]
-        }
+    project = await repository.get_project(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="项目不存在")
+    
+    return {
+        "id": project["id"],
+        "name": project["name"],
+        "location": project["location"],
+        "inspection_date": project["inspection_date"],
+        "inspector": project["inspector"],
+        "company": project["company"],
+        "scene_type": project["scene_type"],
+        "template_id": project["template_id"],
+        "status": project["status"],
+        "created_at": project["created_at"]
+    }
 
 
 @router.post("/generate/{project_id}")
@@ -710,15 +703,9 @@ async def generate_report(project_id: str, request: ExportRequest):
     MVP阶段只返回模拟的成功响应
     """
     # 验证项目存在
-    async with get_db() as db:
-        cursor = await db.execute(
-            "SELECT * FROM projects WHERE id = ?",
-            (project_id,)
-        )
-        project = await cursor.fetchone()
-        
-        if not project:
-            raise HTTPException(status_code=404, detail="项目不存在")
+    project = await repository.get_project(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="项目不存在")
     
     # MVP阶段返回模拟响应
     filename = f"inspection_report_{project_id}.{request.format}"
@@ -737,15 +724,9 @@ async def download_report(project_id: str, format: str):
     MVP阶段返回提示信息
     """
     # 验证项目存在
-    async with get_db() as db:
-        cursor = await db.execute(
-            "SELECT name FROM projects WHERE id = ?",
-            (project_id,)
-        )
-        project = await cursor.fetchone()
-        
-        if not project:
-            raise HTTPException(status_code=404, detail="项目不存在")
+    project = await repository.get_project(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="项目不存在")
     
     # MVP阶段返回提示
     return {
@@ -762,32 +743,26 @@ async def get_export_metadata(project_id: str):
     获取导出所需的自动提取元数据
     """
     # 验证项目存在
-    async with get_db() as db:
-        cursor = await db.execute(
-            "SELECT * FROM projects WHERE id = ?",
-            (project_id,)
-        )
-        project = await cursor.fetchone()
-        
-        if not project:
-            raise HTTPException(status_code=404, detail="项目不存在")
-        
-        # 获取图片列表（模拟）
-        images = []  # 实际应该从数据库查询
-        
-        # 获取检测结果（模拟）
-        detection_results = []  # 实际应该从数据库查询
-        
-        # 提取元数据
-        metadata = MetadataExtractor.extract_all_metadata(
-            project_id=project_id,
-            images=images,
-            detection_results=detection_results,
-            scene_type=project.get('scene_type', 'unknown'),
-            algorithms=[]  # 实际应该从项目数据获取
-        )
-        
-        return metadata
+    project = await repository.get_project(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="项目不存在")
+    
+    # 获取图片元数据（入库时已从EXIF/XMP解析）
+    images = await repository.list_images(project_id)
+    
+    # 获取检测结果（模拟）
+    detection_results = []  # 实际应该从数据库查询
+    
+    # 提取元数据
+    metadata = MetadataExtractor.extract_all_metadata(
+        project_id=project_id,
+        images=images,
+        detection_results=detection_results,
+        scene_type=project['scene_type'] or 'unknown',
+        algorithms=[]  # 实际应该从项目数据获取
+    )
+    
+    return metadata
 
 
 @router.post("/basic/{project_id}")
@@ -796,15 +771,9 @@ async def generate_basic_report(project_id: str):
     生成基础报告PDF
     """
     # 验证项目存在
-    async with get_db() as db:
-        cursor = await db.execute(
-            "SELECT * FROM projects WHERE id = ?",
-            (project_id,)
-        )
-        project = await cursor.fetchone()
-        
-        if not project:
-            raise HTTPException(status_code=404, detail="项目不存在")
+    project = await repository.get_project(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="项目不存在")
     
     # MVP阶段返回模拟响应
     filename = f"basic_report_{project_id}.pdf"
@@ -821,42 +790,10 @@ async def get_statistics(project_id: str):
     """
     获取项目统计信息
     """
-    async with get_db() as db:
-        # 获取图片总数
-        cursor = await db.execute(
-            "SELECT COUNT(*) as count FROM images WHERE project_id = ?",
-            (project_id,)
-        )
-        image_count = (await cursor.fetchone())["count"]
-        
-        # 获取检测结果统计
-        cursor = await db.execute(
-            """SELECT 
-               COUNT(*) as total,
-               SUM(CASE WHEN status = 'danger' THEN 1 ELSE 0 END) as danger_count,
-               SUM(CASE WHEN status = 'warning' THEN 1 ELSE 0 END) as warning_count,
-               SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) as success_count,
-               AVG(confidence) as avg_confidence
-               FROM detection_results WHERE project_id = ?""",
-            (project_id,)
-        )
-        stats = await cursor.fetchone()
-        
-        # 获取问题总数
-        cursor = await db.execute(
-            """SELECT COUNT(*) as count FROM issues 
-               WHERE detection_id IN (SELECT id FROM detection_results WHERE project_id = ?)""",
-            (project_id,)
-        )
-        issue_count = (await cursor.fetchone())["count"]
-        
-        return {
-            "project_id": project_id,
-            "total_images": image_count,
-            "detected_images": stats["total"] or 0,
-            "danger_count": stats["danger_count"] or 0,
-            "warning_count": stats["warning_count"] or 0,
-            "success_count": stats["success_count"] or 0,
-            "total_issues": issue_count,
-            "avg_confidence": round(stats["avg_confidence"] or 0, 2)
-        }
+    stats = await repository.get_statistics(project_id)
+    
+    return {
+        "project_id": project_id,
+        **stats,
+        "avg_confidence": round(stats["avg_confidence"], 2)
+    }
@@ -1,11 +1,14 @@
 """
 报告相关路由
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from typing import Optional
 
+from config import DETECTION_RESULTS_PAGE_SIZE, DETECTION_RESULTS_MAX_PAGE_SIZE
 from services.mock_ai import mock_ai
-from database import get_db
+from services.thumbnailer import thumbnailer
+from services.detection_jobs import detection_jobs
+from repositories import repository
 from models.schemas import TemplateSelectRequest, DetectionResultUpdate
 
 router = APIRouter()
@@ -26,108 +29,150 @@ async def select_template(request: TemplateSelectRequest):
     为项目选择报告模板
     """
     # 更新项目的模板选择
-    async with get_db() as db:
-        cursor = await db.execute(
-            "UPDATE projects SET template_id = ?, status = ? WHERE id = ?",
-            (request.template_id, "template_selected", request.project_id)
-        )
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="项目不存在")
-        
-        await db.commit()
+    updated = await repository.update_project(
+        request.project_id, template_id=request.template_id, status="template_selected"
+    )
+    if not updated:
+        raise HTTPException(status_code=404, detail="项目不存在")
     
     return {"message": "模板已选择", "template_id": request.template_id}
 
 
-@router.post("/detect/{project_id}")
-async def run_detection(project_id: str):
+def job_response(job: dict) -> dict:
+    """检测任务的进度信息"""
+    total = job["total_images"]
+    return {
+        "job_id": job["id"],
+        "project_id": job["project_id"],
+        "status": job["status"],
+        "force": bool(job["force"]),
+        "total_images": total,
+        "processed_images": job["processed_images"],
+        "progress": round(min(job["processed_images"] / total, 1) * 100, 1) if total else 100.0,
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"]
+    }
+
+
+def detection_response(project_id: str, det: dict) -> dict:
+    """单张图片的检测结果"""
+    issues = [
+        {
+            "id": issue["id"],
+            "type": issue["issue_type"],
+            "name": issue["name"],
+            "severity": issue["severity"],
+            "description": issue["description"],
+            "confidence": issue["confidence"],
+            "bbox": {
+                "x": issue["bbox_x"],
+                "y": issue["bbox_y"],
+                "width": issue["bbox_width"],
+                "height": issue["bbox_height"]
+            }
+        }
+        for issue in det["issues"]
+    ]
+    
+    return {
+        "id": det["id"],
+        "image_id": det["image_id"],
+        "filename": det["filename"],
+        "preview_url": f"/uploads/{project_id}/{det['filename']}",
+        "thumbnails": thumbnailer.get_urls(project_id, det["sha256"], det["thumbnail_sizes"]),
+        "confidence": det["confidence"],
+        "status": det["status"],
+        "issues": issues,
+        "suggestion": det["suggestion"]
+    }
+
+
+async def get_job_or_404(job_id: str) -> dict:
+    """获取检测任务，不存在时返回404"""
+    job = await repository.get_detection_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="检测任务不存在")
+    return job
+
+
+@router.post("/detect/{project_id}", status_code=202)
+async def run_detection(project_id: str, force: bool = False):
     """
-    执行AI检测
+    提交AI检测任务，立即返回任务ID
+    默认只检测尚无检测结果的图片（如追加上传的图片），force=true 时重新检测全部图片；
+    项目已有未完成的检测任务时不再创建新任务，返回该任务（attached=true）；
+    通过 /detection-jobs/{job_id} 查询进度，/detection-jobs/{job_id}/results 分页读取结果
     """
     # 获取项目信息
-    async with get_db() as db:
-        cursor = await db.execute(
-            "SELECT scene_type FROM projects WHERE id = ?",
-            (project_id,)
-        )
-        project = await cursor.fetchone()
-        
-        if not project:
-            raise HTTPException(status_code=404, detail="项目不存在")
-        
-        scene_type = project["scene_type"] or "building"
-        
-        # 获取项目图片
-        cursor = await db.execute(
-            "SELECT id, filename FROM images WHERE project_id = ?",
-            (project_id,)
-        )
-        images = await cursor.fetchall()
-        
-        if not images:
-            raise HTTPException(status_code=400, detail="项目没有图片")
+    project = await repository.get_project(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="项目不存在")
     
-    # 对每张图片执行检测
-    results = []
-    for img in images:
-        detection = mock_ai.detect_issues(img["id"], scene_type)
-        detection["filename"] = img["filename"]
-        detection["preview_url"] = f"/uploads/{project_id}/{img['filename']}"
-        results.append(detection)
-        
-        # 保存检测结果到数据库
-        async with get_db() as db:
-            await db.execute(
-                """INSERT OR REPLACE INTO detection_results 
-                   (id, image_id, project_id, confidence, status, suggestion)
-                   VALUES (?, ?, ?, ?, ?, ?)""",
-                (f"det-{img['id']}", img["id"], project_id, 
-                 detection["confidence"], detection["status"], detection["suggestion"])
-            )
-            
-            # 保存问题详情
-            for issue in detection["issues"]:
-                await db.execute(
-                    """INSERT INTO issues 
-                       (id, detection_id, issue_type, name, severity, description, confidence,
-                        bbox_x, bbox_y, bbox_width, bbox_height)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (issue["id"], f"det-{img['id']}", issue["type"], issue["name"],
-                     issue["severity"], issue["description"], issue["confidence"],
-                     issue["bbox"]["x"], issue["bbox"]["y"], 
-                     issue["bbox"]["width"], issue["bbox"]["height"])
-                )
-            
-            await db.commit()
+    scene_type = project["scene_type"] or "building"
     
-    # 更新项目状态
-    async with get_db() as db:
-        await db.execute(
-            "UPDATE projects SET status = ? WHERE id = ?",
-            ("detected", project_id)
-        )
-        await db.commit()
+    # 获取项目图片数量
+    image_count = (await repository.count_images(project_id))["count"]
+    if not image_count:
+        raise HTTPException(status_code=400, detail="项目没有图片")
     
-    # 计算统计信息
-    total = len(results)
-    danger_count = sum(1 for r in results if r["status"] == "danger")
-    warning_count = sum(1 for r in results if r["status"] == "warning")
-    success_count = sum(1 for r in results if r["status"] == "success")
-    total_issues = sum(len(r["issues"]) for r in results)
-    avg_confidence = sum(r["confidence"] for r in results) / total if total > 0 else 0
+    job, created = await detection_jobs.submit(project_id, scene_type, force=force)
+    
+    return {**job_response(job), "attached": not created, "skipped_count": image_count - job["total_images"]}
+
+
+@router.get("/detection-jobs/{job_id}")
+async def get_detection_job(job_id: str):
+    """
+    查询检测任务进度
+    """
+    return job_response(await get_job_or_404(job_id))
+
+
+@router.post("/detection-jobs/{job_id}/cancel")
+async def cancel_detection_job(job_id: str):
+    """
+    取消检测任务
+    执行中的任务在当前批次写入后停止，已写入的结果保留
+    """
+    await get_job_or_404(job_id)
+    if not await detection_jobs.cancel(job_id):
+        raise HTTPException(status_code=409, detail="任务已结束，无法取消")
+    
+    return job_response(await get_job_or_404(job_id))
+
+
+@router.post("/detection-jobs/{job_id}/resume")
+async def resume_detection_job(job_id: str):
+    """
+    继续已取消或失败的检测任务（从中断的位置继续）
+    """
+    await get_job_or_404(job_id)
+    if not await detection_jobs.resume(job_id):
+        raise HTTPException(status_code=409, detail="只能继续已取消或失败的任务，且项目没有其他未完成的任务")
+    
+    return job_response(await get_job_or_404(job_id))
+
+
+@router.get("/detection-jobs/{job_id}/results")
+async def get_detection_job_results(
+    job_id: str,
+    after: Optional[str] = None,
+    limit: int = Query(DETECTION_RESULTS_PAGE_SIZE, ge=1, le=DETECTION_RESULTS_MAX_PAGE_SIZE)
+):
+    """
+    按图片ID分页读取任务所属项目的检测结果，任务执行中也可读取已写入的部分
+    下一页传入上一页返回的 next_after，为 null 时已读完当前已有的结果
+    """
+    job = await get_job_or_404(job_id)
+    project_id = job["project_id"]
+    detections = await repository.list_detections_page(project_id, after, limit)
     
     return {
-        "project_id": project_id,
-        "results": results,
-        "statistics": {
-            "total_images": total,
-            "danger_count": danger_count,
-            "warning_count": warning_count,
-            "success_count": success_count,
-            "total_issues": total_issues,
-            "avg_confidence": round(avg_confidence, 2)
-        }
+        "job": job_response(job),
+        "results": [detection_response(project_id, det) for det in detections],
+        "next_after": detections[-1]["image_id"] if len(detections) == limit else None
     }
 
 
@@ -136,59 +181,13 @@ async def get_detection_results(project_id: str):
     """
     获取项目的检测结果
     """
-    async with get_db() as db:
-        # 获取检测结果
-        cursor = await db.execute(
-            """SELECT dr.*, i.filename, i.original_name
-               FROM detection_results dr
-               JOIN images i ON dr.image_id = i.id
-               WHERE dr.project_id = ?""",
-            (project_id,)
-        )
-        detection_rows = await cursor.fetchall()
-        
-        if not detection_rows:
-            raise HTTPException(status_code=404, detail="没有检测结果")
-        
-        results = []
-        for det in detection_rows:
-            # 获取该检测结果的问题
-            cursor = await db.execute(
-                "SELECT * FROM issues WHERE detection_id = ?",
-                (det["id"],)
-            )
-            issue_rows = await cursor.fetchall()
-            
-            issues = [
-                {
-                    "id": issue["id"],
-                    "type": issue["issue_type"],
-                    "name": issue["name"],
-                    "severity": issue["severity"],
-                    "description": issue["description"],
-                    "confidence": issue["confidence"],
-                    "bbox": {
-                        "x": issue["bbox_x"],
-                        "y": issue["bbox_y"],
-                        "width": issue["bbox_width"],
-                        "height": issue["bbox_height"]
-                    }
-                }
-                for issue in issue_rows
-            ]
-            
-            results.append({
-                "id": det["id"],
-                "image_id": det["image_id"],
-                "filename": det["filename"],
-                "preview_url": f"/uploads/{project_id}/{det['filename']}",
-                "confidence": det["confidence"],
-                "status": det["status"],
-                "issues": issues,
-                "suggestion": det["suggestion"]
-            })
-        
-        return {"project_id": project_id, "results": results}
+    detections = await repository.list_detections(project_id)
+    if not detections:
+        raise HTTPException(status_code=404, detail="没有检测结果")
+    
+    results = [detection_response(project_id, det) for det in detections]
+    
+    return {"project_id": project_id, "results": results}
 
 
 @router.put("/detection-result/{project_id}/{image_id}")
@@ -197,45 +196,17 @@ async def update_detection_result(project_id: str, image_id: str, update: Detect
     更新单张图片的检测结果
     用于用户手动修正
     """
-    async with get_db() as db:
-        # 获取检测结果ID
-        cursor = await db.execute(
-            "SELECT id FROM detection_results WHERE project_id = ? AND image_id = ?",
-            (project_id, image_id)
-        )
-        det = await cursor.fetchone()
-        
-        if not det:
-            raise HTTPException(status_code=404, detail="检测结果不存在")
-        
-        detection_id = det["id"]
-        
-        # 删除旧的问题记录
-        await db.execute("DELETE FROM issues WHERE detection_id = ?", (detection_id,))
-        
-        # 插入新的问题记录
-        for issue in update.issues:
-            await db.execute(
-                """INSERT INTO issues 
-                   (id, detection_id, issue_type, name, severity, description, confidence,
-                    bbox_x, bbox_y, bbox_width, bbox_height)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (issue.id, detection_id, issue.type, issue.name,
-                 issue.severity, issue.description, issue.confidence,
-                 issue.bbox.x, issue.bbox.y, issue.bbox.width, issue.bbox.height)
-            )
-        
-        # 更新检测结果
-        new_status = "success"
-        if update.issues:
-            new_status = "danger" if any(i.severity == "danger" for i in update.issues) else "warning"
-        
-        await db.execute(
-            "UPDATE detection_results SET status = ?, suggestion = ? WHERE id = ?",
-            (new_status, update.suggestion or "", detection_id)
-        )
-        
-        await db.commit()
+    new_status = "success"
+    if update.issues:
+        new_status = "danger" if any(i.severity == "danger" for i in update.issues) else "warning"
+    
+    # 替换问题记录并更新检测结论
+    updated = await repository.update_detection(
+        project_id, image_id, new_status, update.suggestion or "",
+        [issue.model_dump() for issue in update.issues]
+    )
+    if not updated:
+        raise HTTPException(status_code=404, detail="检测结果不存在")
     
     return {"message": "检测结果已更新"}
 
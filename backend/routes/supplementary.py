@@ -9,7 +9,10 @@ import os
 import shutil
 from datetime import datetime
 
-router = APIRouter(prefix="/api/supplementary", tags=["supplementary"])
+from services.admission import AdmissionRoute
+
+# 上传类请求（POST/PUT）经过准入控制
+router = APIRouter(prefix="/api/supplementary", tags=["supplementary"], route_class=AdmissionRoute)
 
 # 上传目录
 UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "uploads")
@@ -1,35 +1,45 @@
 """
 上传相关路由
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
+from typing import List, Optional
 import uuid
-import os
+import asyncio
 
-from services.file_handler import FileHandler
-from database import get_db
+from services.file_handler import FileHandler, ArchiveError
+from services.thumbnailer import thumbnailer
+from services.metadata_extractor import MetadataExtractor
+from services.admission import AdmissionRoute
+from services.reclaimer import project_reclaimer
+from repositories import repository
+from config import (
+    UPLOAD_DIR, CONTENT_ADDRESSED_STORAGE, IMAGE_PROBE_WORKERS,
+    ARCHIVE_INGEST_CONCURRENCY, ARCHIVE_INGEST_BATCH_SIZE
+)
+from models.schemas import UploadSessionCreate
 
-router = APIRouter()
+# 上传类请求（POST/PUT）经过准入控制
+router = APIRouter(route_class=AdmissionRoute)
 
 # 初始化文件处理器
-UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "uploads")
-file_handler = FileHandler(UPLOAD_DIR)
+file_handler = FileHandler(
+    UPLOAD_DIR,
+    content_addressed=CONTENT_ADDRESSED_STORAGE,
+    probe_workers=IMAGE_PROBE_WORKERS
+)
 
 
-@router.post("/images")
-async def upload_images(files: List[UploadFile] = File(...)):
-    """
-    上传图片
-    支持多张图片批量上传
-    """
-    if not files:
-        raise HTTPException(status_code=400, detail="没有上传文件")
-    
-    # 生成项目ID
-    project_id = f"PRJ-{uuid.uuid4().hex[:12].upper()}"
-    
+async def process_new_images(project_id: str, images: List[dict]):
+    """入库前处理：在进程池中并发生成缩略图、解析EXIF/XMP元数据"""
+    await asyncio.gather(
+        thumbnailer.generate_for_images(project_id, images),
+        MetadataExtractor.extract_for_images(images)
+    )
+
+
+async def save_uploaded_files(files: List[UploadFile], project_id: str) -> List[dict]:
+    """流式保存上传的图片并完成入库前处理，跳过不合法的文件"""
     uploaded_images = []
-    total_size = 0
     
     for file in files:
         # 检查文件类型
@@ -37,13 +47,9 @@ async def upload_images(files: List[UploadFile] = File(...)):
             continue
         
         try:
-            # 读取文件内容
-            content = await file.read()
-            
-            # 保存文件
-            image_info = await file_handler.save_file(content, project_id, file.filename)
+            # 分块流式保存文件，避免整个文件驻留内存
+            image_info = await file_handler.save_upload(file, project_id)
             uploaded_images.append(image_info)
-            total_size += image_info["file_size"]
             
         except ValueError as e:
             # 跳过不合法的文件
@@ -54,77 +60,365 @@ async def upload_images(files: List[UploadFile] = File(...)):
     if not uploaded_images:
         raise HTTPException(status_code=400, detail="没有有效的图片文件")
     
+    # 生成缩略图金字塔并解析元数据
+    await process_new_images(project_id, uploaded_images)
+    return uploaded_images
+
+
+def upload_response(project_id: str, images: List[dict]) -> dict:
+    """构造上传结果"""
+    return {
+        "project_id": project_id,
+        "images": images,
+        "total_count": len(images),
+        "total_size": sum(img["file_size"] for img in images)
+    }
+
+
+@router.post("/images")
+async def upload_images(files: List[UploadFile] = File(...)):
+    """
+    上传图片
+    支持多张图片批量上传
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="没有上传文件")
+    
+    # 生成项目ID
+    project_id = f"PRJ-{uuid.uuid4().hex[:12].upper()}"
+    
+    uploaded_images = await save_uploaded_files(files, project_id)
+    
     # 保存项目信息到数据库
-    async with get_db() as db:
-        await db.execute(
-            "INSERT INTO projects (id, status) VALUES (?, ?)",
-            (project_id, "uploaded")
-        )
-        
-        for img in uploaded_images:
-            await db.execute(
-                """INSERT INTO images (id, project_id, filename, original_name, file_path, file_size, width, height)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                (img["id"], project_id, img["filename"], img["original_name"], 
-                 img["file_path"], img["file_size"], img["width"], img["height"])
-            )
+    await repository.create_project(project_id, "uploaded", uploaded_images)
+    
+    return upload_response(project_id, uploaded_images)
+
+
+@router.post("/images/{project_id}")
+async def append_images(project_id: str, files: List[UploadFile] = File(...)):
+    """
+    向已有项目追加图片
+    新图片标记为待处理，场景分析和AI检测只处理尚无结果的图片
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="没有上传文件")
+    
+    if not await repository.get_project(project_id):
+        raise HTTPException(status_code=404, detail="项目不存在")
+    
+    uploaded_images = await save_uploaded_files(files, project_id)
+    await repository.add_images(project_id, uploaded_images)
+    
+    return upload_response(project_id, uploaded_images)
+
+
+async def abort_ingest(project_id: str, pending: List[asyncio.Task]):
+    """导入失败：取消并等待处理中的批次，再删除已写入的项目文件"""
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    file_handler.delete_project_files(project_id)
+
+
+@router.post("/archive")
+async def upload_archive(archive: UploadFile = File(...)):
+    """
+    上传压缩包（ZIP/TAR）并流式导入其中的图片
+    图片直接从压缩包写入项目目录，缩略图和元数据按批次有限并发处理
+    """
+    if not file_handler.is_archive(archive.filename or ""):
+        raise HTTPException(status_code=400, detail=f"不支持的压缩包格式: {archive.filename}")
+    
+    # 生成项目ID
+    project_id = f"PRJ-{uuid.uuid4().hex[:12].upper()}"
+    
+    uploaded_images = []
+    batch = []
+    pending = []
+    
+    try:
+        async for name, chunks in file_handler.iter_archive(archive.file, archive.filename):
+            try:
+                image_info = await file_handler.save_stream(chunks, project_id, name)
+            except ValueError:
+                # 跳过不合法的文件
+                continue
+            uploaded_images.append(image_info)
+            batch.append(image_info)
+            
+            # 按批次后台处理，限制同时处理的批次数
+            if len(batch) >= ARCHIVE_INGEST_BATCH_SIZE:
+                pending.append(asyncio.create_task(process_new_images(project_id, batch)))
+                batch = []
+                if len(pending) >= ARCHIVE_INGEST_CONCURRENCY:
+                    await pending.pop(0)
         
-        await db.commit()
+        if batch:
+            pending.append(asyncio.create_task(process_new_images(project_id, batch)))
+        await asyncio.gather(*pending)
+    except ArchiveError as e:
+        await abort_ingest(project_id, pending)
+        raise HTTPException(status_code=400, detail=f"无法解析压缩包: {str(e)}")
+    except BaseException:
+        await abort_ingest(project_id, pending)
+        raise
+    
+    if not uploaded_images:
+        file_handler.delete_project_files(project_id)
+        raise HTTPException(status_code=400, detail="压缩包中没有有效的图片文件")
+    
+    # 保存项目信息到数据库
+    await repository.create_project(project_id, "uploaded", uploaded_images)
+    
+    return upload_response(project_id, uploaded_images)
+
+
+# ============ 断点续传 ============
+
+async def get_session_or_404(session_id: str) -> dict:
+    """获取续传会话，不存在时返回404"""
+    session = await repository.get_upload_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    return session
+
+
+@router.post("/sessions")
+async def create_upload_session(request: UploadSessionCreate):
+    """
+    创建断点续传会话
+    每个文件一个会话；不传 project_id 时创建新项目，后续文件应传入返回的 project_id
+    """
+    if not file_handler.is_allowed_file(request.filename):
+        raise HTTPException(status_code=400, detail=f"不支持的文件类型: {request.filename}")
+    if request.total_size <= 0 or request.total_size > file_handler.MAX_FILE_SIZE:
+        raise HTTPException(status_code=400, detail="文件大小不合法")
+    if request.chunk_size <= 0:
+        raise HTTPException(status_code=400, detail="分块大小不合法")
+    
+    session_id = uuid.uuid4().hex
+    total_chunks = (request.total_size + request.chunk_size - 1) // request.chunk_size
+    
+    if request.project_id:
+        project_id = request.project_id
+        if not await repository.get_project(project_id):
+            raise HTTPException(status_code=404, detail="项目不存在")
+    else:
+        project_id = f"PRJ-{uuid.uuid4().hex[:12].upper()}"
+        await repository.create_project(project_id, "uploading")
+    
+    file_handler.create_session_file(session_id, request.total_size)
+    await repository.create_upload_session({
+        "id": session_id,
+        "project_id": project_id,
+        "original_name": request.filename,
+        "total_size": request.total_size,
+        "chunk_size": request.chunk_size,
+        "total_chunks": total_chunks,
+        "sha256": request.sha256
+    })
     
     return {
+        "session_id": session_id,
         "project_id": project_id,
-        "images": uploaded_images,
-        "total_count": len(uploaded_images),
-        "total_size": total_size
+        "chunk_size": request.chunk_size,
+        "total_chunks": total_chunks
+    }
+
+
+@router.put("/sessions/{session_id}/chunks/{chunk_index}")
+async def upload_session_chunk(session_id: str, chunk_index: int, request: Request,
+                               offset: Optional[int] = None):
+    """
+    上传一个分块（请求体为分块原始字节）
+    重复上传同一分块会覆盖之前的内容
+    """
+    session = await get_session_or_404(session_id)
+    
+    if session["status"] != "uploading":
+        raise HTTPException(status_code=409, detail="上传会话已结束")
+    if chunk_index < 0 or chunk_index >= session["total_chunks"]:
+        raise HTTPException(status_code=400, detail="分块序号超出范围")
+    
+    expected_offset = chunk_index * session["chunk_size"]
+    if offset is not None and offset != expected_offset:
+        raise HTTPException(status_code=400, detail=f"分块偏移不匹配，应为 {expected_offset}")
+    expected_size = min(session["chunk_size"], session["total_size"] - expected_offset)
+    
+    try:
+        written = await file_handler.write_chunk(session_id, expected_offset, request.stream(), expected_size)
+    except FileNotFoundError:
+        # 会话文件已被完成请求移走或随会话删除
+        raise HTTPException(status_code=409, detail="上传会话已结束或正在完成")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if written != expected_size:
+        raise HTTPException(status_code=400, detail=f"分块大小不完整，应为 {expected_size} 字节")
+    
+    await repository.record_chunk(session_id, chunk_index, expected_offset, written)
+    
+    return {"session_id": session_id, "chunk_index": chunk_index, "size": written}
+
+
+@router.get("/sessions/{session_id}")
+async def get_upload_session(session_id: str):
+    """
+    查询续传会话状态，返回已接收和缺失的分块
+    """
+    session = await get_session_or_404(session_id)
+    received = await repository.list_received_chunks(session_id)
+    
+    received_set = set(received)
+    missing = [i for i in range(session["total_chunks"]) if i not in received_set]
+    
+    return {
+        "session_id": session_id,
+        "project_id": session["project_id"],
+        "filename": session["original_name"],
+        "status": session["status"],
+        "total_size": session["total_size"],
+        "chunk_size": session["chunk_size"],
+        "total_chunks": session["total_chunks"],
+        "received_chunks": received,
+        "missing_chunks": missing,
+        "image_id": session["image_id"]
     }
 
 
+@router.post("/sessions/{session_id}/complete")
+async def complete_upload_session(session_id: str):
+    """
+    完成续传会话：校验分块齐全后将文件移入项目目录并写入图片记录
+    对已完成的会话重复调用会返回同一图片；并发的完成请求中只有一个执行，其余返回409
+    """
+    session = await get_session_or_404(session_id)
+    received = set(await repository.list_received_chunks(session_id))
+    project_id = session["project_id"]
+    
+    if session["status"] == "completed":
+        image = await repository.get_image(project_id, session["image_id"])
+        # 项目已标记删除（图片记录可能尚未回收）
+        if image is None or not await repository.get_project(project_id):
+            raise HTTPException(status_code=410, detail="图片已随项目删除")
+        return {
+            "session_id": session_id,
+            "project_id": project_id,
+            "image": {
+                "id": image["id"],
+                "filename": image["filename"],
+                "original_name": image["original_name"],
+                "file_size": image["file_size"],
+                "width": image["width"],
+                "height": image["height"],
+                "sha256": image["sha256"],
+                "preview_url": f"/uploads/{project_id}/{image['filename']}",
+                "thumbnails": thumbnailer.get_urls(project_id, image["sha256"], image["thumbnail_sizes"])
+            }
+        }
+    if session["status"] == "completing":
+        raise HTTPException(status_code=409, detail="上传会话正在完成")
+    if session["status"] != "uploading":
+        raise HTTPException(status_code=409, detail="上传会话已结束")
+    
+    missing = [i for i in range(session["total_chunks"]) if i not in received]
+    if missing:
+        raise HTTPException(status_code=409, detail={"message": "分块未全部上传", "missing_chunks": missing})
+    
+    # 原子地进入完成中状态，同一会话只有一个请求移动文件
+    if not await repository.advance_upload_session_status(session_id, "completing", expected="uploading"):
+        raise HTTPException(status_code=409, detail="上传会话正在完成或已结束")
+    
+    part_path = file_handler.get_session_path(session_id)
+    try:
+        image_info = await file_handler.save_local_file(
+            part_path, project_id, session["original_name"], expected_sha256=session["sha256"]
+        )
+    except FileNotFoundError:
+        # 会话文件已不存在，会话无法继续
+        await repository.abort_upload_session(session_id)
+        raise HTTPException(status_code=409, detail="上传会话的文件已不存在，请重新上传")
+    except ValueError as e:
+        await repository.advance_upload_session_status(session_id, "uploading", expected="completing")
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        # 恢复为上传中，客户端可重试
+        await repository.advance_upload_session_status(session_id, "uploading", expected="completing")
+        raise
+    
+    try:
+        await process_new_images(project_id, [image_info])
+        await repository.complete_upload_session(session_id, project_id, image_info)
+    except BaseException:
+        # 文件放回会话文件并恢复为上传中，重试时从头完成
+        file_handler.withdraw_file(image_info["file_path"], image_info["sha256"], image_info["created"], part_path)
+        await repository.advance_upload_session_status(session_id, "uploading", expected="completing")
+        raise
+    
+    await repository.advance_project_status(project_id, "uploaded", expected="uploading")
+    
+    return {"session_id": session_id, "project_id": project_id, "image": image_info}
+
+
+@router.delete("/sessions/{session_id}")
+async def abort_upload_session(session_id: str):
+    """
+    放弃续传会话并删除已接收的数据
+    """
+    session = await get_session_or_404(session_id)
+    if session["status"] == "completed":
+        raise HTTPException(status_code=409, detail="上传会话已完成")
+    if session["status"] == "completing":
+        raise HTTPException(status_code=409, detail="上传会话正在完成")
+    
+    await repository.abort_upload_session(session_id)
+    
+    file_handler.delete_file(file_handler.get_session_path(session_id))
+    
+    return {"message": "上传会话已取消"}
+
+
 @router.get("/images/{project_id}")
 async def get_images(project_id: str):
     """
     获取项目的图片列表
     """
-    async with get_db() as db:
-        cursor = await db.execute(
-            "SELECT * FROM images WHERE project_id = ?",
-            (project_id,)
-        )
-        rows = await cursor.fetchall()
-        
-        if not rows:
-            raise HTTPException(status_code=404, detail="项目不存在或没有图片")
-        
-        images = []
-        for row in rows:
-            preview_url = f"/uploads/{project_id}/{row['filename']}"
-            images.append({
-                "id": row["id"],
-                "filename": row["filename"],
-                "original_name": row["original_name"],
-                "file_size": row["file_size"],
-                "width": row["width"],
-                "height": row["height"],
-                "preview_url": preview_url
-            })
-        
-        return {"project_id": project_id, "images": images}
+    rows = await repository.list_images(project_id)
+    
+    if not rows:
+        raise HTTPException(status_code=404, detail="项目不存在或没有图片")
+    
+    images = []
+    for row in rows:
+        preview_url = f"/uploads/{project_id}/{row['filename']}"
+        images.append({
+            "id": row["id"],
+            "filename": row["filename"],
+            "original_name": row["original_name"],
+            "file_size": row["file_size"],
+            "width": row["width"],
+            "height": row["height"],
+            "sha256": row["sha256"],
+            "status": row["status"],
+            "gps_lat": row["gps_lat"],
+            "gps_lng": row["gps_lng"],
+            "captured_at": row["captured_at"],
+            "preview_url": preview_url,
+            "thumbnails": thumbnailer.get_urls(project_id, row["sha256"], row["thumbnail_sizes"])
+        })
+    
+    return {"project_id": project_id, "images": images}
 
 
 @router.delete("/project/{project_id}")
 async def delete_project(project_id: str):
     """
     删除项目及其所有文件
+    只写入删除标记后立即返回，文件及数据库记录由后台回收任务分批删除
     """
-    # 删除文件
-    file_handler.delete_project_files(project_id)
-    
-    # 删除数据库记录
-    async with get_db() as db:
-        await db.execute("DELETE FROM issues WHERE detection_id IN (SELECT id FROM detection_results WHERE project_id = ?)", (project_id,))
-        await db.execute("DELETE FROM detection_results WHERE project_id = ?", (project_id,))
-        await db.execute("DELETE FROM images WHERE project_id = ?", (project_id,))
-        await db.execute("DELETE FROM projects WHERE id = ?", (project_id,))
-        await db.commit()
+    await repository.mark_project_deleted(project_id)
+    project_reclaimer.wake()
     
     return {"message": "项目已删除"}
 
@@ -4,10 +4,10 @@
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException
-import sqlite3
-import os
+import json
 from pydantic import BaseModel
 from models import STEP_NAMES
+from repositories import repository
 
 router = APIRouter(prefix="/api/user", tags=["user"])
 
@@ -50,11 +50,6 @@ class UserProfile(BaseModel):
     next_level_info: Optional[dict]
     total_credit_records: int  # 新增：总记录数
 
-def get_db_connection():
-    """获取数据库连接"""
-    db_path = os.path.join(os.path.dirname(__file__), '..', 'inspection.db')
-    return sqlite3.connect(db_path)
-
 def calculate_user_level(total_earned: int) -> str:
     """根据累计获得积分计算用户等级"""
     if total_earned >= 5000: return "VIP 5"
@@ -97,69 +92,46 @@ def calculate_next_level_info(current_level: str, total_earned: int) -> dict:
 @router.get("/profile")
 async def get_user_profile(user_id: int = 1):
     """获取用户个人信息"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     # 获取用户基本信息
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-    user_row = cursor.fetchone()
+    user_row = await repository.get_user(user_id)
     if not user_row:
-        conn.close()
         raise HTTPException(status_code=404, detail="用户不存在")
 
+    # 获取积分记录及步骤快照
+    credit_rows = await repository.list_credit_history(user_id, limit=50)
+    snapshot_rows = await repository.list_snapshots(user_id, limit=10)
+
     user_info = {
-        "id": user_row[0],
-        "name": user_row[1],
-        "email": user_row[2],
-        "avatar": user_row[3],
-        "join_date": user_row[4],
-        "total_projects": user_row[5] or 0,
-        "total_reports": user_row[6] or 0,
-        "last_login": user_row[7] or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        "id": user_row["id"],
+        "name": user_row["name"],
+        "email": user_row["email"],
+        "avatar": user_row["avatar"],
+        "join_date": user_row["join_date"],
+        "total_projects": user_row["total_projects"] or 0,
+        "total_reports": user_row["total_reports"] or 0,
+        "last_login": user_row["last_login"] or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
 
-    # 获取积分记录
-    cursor.execute('''
-        SELECT * FROM credit_history
-        WHERE user_id = ?
-        ORDER BY timestamp DESC
-        LIMIT 50
-    ''', (user_id,))
-
-    credit_rows = cursor.fetchall()
-
-    # 计算统计数据（使用正确的索引）
-    # 数据库表结构: id(0), user_id(1), type(2), amount(3), reason(4), balance_before(5), balance_after(6), timestamp(7), created_at(8)
-    current_credits = user_row[8]  # credits_balance
-    total_used = sum(row[3] for row in credit_rows if row[2] == 'spend')      # row[2]=type, row[3]=amount
-    total_earned = sum(row[3] for row in credit_rows if row[2] == 'earn')     # row[2]=type, row[3]=amount
+    # 计算统计数据（按列名读取，旧库迁移后列顺序可能不同）
+    current_credits = user_row["credits_balance"]
+    total_used = sum(row["amount"] for row in credit_rows if row["type"] == 'spend')
+    total_earned = sum(row["amount"] for row in credit_rows if row["type"] == 'earn')
 
     # 计算用户等级
     level = calculate_user_level(total_earned)
     next_level_info = calculate_next_level_info(level, total_earned)
 
-    # 获取步骤快照
-    cursor.execute('''
-        SELECT id, step_index, step_route, name, created_at
-        FROM step_snapshots
-        WHERE user_id = ?
-        ORDER BY created_at DESC
-        LIMIT 10
-    ''', (user_id,))
-
-    snapshot_rows = cursor.fetchall()
-    snapshots = [
-        {
-            "id": row[0],
-            "step_index": row[1],
-            "step_route": row[2],
-            "step_name": STEP_NAMES.get(row[1], f"步骤 {row[1] + 1}"),
-            "timestamp": row[4],
-            "name": row[3] if row[3] else f"{STEP_NAMES.get(row[1], f'步骤 {row[1] + 1}')} 快照"
-        } for row in snapshot_rows
-    ]
-
-    conn.close()
+    snapshots = []
+    for row in snapshot_rows:
+        step_name = STEP_NAMES.get(row["step_index"], f"步骤 {row['step_index'] + 1}")
+        snapshots.append({
+            "id": row["id"],
+            "step_index": row["step_index"],
+            "step_route": row["step_route"],
+            "step_name": step_name,
+            "timestamp": row["created_at"],
+            "name": row["name"] if row["name"] else f"{step_name} 快照"
+        })
 
     return {
         "user_info": user_info,
@@ -179,52 +151,36 @@ async def get_credit_history(
     page_size: int = 10
 ):
     """获取用户积分历史记录（支持分页）"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    # 分页计算
+    limit = min(page_size, 50)
+    offset = (page - 1) * limit
 
     # 检查用户是否存在
-    cursor.execute('SELECT COUNT(*) FROM users WHERE id = ?', (user_id,))
-    if cursor.fetchone()[0] == 0:
-        conn.close()
+    if not await repository.get_user(user_id):
         raise HTTPException(status_code=404, detail="用户不存在")
 
     # 获取总记录数（最多50条）
-    cursor.execute('SELECT COUNT(*) FROM credit_history WHERE user_id = ?', (user_id,))
-    total_records = min(cursor.fetchone()[0], 50)
-
-    # 分页计算
-    limit = min(page_size, 50)
-    offset = (page - 1) * limit
+    total_records = min(await repository.count_credit_history(user_id), 50)
 
     # 获取分页数据
-    cursor.execute('''
-        SELECT * FROM credit_history
-        WHERE user_id = ?
-        ORDER BY timestamp DESC
-        LIMIT ? OFFSET ?
-    ''', (user_id, limit, offset))
-
-    rows = cursor.fetchall()
+    rows = await repository.list_credit_history(user_id, limit=limit, offset=offset)
 
-    # 转换为字典格式
-    # 数据库表结构: id(0), user_id(1), type(2), amount(3), reason(4), balance_before(5), balance_after(6), timestamp(7), created_at(8)
+    # 转换为字典格式（按列名读取，旧库迁移后列顺序可能不同）
     records = [
         {
-            "id": row[0],
-            "user_id": row[1],
-            "type": row[2],
-            "amount": abs(row[3]),  # 统一返回正数，通过type字段区分消费和获得
-            "reason": row[4],
-            "balance_before": row[5],
-            "balance_after": row[6],
-            "timestamp": row[7]
+            "id": row["id"],
+            "user_id": row["user_id"],
+            "type": row["type"],
+            "amount": abs(row["amount"]),  # 统一返回正数，通过type字段区分消费和获得
+            "reason": row["reason"],
+            "balance_before": row["balance_before"],
+            "balance_after": row["balance_after"],
+            "timestamp": row["timestamp"]
         } for row in rows
     ]
 
     total_pages = (total_records + page_size - 1) // page_size
 
-    conn.close()
-
     return {
         "records": records,
         "pagination": {
@@ -237,104 +193,59 @@ async def get_credit_history(
         }
     }
 
-def add_credit_record(user_id: int, record_type: str, amount: int, reason: str, balance_before: int, balance_after: int):
+async def add_credit_record(user_id: int, record_type: str, amount: int, reason: str, balance_before: int, balance_after: int):
     """添加积分记录到数据库"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     # 使用UTC时间戳
     current_time = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
 
-    cursor.execute('''
-        INSERT INTO credit_history (user_id, type, amount, reason, balance_before, balance_after, timestamp)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, record_type, amount, reason, balance_before, balance_after, current_time))
-
-    # 更新用户积分余额
-    cursor.execute('UPDATE users SET credits_balance = ? WHERE id = ?', (balance_after, user_id))
+    # 同时更新用户积分余额
+    await repository.change_credits(
+        user_id, record_type, amount, reason, balance_before, balance_after, timestamp=current_time
+    )
 
-    conn.commit()
-    conn.close()
-
-def add_credit_record_async(user_id: int, record_type: str, amount: int, reason: str):
+async def add_credit_record_async(user_id: int, record_type: str, amount: int, reason: str):
     """异步添加积分记录"""
-    add_credit_record(user_id, record_type, amount, reason, 0, 0)
+    await add_credit_record(user_id, record_type, amount, reason, 0, 0)
 
 @router.post("/snapshots")
 async def save_snapshot(snapshot: dict, user_id: int = 1):
     """保存步骤快照"""
-    import json
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # 检查是否已存在10条快照，如果有则删除最早的
-    cursor.execute('''
-        SELECT COUNT(*) FROM step_snapshots WHERE user_id = ?
-    ''', (user_id,))
-    count = cursor.fetchone()[0]
-
-    if count >= 10:
-        # 删除最早的快照
-        cursor.execute('''
-            DELETE FROM step_snapshots
-            WHERE id IN (
-                SELECT id FROM step_snapshots
-                WHERE user_id = ?
-                ORDER BY timestamp ASC
-                LIMIT 1
-            )
-        ''', (user_id,))
-
-    # 插入新快照
-    cursor.execute('''
-        INSERT INTO step_snapshots (user_id, step, step_name, image_count, template_name, data)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (
-        user_id,
-        snapshot.get('step', 0),
-        snapshot.get('stepName', ''),
-        snapshot.get('imageCount', 0),
-        snapshot.get('templateName', ''),
-        json.dumps(snapshot.get('data', {}))
-    ))
+    step = snapshot.get('step', 0)
+    if not isinstance(step, int) or isinstance(step, bool) or step not in STEP_NAMES:
+        raise HTTPException(status_code=400, detail=f"无效的步骤: {step}")
 
-    conn.commit()
-    snapshot_id = cursor.lastrowid
-    conn.close()
+    # 每个用户最多保留10条快照，超出时删除最早的
+    row = await repository.create_snapshot(
+        user_id,
+        step,
+        snapshot.get('stepRoute', ''),
+        json.dumps(snapshot.get('data', {})),
+        name=snapshot.get('stepName', ''),
+        description=snapshot.get('templateName', ''),
+        max_per_user=10
+    )
 
-    return {"success": True, "snapshot_id": snapshot_id}
+    return {"success": True, "snapshot_id": row["id"]}
 
 @router.post("/snapshots/{snapshot_id}/restore")
 async def restore_snapshot(snapshot_id: int, user_id: int = 1):
     """恢复步骤快照"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     # 获取快照数据
-    cursor.execute('''
-        SELECT * FROM step_snapshots WHERE id = ? AND user_id = ?
-    ''', (snapshot_id, user_id))
+    row = await repository.get_snapshot(user_id, snapshot_id)
 
-    row = cursor.fetchone()
     if not row:
-        conn.close()
         raise HTTPException(status_code=404, detail="快照不存在")
 
+    data = json.loads(row["snapshot_data"]) if row["snapshot_data"] else {}
     snapshot = {
-        "id": row[0],
-        "user_id": row[1],
-        "step": row[2],
-        "step_name": row[3],
-        "timestamp": row[4],
-        "image_count": row[5],
-        "template_name": row[6],
-        "data": eval(row[7]) if row[7] else {}
+        "id": row["id"],
+        "user_id": row["user_id"],
+        "step": row["step_index"],
+        "step_name": row["name"],
+        "timestamp": row["created_at"],
+        "image_count": len(data.get("uploadedImages", [])),
+        "template_name": row["description"],
+        "data": data
     }
 
-    conn.close()
-
     return {"success": True, "snapshot": snapshot}
-
-if __name__ == "__main__":
-    # 测试函数
-    create_credit_tables(os.path.join(os.path.dirname(__file__), '..', 'inspection.db'))
\ No newline at end of file
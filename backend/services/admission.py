@@ -0,0 +1,196 @@
+"""
+上传准入控制
+按请求声明的字节数限制全局及单用户同时处理中的上传量，
+超出额度的请求排队等待，排队已满或等待超时返回 429
+"""
+import asyncio
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Callable, Dict
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+from config import (
+    UPLOAD_ADMISSION_ENABLED, UPLOAD_MAX_INFLIGHT_BYTES, UPLOAD_MAX_USER_INFLIGHT_BYTES,
+    UPLOAD_UNKNOWN_SIZE_BYTES, UPLOAD_MAX_QUEUED, UPLOAD_QUEUE_TIMEOUT, UPLOAD_RETRY_AFTER
+)
+
+# 需要准入控制的请求方法（携带上传数据）
+ADMITTED_METHODS = {"POST", "PUT"}
+
+
+class AdmissionRejected(Exception):
+    """节点繁忙，拒绝本次请求"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """排队中的请求"""
+    __slots__ = ("user", "size", "future")
+
+    def __init__(self, user: str, size: int, future: asyncio.Future):
+        self.user = user
+        self.size = size
+        self.future = future
+
+
+class AdmissionController:
+    """全局 + 单用户并发字节预算，排队按先到先得分配"""
+
+    def __init__(self, max_bytes: int, max_user_bytes: int, max_queued: int,
+                 queue_timeout: float, retry_after: int):
+        self.max_bytes = max_bytes
+        self.max_user_bytes = min(max_user_bytes, max_bytes)
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.user_in_flight: Dict[str, int] = defaultdict(int)
+        self.waiters: deque = deque()
+        self.rejected = 0
+
+    def _fits_global(self, size: int) -> bool:
+        return self.in_flight + size <= self.max_bytes
+
+    def _fits_user(self, user: str, size: int) -> bool:
+        return self.user_in_flight[user] + size <= self.max_user_bytes
+
+    def _grant(self, user: str, size: int):
+        self.in_flight += size
+        self.user_in_flight[user] += size
+
+    def _wake(self):
+        """按排队顺序放行；队首受全局额度限制时停止，避免大请求被持续插队"""
+        for waiter in list(self.waiters):
+            if waiter.future.done():
+                self.waiters.remove(waiter)
+                continue
+            if not self._fits_global(waiter.size):
+                break
+            if self._fits_user(waiter.user, waiter.size):
+                self.waiters.remove(waiter)
+                self._grant(waiter.user, waiter.size)
+                waiter.future.set_result(True)
+
+    async def acquire(self, user: str, size: int) -> int:
+        """
+        预占额度，返回实际预占的字节数
+        超过单用户上限的请求按上限计（独占该用户额度），保证大文件仍可上传
+        """
+        size = max(1, min(size, self.max_user_bytes))
+
+        if not self.waiters and self._fits_global(size) and self._fits_user(user, size):
+            self._grant(user, size)
+            return size
+
+        if len(self.waiters) >= self.max_queued:
+            self.rejected += 1
+            raise AdmissionRejected("上传队列已满，请稍后重试", self.retry_after)
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(user, size, future)
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+            return size
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # 超时的同时已被放行
+                return size
+            future.cancel()
+            self.rejected += 1
+            raise AdmissionRejected("节点繁忙，上传排队超时", self.retry_after)
+        except asyncio.CancelledError:
+            # 客户端断开：已放行则归还额度
+            if future.done() and not future.cancelled():
+                self.release(user, size)
+            future.cancel()
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            self._wake()
+
+    def release(self, user: str, size: int):
+        """归还额度并唤醒排队请求"""
+        self.in_flight -= size
+        self.user_in_flight[user] -= size
+        if self.user_in_flight[user] <= 0:
+            del self.user_in_flight[user]
+        self._wake()
+
+    @asynccontextmanager
+    async def admit(self, user: str, size: int):
+        """在额度内执行请求"""
+        granted = await self.acquire(user, size)
+        try:
+            yield
+        finally:
+            self.release(user, granted)
+
+    def stats(self) -> dict:
+        """当前准入状态"""
+        return {
+            "in_flight_bytes": self.in_flight,
+            "max_bytes": self.max_bytes,
+            "active_users": len(self.user_in_flight),
+            "queued": len(self.waiters),
+            "rejected": self.rejected
+        }
+
+
+def get_request_user(request: Request) -> str:
+    """识别上传用户：优先使用 X-User-Id 请求头，否则按客户端地址"""
+    user_id = request.headers.get("x-user-id")
+    if user_id:
+        return f"user:{user_id}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def get_request_size(request: Request) -> int:
+    """请求声明的字节数"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        return int(content_length)
+    return UPLOAD_UNKNOWN_SIZE_BYTES
+
+
+# 全局单例
+upload_admission = AdmissionController(
+    max_bytes=UPLOAD_MAX_INFLIGHT_BYTES,
+    max_user_bytes=UPLOAD_MAX_USER_INFLIGHT_BYTES,
+    max_queued=UPLOAD_MAX_QUEUED,
+    queue_timeout=UPLOAD_QUEUE_TIMEOUT,
+    retry_after=UPLOAD_RETRY_AFTER
+)
+
+
+class AdmissionRoute(APIRoute):
+    """
+    带准入控制的路由
+    在读取请求体之前预占额度，避免排队中的请求已把上传数据读入内存或临时文件
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def admitted_handler(request: Request):
+            if not UPLOAD_ADMISSION_ENABLED or request.method not in ADMITTED_METHODS:
+                return await handler(request)
+            try:
+                async with upload_admission.admit(get_request_user(request), get_request_size(request)):
+                    return await handler(request)
+            except AdmissionRejected as e:
+                return JSONResponse(
+                    status_code=429,
+                    content={"detail": e.reason},
+                    headers={"Retry-After": str(e.retry_after)}
+                )
+
+        return admitted_handler
@@ -0,0 +1,105 @@
+"""
+进程内读缓存
+LRU + TTL 淘汰；同一键的并发未命中只执行一次加载（single-flight），
+写入路径显式失效相关键，加载期间发生失效时不缓存加载结果
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class TTLCache:
+    """带过期时间的 LRU 缓存"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.loading: Dict[Hashable, asyncio.Task] = {}
+
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default=None):
+        """读取未过期的缓存值"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            return default
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                          cache_none: bool = False) -> Any:
+        """
+        命中时直接返回，否则调用 loader 加载并缓存
+        同一键已有加载进行中时等待其结果，不重复查询
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            self.hits += 1
+            return value
+
+        # 加载在独立任务中执行，发起方被取消不影响其他等待者
+        task = self.loading.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(loader())
+            self.loading[key] = task
+            task.add_done_callback(lambda done: self._loaded(key, done, cache_none))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _loaded(self, key: Hashable, task: asyncio.Task, cache_none: bool):
+        # 加载期间被失效的结果可能已过时，只返回给等待者不缓存
+        if self.loading.get(key) is not task:
+            return
+        del self.loading[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        value = task.result()
+        if value is not None or cache_none:
+            self.set(key, value)
+
+    def invalidate(self, *keys: Hashable):
+        """失效指定键（包括进行中的加载）"""
+        for key in keys:
+            self.invalidations += 1
+            self.entries.pop(key, None)
+            self.loading.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+        self.loading.clear()
+
+    def stats(self) -> dict:
+        """当前缓存状态"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
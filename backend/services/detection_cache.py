@@ -0,0 +1,122 @@
+"""
+检测结果缓存
+推理结果按（图片SHA-256、模型版本、场景类型、推理参数）持久化缓存：重新检测、切换场景后再切回
+或复制项目时，内容相同的图片直接使用缓存结果，不再解码和推理。
+结果总大小超过上限时淘汰最久未使用的条目；没有SHA-256的图片不缓存
+"""
+import hashlib
+import json
+import logging
+import uuid
+from typing import Dict, List, Sequence, Tuple
+
+from config import DETECTION_CACHE_ENABLED, DETECTION_CACHE_MAX_BYTES, BULK_WRITE_BATCH_SIZE
+from inference import summarize
+from repositories import repository
+
+logger = logging.getLogger(__name__)
+
+
+def params_digest(params: Dict) -> str:
+    """推理参数摘要"""
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class DetectionCache:
+    """检测结果缓存"""
+
+    def __init__(self, max_bytes: int, enabled: bool = True):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        # 缓存总字节数（启动时从数据库读取，之后按写入量累加，淘汰时校正）
+        self.bytes = 0
+
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    async def start(self):
+        if self.enabled:
+            self.bytes = (await repository.get_cache_usage())["bytes"]
+
+    @staticmethod
+    def key(sha256: str, model_version: str, scene_type: str, params: str) -> str:
+        return f"{sha256}:{model_version}:{scene_type}:{params}"
+
+    async def lookup(self, images: Sequence[dict], model_version: str, scene_type: str,
+                     params: Dict) -> Tuple[List[Dict], List[dict]]:
+        """返回命中缓存的检测结果及需要推理的图片"""
+        if not self.enabled:
+            return [], list(images)
+
+        digest = params_digest(params)
+        keys = {image["id"]: self.key(image["sha256"], model_version, scene_type, digest)
+                for image in images if image.get("sha256")}
+        cached = await repository.get_cached_results(list(set(keys.values()))) if keys else {}
+
+        detections, misses = [], []
+        for image in images:
+            result = cached.get(keys.get(image["id"]))
+            if result is None:
+                misses.append(image)
+                continue
+            result = json.loads(result)
+            # 问题ID全局唯一，复用缓存结果时重新生成
+            for issue in result["issues"]:
+                issue["id"] = f"issue-{uuid.uuid4().hex[:8]}"
+            detections.append(summarize(image["id"], result))
+
+        self.hits += len(detections)
+        self.misses += len(misses)
+        return detections, misses
+
+    async def store(self, images: Sequence[dict], detections: Sequence[Dict], model_version: str,
+                    scene_type: str, params: Dict):
+        """缓存新推理的结果，超出容量时淘汰"""
+        if not self.enabled or not detections:
+            return
+
+        digest = params_digest(params)
+        sha256 = {image["id"]: image.get("sha256") for image in images}
+        entries = {}
+        for detection in detections:
+            if sha256.get(detection["image_id"]):
+                key = self.key(sha256[detection["image_id"]], model_version, scene_type, digest)
+                entries[key] = json.dumps(
+                    {"confidence": detection["confidence"], "issues": detection["issues"]}, ensure_ascii=False
+                )
+        if not entries:
+            return
+
+        await repository.save_cached_results(entries)
+        self.stores += len(entries)
+        self.bytes += sum(len(result.encode()) for result in entries.values())
+        if self.bytes > self.max_bytes:
+            await self.evict()
+
+    async def evict(self):
+        """淘汰最久未使用的条目，直到总大小降到上限的 90%"""
+        result = await repository.evict_cached_results(int(self.max_bytes * 0.9), BULK_WRITE_BATCH_SIZE)
+        self.evictions += result["evicted"]
+        self.bytes = result["bytes"]
+        logger.info("检测结果缓存淘汰 %d 条，剩余 %d 字节", result["evicted"], result["bytes"])
+
+    def stats(self) -> dict:
+        """缓存命中及容量统计"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes
+        }
+
+
+# 全局检测结果缓存
+detection_cache = DetectionCache(DETECTION_CACHE_MAX_BYTES, enabled=DETECTION_CACHE_ENABLED)
@@ -0,0 +1,251 @@
+"""
+后台检测任务
+检测请求只创建任务并返回任务ID；工作任务按图片ID顺序分批处理：命中检测结果缓存的图片直接使用缓存结果，
+其余图片交给检测工作进程解码和推理，每批结果写入后记录进度
+（已处理数及最后一张图片ID）。每个项目同时只有一个未完成的任务，重复提交时返回该任务；
+任务可取消，取消或失败的任务可继续执行。执行前先领取任务并持有租约，执行期间定期续约，
+多个API进程共用数据库时同一任务只由一个进程执行；启动时及运行期间定期领取排队中和租约到期的任务
+（执行进程已退出），从记录的位置继续
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import List, Optional, Set, Tuple
+
+from config import (
+    DETECTION_JOB_WORKERS, DETECTION_JOB_BATCH_SIZE, DETECTION_JOB_LEASE_SECONDS, DETECTION_PROCESS_WORKERS,
+    INFERENCE_BACKEND, ONNX_THREADS
+)
+from inference import inference_backend
+from repositories import repository
+from services.detection_cache import DetectionCache, detection_cache
+from services.detection_workers import DetectionWorkerPool
+from services.detection_writer import detection_writer
+
+logger = logging.getLogger(__name__)
+
+# 未结束（需要执行）的任务状态
+UNFINISHED_STATUSES = ("queued", "running")
+
+
+class DetectionJobRunner:
+    """检测任务工作池"""
+
+    def __init__(self, pool: DetectionWorkerPool, cache: DetectionCache, workers: int, batch_size: int,
+                 lease_seconds: int):
+        self.pool = pool
+        self.cache = cache
+        self.worker_count = max(1, workers)
+        self.batch_size = batch_size
+        self.lease_seconds = max(1, lease_seconds)
+        # 租约的执行者标识，区分共用数据库的各个进程
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.sweeper: Optional[asyncio.Task] = None
+        # 本进程中已排队及正在执行的任务
+        self.pending: Set[str] = set()
+        self.active: Set[str] = set()
+
+        # 统计
+        self.completed_jobs = 0
+        self.failed_jobs = 0
+        self.attached_requests = 0
+        self.processed_images = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self.workers)
+
+    async def start(self):
+        """加载模型，启动工作任务并领取排队中及租约到期的任务"""
+        if self.running:
+            return
+        await self.pool.start()
+        await self.cache.start()
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.create_task(self._work()) for _ in range(self.worker_count)]
+        await self.enqueue_claimable()
+        self.sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        """
+        停止工作任务；执行中的任务保持 running 状态并释放租约，
+        下次启动后（或由其他进程）从记录的位置继续
+        """
+        if not self.running:
+            return
+        active = list(self.active)
+        for task in [*self.workers, self.sweeper]:
+            task.cancel()
+        await asyncio.gather(*self.workers, self.sweeper, return_exceptions=True)
+        self.workers = []
+        self.sweeper = None
+        self.queue = None
+        self.pending.clear()
+        for job_id in active:
+            await repository.renew_detection_job(job_id, self.owner, 0)
+        await self.pool.stop()
+
+    async def submit(self, project_id: str, scene_type: str, force: bool = False) -> Tuple[dict, bool]:
+        """
+        创建检测任务并排队，返回 (任务记录, 是否为新任务)；
+        项目已有未完成的任务时不再创建，返回该任务
+        """
+        job = await repository.get_active_detection_job(project_id)
+        if job is None:
+            total = await repository.count_images_to_detect(project_id, force=force)
+            job_id = uuid.uuid4().hex
+            job = await repository.create_detection_job(job_id, project_id, scene_type, force, total)
+            if job["id"] == job_id:
+                self.enqueue(job_id)
+                return job, True
+        self.attached_requests += 1
+        return job, False
+
+    def enqueue(self, job_id: str):
+        # 工作池未启动时任务保持排队状态，启动后恢复执行
+        if self.queue is not None and job_id not in self.pending:
+            self.pending.add(job_id)
+            self.queue.put_nowait(job_id)
+
+    async def enqueue_claimable(self):
+        """排队所有可领取的任务（排队中，或执行进程已退出、租约到期的任务）"""
+        for job in await repository.list_claimable_detection_jobs(limit=10000):
+            if job["id"] not in self.active:
+                self.enqueue(job["id"])
+
+    async def _sweep(self):
+        """每个租约周期检查一次其他进程遗留的任务"""
+        while True:
+            await asyncio.sleep(self.lease_seconds)
+            try:
+                await self.enqueue_claimable()
+            except Exception:
+                logger.exception("检查可领取的检测任务失败")
+
+    async def _heartbeat(self, job_id: str):
+        """执行期间每三分之一个租约周期续约一次，任务已不由本进程执行时停止"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await repository.renew_detection_job(job_id, self.owner, self.lease_seconds):
+                    return
+            except Exception:
+                logger.exception("检测任务续约失败: %s", job_id)
+
+    async def cancel(self, job_id: str) -> bool:
+        """取消排队中或执行中的任务（执行中的任务在当前批次完成后停止）"""
+        return await repository.update_detection_job(job_id, expected=UNFINISHED_STATUSES, status="cancelled")
+
+    async def resume(self, job_id: str) -> bool:
+        """继续已取消或失败的任务；任务仍在停止中或项目已有未完成的任务时返回 False"""
+        if job_id in self.active:
+            return False
+        resumed = await repository.update_detection_job(
+            job_id, expected=("cancelled", "failed"), status="queued", error=None
+        )
+        if resumed:
+            self.enqueue(job_id)
+        return resumed
+
+    async def _work(self):
+        while True:
+            job_id = await self.queue.get()
+            self.pending.discard(job_id)
+            if job_id in self.active:
+                continue
+            self.active.add(job_id)
+            try:
+                await self.run_job(job_id)
+            except Exception as e:
+                self.failed_jobs += 1
+                logger.exception("检测任务失败: %s", job_id)
+                await repository.update_detection_job(
+                    job_id, expected=("running",), owner=self.owner, status="failed", error=str(e)
+                )
+            finally:
+                self.active.discard(job_id)
+
+    async def run_job(self, job_id: str):
+        """
+        领取任务并从记录的位置继续执行，直到全部图片处理完、任务被取消或被其他进程接手；
+        任务由其他进程持有（租约未到期）或已结束时直接返回
+        """
+        job = await repository.claim_detection_job(job_id, self.owner, self.lease_seconds)
+        if job is None:
+            return
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            await self._execute(job)
+        finally:
+            heartbeat.cancel()
+
+    async def _execute(self, job: dict):
+        job_id = job["id"]
+        project_id = job["project_id"]
+        if not await repository.get_project(project_id):
+            await repository.update_detection_job(
+                job_id, expected=("running",), owner=self.owner, status="failed", error="项目不存在"
+            )
+            return
+
+        scene_type = job["scene_type"]
+        params = self.pool.backend.cache_params()
+        processed = job["processed_images"]
+        after = job["last_image_id"]
+        while True:
+            images = await repository.list_images_to_detect(
+                project_id, force=bool(job["force"]), after=after, limit=self.batch_size
+            )
+            if not images:
+                break
+
+            results, misses = await self.cache.lookup(images, self.pool.model_version, scene_type, params)
+            if misses:
+                detected = await self.pool.detect(misses, scene_type)
+                await self.cache.store(misses, detected, self.pool.model_version, scene_type, params)
+                results += detected
+            # 经写入队列与其他任务的检测结果合并写入
+            if results:
+                await detection_writer.submit(project_id, results)
+
+            processed += len(images)
+            after = images[-1]["id"]
+            self.processed_images += len(images)
+            if not await repository.update_detection_job(
+                job_id, expected=("running",), owner=self.owner, processed_images=processed, last_image_id=after
+            ):
+                # 任务已被取消，或租约到期后已由其他进程接手
+                return
+
+        if await repository.update_detection_job(
+            job_id, expected=("running",), owner=self.owner, status="completed"
+        ):
+            self.completed_jobs += 1
+            await repository.update_project(project_id, status="detected")
+
+    def stats(self) -> dict:
+        """当前任务执行状态"""
+        return {
+            "running": self.running,
+            "owner": self.owner,
+            "workers": self.worker_count,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "active_jobs": len(self.active),
+            "completed_jobs": self.completed_jobs,
+            "failed_jobs": self.failed_jobs,
+            "attached_requests": self.attached_requests,
+            "processed_images": self.processed_images,
+            "inference": self.pool.stats()
+        }
+
+
+# 全局检测任务工作池
+detection_jobs = DetectionJobRunner(
+    DetectionWorkerPool(inference_backend, INFERENCE_BACKEND, workers=DETECTION_PROCESS_WORKERS,
+                        buffers=DETECTION_JOB_WORKERS, threads=ONNX_THREADS),
+    detection_cache,
+    workers=DETECTION_JOB_WORKERS, batch_size=DETECTION_JOB_BATCH_SIZE, lease_seconds=DETECTION_JOB_LEASE_SECONDS)
@@ -0,0 +1,262 @@
+"""
+检测工作进程池
+图片解码与推理在独立进程中执行，API 进程只负责调度和写入结果：
+每批图片由多个工作进程从 file_path 并行解码，直接写入共享内存中的批次缓冲区，
+再由一个工作进程从同一缓冲区读取整批数据推理；图片数据不经 pickle 在进程间复制，
+进程间只传递文件路径、槽位序号和问题列表。
+分块推理时每张图片由一个工作进程解码、切块并分批推理，分块不离开该进程
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from inference import InferenceBackend, create_backend, decode_image, summarize
+
+logger = logging.getLogger(__name__)
+
+# ============ 工作进程 ============
+
+# 工作进程中的推理后端及已映射的共享内存
+_backend: Optional[InferenceBackend] = None
+_attached: Dict[str, SharedMemory] = {}
+
+
+def _init_worker(backend: str, batch_size: int, threads: int, tiling: bool):
+    """工作进程初始化：加载模型并预热"""
+    global _backend
+    _backend = create_backend(backend, batch_size, threads, tiling)
+    _backend.load()
+    _backend.warmup()
+
+
+def _model_version() -> str:
+    return _backend.model_version
+
+
+def _batch_view(name: str, size: int) -> np.ndarray:
+    """将共享内存映射为 [槽位, size, size, 3] 的数组（不复制）"""
+    shm = _attached.get(name)
+    if shm is None:
+        # 缓冲区由 API 进程创建和释放，工作进程只映射（spawn 的子进程与 API 进程共用资源跟踪进程）
+        shm = SharedMemory(name=name)
+        _attached[name] = shm
+    return np.ndarray((shm.size // (size * size * 3), size, size, 3), dtype=np.uint8, buffer=shm.buf)
+
+
+def _decode_into(name: str, slot: int, path: str, size: int) -> Optional[str]:
+    """解码图片写入缓冲区的 slot 槽位，失败时返回错误信息"""
+    try:
+        _batch_view(name, size)[slot] = decode_image(path, size)
+    except Exception as e:
+        return str(e)
+    return None
+
+
+def _detect_tiled(path: str, scene_type: str, key: str) -> Tuple[Optional[tuple], Optional[str]]:
+    """解码单张图片并分块推理；解码失败时返回错误信息"""
+    try:
+        frame, tile = _backend.tiler.open(path, _backend.input_size)
+    except Exception as e:
+        return None, str(e)
+    return _backend.tiler.detect(_backend, frame, tile, scene_type, key=key), None
+
+
+def _infer_slots(name: str, slots: List[int], size: int, scene_type: str,
+                 keys: List[str]) -> Tuple[List[Dict], float]:
+    """对缓冲区中指定槽位的图片（图片ID为 keys）整批推理，返回推理结果及耗时"""
+    view = _batch_view(name, size)
+    started = time.perf_counter()
+    results = _backend.infer_batch([view[slot] for slot in slots], scene_type, keys=keys)
+    return results, time.perf_counter() - started
+
+
+# ============ API 进程 ============
+
+class DetectionWorkerPool:
+    """检测解码与推理的调度"""
+
+    def __init__(self, backend: InferenceBackend, backend_name: str, workers: int,
+                 buffers: int, threads: int = 0):
+        self.backend = backend
+        self.backend_name = backend_name
+        self.worker_count = workers
+        self.buffer_count = max(1, buffers)
+        # 未指定推理线程数时按CPU核数在工作进程间平分
+        self.threads = threads or max(1, (os.cpu_count() or 1) // max(1, workers))
+        self.executor: Optional[ProcessPoolExecutor] = None
+        # 进程池重建次数，用于只重建一次已损坏的进程池
+        self.generation = 0
+        self.buffers: List[SharedMemory] = []
+        self.free: Optional[asyncio.Queue] = None
+        self.model_version = backend.model_version
+
+    @property
+    def running(self) -> bool:
+        return self.executor is not None or (self.worker_count <= 0 and self.backend.loaded)
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # 使用spawn避免在持有数据库线程的进程中fork
+        return ProcessPoolExecutor(
+            max_workers=self.worker_count,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.backend_name, self.backend.batch_size, self.threads, self.backend.tiler is not None)
+        )
+
+    async def start(self):
+        """启动工作进程并加载模型（模型加载失败时抛出异常）"""
+        if self.running:
+            return
+        loop = asyncio.get_running_loop()
+        if self.worker_count <= 0:
+            await loop.run_in_executor(None, self.backend.load)
+            await loop.run_in_executor(None, self.backend.warmup)
+            self.model_version = self.backend.model_version
+            return
+
+        # 分块推理时分块只在工作进程内使用，不需要批次缓冲区
+        size = self.backend.input_size
+        if self.backend.tiler is None:
+            self.buffers = [SharedMemory(create=True, size=self.backend.batch_size * size * size * 3)
+                            for _ in range(self.buffer_count)]
+        self.free = asyncio.Queue()
+        for shm in self.buffers:
+            self.free.put_nowait(shm)
+        self.executor = self._create_executor()
+        try:
+            self.model_version = await loop.run_in_executor(self.executor, _model_version)
+        except BaseException:
+            await self.stop()
+            raise
+        self.backend.loaded = True
+
+    async def stop(self):
+        """停止工作进程并释放共享内存"""
+        if self.executor is not None:
+            executor, self.executor = self.executor, None
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+        for shm in self.buffers:
+            shm.close()
+            shm.unlink()
+        self.buffers = []
+        self.free = None
+        self.backend.loaded = False
+
+    async def detect(self, images: Sequence[dict], scene_type: str) -> List[Dict]:
+        """解码并推理一批图片（{"id", "file_path"}），返回检测结果；无法解码的图片跳过"""
+        if self.worker_count <= 0:
+            return await asyncio.get_running_loop().run_in_executor(None, self.backend.detect, images, scene_type)
+
+        if self.backend.tiler is not None:
+            return await self._detect_tiled(images, scene_type)
+
+        detections = []
+        for start in range(0, len(images), self.backend.batch_size):
+            detections += await self._detect_batch(images[start:start + self.backend.batch_size], scene_type)
+        return detections
+
+    async def _detect_batch(self, images: Sequence[dict], scene_type: str) -> List[Dict]:
+        size = self.backend.input_size
+        shm = await self.free.get()
+        futures: List[Future] = []
+        try:
+            # 逐个记录已提交的任务，提交中途失败时归还缓冲区前仍会等待已提交的解码结束
+            for slot, image in enumerate(images):
+                futures.append(self._submit(_decode_into, shm.name, slot, image["file_path"], size))
+            errors = await asyncio.gather(*map(self._result, futures))
+
+            slots = []
+            for slot, (image, error) in enumerate(zip(images, errors)):
+                if error is None:
+                    slots.append(slot)
+                else:
+                    self.backend.record_decode_failure(image["id"], error)
+            if not slots:
+                return []
+
+            keys = [images[slot]["id"] for slot in slots]
+            futures.append(self._submit(_infer_slots, shm.name, slots, size, scene_type, keys))
+            results, elapsed = await self._result(futures[-1])
+        except BaseException:
+            # 尚未开始执行的任务不再执行
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            self._release(shm, futures)
+
+        self.backend.record(len(slots), elapsed)
+        return [summarize(images[slot]["id"], result) for slot, result in zip(slots, results)]
+
+    async def _detect_tiled(self, images: Sequence[dict], scene_type: str) -> List[Dict]:
+        # 各图片分别交给一个工作进程，全部进程同时处理不同图片
+        futures = [self._submit(_detect_tiled, image["file_path"], scene_type, image["id"]) for image in images]
+        outcomes = await asyncio.gather(*map(self._result, futures))
+
+        detections = []
+        for image, (outcome, error) in zip(images, outcomes):
+            if error is not None:
+                self.backend.record_decode_failure(image["id"], error)
+                continue
+            result, tiles, batches, seconds = outcome
+            self.backend.record(1, seconds, batches=batches, tiles=tiles)
+            detections.append(summarize(image["id"], result))
+        return detections
+
+    def _submit(self, func, *args) -> Future:
+        generation = self.generation
+        try:
+            future = self.executor.submit(func, *args)
+        except BrokenProcessPool:
+            self._restart(generation)
+            raise
+        future.generation = generation
+        return future
+
+    async def _result(self, future: Future):
+        try:
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            self._restart(future.generation)
+            raise
+
+    def _restart(self, generation: int):
+        """工作进程异常退出时重建进程池（其他批次已重建过时跳过）"""
+        if generation != self.generation or self.executor is None:
+            return
+        broken, self.executor = self.executor, self._create_executor()
+        self.generation += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        logger.warning("检测工作进程异常退出，已重建进程池")
+
+    def _release(self, shm: SharedMemory, futures: List[Future]):
+        """缓冲区在使用它的解码/推理全部结束后才归还（任务被取消时工作进程可能仍在写入）"""
+        if all(future.done() for future in futures):
+            self.free.put_nowait(shm)
+            return
+        loop = asyncio.get_running_loop()
+        free = self.free
+
+        def release_later():
+            wait(futures)
+            loop.call_soon_threadsafe(free.put_nowait, shm)
+
+        loop.run_in_executor(None, release_later)
+
+    def stats(self) -> dict:
+        """推理及工作进程状态"""
+        return {
+            **self.backend.stats(),
+            "model_version": self.model_version,
+            "processes": max(0, self.worker_count),
+            "threads_per_process": self.threads if self.worker_count > 0 else None,
+            "free_buffers": self.free.qsize() if self.free is not None else 0
+        }
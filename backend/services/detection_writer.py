@@ -0,0 +1,199 @@
+"""
+检测结果写入队列
+检测请求将结果批次放入有界队列，由单个写入任务合并后以少量大事务写入数据库，
+避免多个项目同时检测时写连接互相争用；应用退出前写完队列中的全部批次
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import DETECTION_WRITE_QUEUE_SIZE, DETECTION_WRITE_MAX_BATCH, DETECTION_WRITE_LINGER_MS
+from repositories import repository
+
+logger = logging.getLogger(__name__)
+
+
+class _Batch:
+    """排队中的检测结果批次"""
+    __slots__ = ("project_id", "detections", "future", "enqueued_at")
+
+    def __init__(self, project_id: str, detections: List[dict], future: asyncio.Future):
+        self.project_id = project_id
+        self.detections = detections
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+def merge_batches(batches: List[_Batch]) -> Dict[str, List[dict]]:
+    """按项目合并批次；同一图片出现多次时保留最后一次的结果"""
+    merged: Dict[str, Dict[str, dict]] = {}
+    for batch in batches:
+        by_image = merged.setdefault(batch.project_id, {})
+        for detection in batch.detections:
+            by_image.pop(detection["image_id"], None)
+            by_image[detection["image_id"]] = detection
+    return {project_id: list(by_image.values()) for project_id, by_image in merged.items()}
+
+
+class DetectionWriter:
+    """单写入者批量写入检测结果"""
+
+    def __init__(self, max_queued: int, max_batch: int, linger_ms: int):
+        self.max_queued = max_queued
+        self.max_batch = max_batch
+        self.linger = linger_ms / 1000
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+
+        # 统计
+        self.flushes = 0
+        self.flushed_batches = 0
+        self.flushed_detections = 0
+        self.failed_batches = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.last_wait_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self):
+        """启动写入任务"""
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_queued)
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """写完队列中已有的批次后停止写入任务"""
+        if not self.running:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+
+    async def submit(self, project_id: str, detections: List[dict]):
+        """
+        提交一个项目的检测结果，写入完成（或失败）后返回
+        队列已满时等待；写入任务未启动时直接写入
+        """
+        if not detections:
+            return
+        if not self.running:
+            await repository.save_detections(project_id, detections)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(_Batch(project_id, detections, future))
+        # 提交方取消等待不影响写入
+        await asyncio.shield(future)
+
+    async def _collect(self, first: _Batch) -> Tuple[List[_Batch], bool]:
+        """在等待窗口内收集更多批次，返回批次列表及是否收到停止信号"""
+        batches = [first]
+        count = len(first.detections)
+        deadline = time.perf_counter() + self.linger
+
+        while count < self.max_batch:
+            try:
+                batch = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if batch is None:
+                return batches, True
+            batches.append(batch)
+            count += len(batch.detections)
+
+        return batches, False
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self.queue.get()
+            if first is None:
+                break
+            batches, stopping = await self._collect(first)
+            await self._flush(batches)
+
+        # 停止信号之后不会再有新批次入队，写完剩余批次
+        remaining = []
+        while not self.queue.empty():
+            batch = self.queue.get_nowait()
+            if batch is not None:
+                remaining.append(batch)
+        if remaining:
+            await self._flush(remaining)
+
+    async def _flush(self, batches: List[_Batch]):
+        started = time.perf_counter()
+        merged = merge_batches(batches)
+        # 按目标数据库分组写入，一组失败只影响该组项目的批次
+        errors: Dict[str, Exception] = {}
+        try:
+            groups = await repository.group_detection_batches(list(merged))
+        except Exception as e:
+            groups = []
+            errors = dict.fromkeys(merged, e)
+        for group in groups:
+            try:
+                await repository.save_detection_batches({project_id: merged[project_id] for project_id in group})
+            except Exception as e:
+                logger.exception("检测结果写入失败: %d 个项目", len(group))
+                errors.update(dict.fromkeys(group, e))
+
+        failed = [batch for batch in batches if batch.project_id in errors]
+        written = [batch for batch in batches if batch.project_id not in errors]
+        self.failed_batches += len(failed)
+        for batch in failed:
+            if not batch.future.done():
+                batch.future.set_exception(errors[batch.project_id])
+        if not written:
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.flushed_batches += len(written)
+        self.flushed_detections += sum(
+            len(detections) for project_id, detections in merged.items() if project_id not in errors
+        )
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+        self.last_wait_ms = (started - batches[0].enqueued_at) * 1000
+
+        for batch in written:
+            if not batch.future.done():
+                batch.future.set_result(None)
+
+    def stats(self) -> dict:
+        """当前写入队列状态"""
+        return {
+            "running": self.running,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_queued": self.max_queued,
+            "flushes": self.flushes,
+            "flushed_batches": self.flushed_batches,
+            "flushed_detections": self.flushed_detections,
+            "failed_batches": self.failed_batches,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "last_queue_wait_ms": round(self.last_wait_ms, 2)
+        }
+
+
+# 全局写入队列
+detection_writer = DetectionWriter(
+    max_queued=DETECTION_WRITE_QUEUE_SIZE,
+    max_batch=DETECTION_WRITE_MAX_BATCH,
+    linger_ms=DETECTION_WRITE_LINGER_MS
+)
@@ -1,22 +1,66 @@
 """
 文件处理服务
 """
+import io
 import os
 import uuid
+import shutil
+import asyncio
+import hashlib
+import lzma
+import tarfile
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from typing import Optional, Tuple
+from typing import AsyncIterator, List, Optional, Tuple
 import aiofiles
 
 
+# 读取损坏、截断、加密或使用不支持的压缩方式的压缩包时标准库抛出的异常
+# （bz2/gzip 数据损坏时抛出 OSError）
+ARCHIVE_READ_ERRORS = (
+    zipfile.BadZipFile, tarfile.TarError, zlib.error, lzma.LZMAError,
+    EOFError, OSError, RuntimeError, NotImplementedError
+)
+
+
+class ArchiveError(Exception):
+    """压缩包无法读取"""
+
+
+def read_archive(func, *args):
+    """执行压缩包的读取操作，读取异常转换为 ArchiveError（只包裹标准库调用，不掩盖其他错误）"""
+    try:
+        return func(*args)
+    except ARCHIVE_READ_ERRORS as e:
+        raise ArchiveError(str(e) or type(e).__name__) from e
+
+
 class FileHandler:
     """文件处理器"""
     
     ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp', '.webp'}
+    ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+    CHUNK_SIZE = 1024 * 1024  # 流式写入的分块大小 1MB
+    PROBE_HEADER_SIZE = 64 * 1024  # 用于解析图片尺寸的文件头大小
+    PROJECT_DIR_PREFIX = "PRJ-"  # 项目目录名前缀（与项目ID一致）
     
-    def __init__(self, upload_dir: str):
+    def __init__(self, upload_dir: str, content_addressed: bool = False, probe_workers: int = 4):
         self.upload_dir = upload_dir
+        # 临时文件目录，与上传目录同一文件系统以保证原子重命名
+        self.temp_dir = os.path.join(upload_dir, ".tmp")
+        # 内容寻址存储：blob按SHA-256存放，项目目录中为指向blob的硬链接
+        self.content_addressed = content_addressed
+        self.blob_dir = os.path.join(upload_dir, ".blobs")
+        # 断点续传会话文件目录
+        self.session_dir = os.path.join(upload_dir, ".sessions")
+        # 图片解析线程池，限制并发避免阻塞事件循环
+        self.probe_executor = ThreadPoolExecutor(max_workers=probe_workers, thread_name_prefix="image-probe")
         os.makedirs(upload_dir, exist_ok=True)
+        os.makedirs(self.temp_dir, exist_ok=True)
+        os.makedirs(self.session_dir, exist_ok=True)
     
     def is_allowed_file(self, filename: str) -> bool:
         """检查文件扩展名是否允许"""
@@ -34,42 +78,292 @@ class FileHandler:
         os.makedirs(project_dir, exist_ok=True)
         return project_dir
     
+    def get_blob_path(self, sha256: str) -> str:
+        """获取内容寻址存储中blob的路径"""
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+    
+    def link_blob(self, temp_path: str, sha256: str, file_path: str) -> Tuple[bool, bool]:
+        """
+        将临时文件存入blob存储，并在项目目录建立硬链接
+        返回 (内容是否已存在即是否去重, 项目目录中的条目是否为本次新建)
+        """
+        blob_path = self.get_blob_path(sha256)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        
+        try:
+            try:
+                os.link(blob_path, file_path)
+                return True, True
+            except FileExistsError:
+                # 同一项目中已有相同内容的条目
+                return True, False
+            except FileNotFoundError:
+                pass
+            
+            # blob不存在（或刚被回收任务删除）：先由临时文件建立项目中的链接，再放入blob存储，
+            # 回收任务只删除没有项目引用的blob，上传的内容不会在两步之间丢失
+            try:
+                os.link(temp_path, file_path)
+            except FileExistsError:
+                return True, False
+            try:
+                os.link(temp_path, blob_path)
+            except FileExistsError:
+                # 并发上传的相同内容已放入blob存储
+                pass
+            return False, True
+        except OSError:
+            # 文件系统不支持硬链接时直接放入项目目录（无法去重）
+            os.replace(temp_path, file_path)
+            return False, True
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
     async def save_file(self, file_content: bytes, project_id: str, original_name: str) -> dict:
         """
-        保存上传的文件
+        保存内存中的文件内容
+        返回文件信息
+        """
+        async def single_chunk():
+            yield file_content
+        
+        return await self.save_stream(single_chunk(), project_id, original_name)
+    
+    async def save_upload(self, upload, project_id: str) -> dict:
+        """
+        分块读取上传文件并保存，不在内存中缓存整个文件
+        upload 为任意提供 async read(size) 的对象（如 UploadFile）
+        """
+        return await self.save_stream(self.iter_chunks(upload), project_id, upload.filename)
+    
+    async def iter_chunks(self, upload) -> AsyncIterator[bytes]:
+        """按 CHUNK_SIZE 分块读取上传文件"""
+        while True:
+            chunk = await upload.read(self.CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    
+    async def save_stream(self, chunks: AsyncIterator[bytes], project_id: str, original_name: str) -> dict:
+        """
+        流式保存文件
+        边写入临时文件边校验大小、计算SHA-256，完成后原子重命名到项目目录
         返回文件信息
         """
         # 检查文件类型
         if not self.is_allowed_file(original_name):
             raise ValueError(f"不支持的文件类型: {original_name}")
         
-        # 检查文件大小
-        if len(file_content) > self.MAX_FILE_SIZE:
+        # 生成临时文件路径
+        temp_path = os.path.join(self.temp_dir, f"{self.generate_filename(original_name)}.part")
+        
+        hasher = hashlib.sha256()
+        file_size = 0
+        header = b""
+        
+        try:
+            async with aiofiles.open(temp_path, 'wb') as f:
+                async for chunk in chunks:
+                    file_size += len(chunk)
+                    # 边接收边检查文件大小
+                    if file_size > self.MAX_FILE_SIZE:
+                        raise ValueError(f"文件过大: {original_name}")
+                    hasher.update(chunk)
+                    # 保留文件头用于解析图片尺寸，避免再次打开文件
+                    if len(header) < self.PROBE_HEADER_SIZE:
+                        header += chunk[:self.PROBE_HEADER_SIZE - len(header)]
+                    await f.write(chunk)
+            
+            return await self.commit_file(temp_path, hasher.hexdigest(), file_size, header,
+                                          project_id, original_name)
+        except BaseException:
+            self.delete_file(temp_path)
+            raise
+    
+    async def save_local_file(self, source_path: str, project_id: str, original_name: str,
+                              expected_sha256: Optional[str] = None) -> dict:
+        """
+        将本地已存在的文件（如断点续传拼装完成的文件）移入项目目录
+        哈希计算在线程池中执行；传入 expected_sha256 时校验不一致则不移动文件
+        """
+        if not self.is_allowed_file(original_name):
+            raise ValueError(f"不支持的文件类型: {original_name}")
+        
+        file_size = os.path.getsize(source_path)
+        if file_size > self.MAX_FILE_SIZE:
             raise ValueError(f"文件过大: {original_name}")
         
-        # 生成文件名和路径
-        filename = self.generate_filename(original_name)
+        loop = asyncio.get_running_loop()
+        sha256, header = await loop.run_in_executor(self.probe_executor, self.hash_file, source_path)
+        if expected_sha256 and sha256 != expected_sha256.lower():
+            raise ValueError("文件校验失败，SHA-256不匹配")
+        return await self.commit_file(source_path, sha256, file_size, header, project_id, original_name,
+                                      restore_path=source_path)
+    
+    def withdraw_file(self, file_path: str, sha256: str, created: bool, restore_path: Optional[str] = None):
+        """
+        撤回 commit_file 放入项目目录的文件
+        传入 restore_path 时内容放回该路径：文件与blob或其他条目共用时复制一份，之后写入不会改动共用的内容；
+        项目目录中的条目只在由本次新建时删除，随后回收不再被引用的blob
+        """
+        if restore_path is not None:
+            if created and os.stat(file_path).st_nlink == 1:
+                os.replace(file_path, restore_path)
+            else:
+                shutil.copyfile(file_path, restore_path)
+        if created:
+            self.delete_file(file_path)
+        if self.content_addressed:
+            self.release_blobs([sha256])
+    
+    def hash_file(self, file_path: str) -> Tuple[str, bytes]:
+        """计算文件SHA-256，同时返回文件头"""
+        hasher = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            header = f.read(self.PROBE_HEADER_SIZE)
+            hasher.update(header)
+            for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest(), header
+    
+    async def commit_file(self, temp_path: str, sha256: str, file_size: int, header: bytes,
+                          project_id: str, original_name: str, restore_path: Optional[str] = None) -> dict:
+        """
+        将已写完的临时文件放入项目目录并解析图片信息
+        返回文件信息；中途失败时撤回已放入的文件（传入 restore_path 时内容放回该路径）
+        """
+        ext = os.path.splitext(original_name)[1].lower()
         project_dir = self.get_project_dir(project_id)
-        file_path = os.path.join(project_dir, filename)
         
-        # 保存文件
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(file_content)
+        deduplicated = False
+        created = True
+        if self.content_addressed:
+            # 内容寻址模式下文件名即内容哈希，重复内容只保存一份
+            filename = f"{sha256}{ext}"
+            file_path = os.path.join(project_dir, filename)
+            deduplicated, created = self.link_blob(temp_path, sha256, file_path)
+        else:
+            # 原子重命名到项目目录
+            filename = self.generate_filename(original_name)
+            file_path = os.path.join(project_dir, filename)
+            os.replace(temp_path, file_path)
         
         # 获取图片信息
-        width, height = self.get_image_dimensions(file_path)
+        try:
+            width, height = await self.probe_dimensions(file_path, header)
+        except BaseException:
+            self.withdraw_file(file_path, sha256, created, restore_path)
+            raise
         
         return {
             "id": uuid.uuid4().hex,
             "filename": filename,
             "original_name": original_name,
             "file_path": file_path,
-            "file_size": len(file_content),
+            "file_size": file_size,
+            "sha256": sha256,
+            "deduplicated": deduplicated,
+            "created": created,
             "width": width,
             "height": height,
             "preview_url": f"/uploads/{project_id}/{filename}"
         }
     
+    # ============ 压缩包导入 ============
+    
+    def is_archive(self, filename: str) -> bool:
+        """检查是否为支持的压缩包格式"""
+        return filename.lower().endswith(self.ARCHIVE_EXTENSIONS)
+    
+    def is_archive_member_allowed(self, name: str) -> bool:
+        """检查压缩包内的条目是否为需要导入的图片（跳过系统生成的隐藏文件）"""
+        basename = os.path.basename(name)
+        if not basename or basename.startswith('.') or '__MACOSX' in name:
+            return False
+        return self.is_allowed_file(basename)
+    
+    async def iter_archive(self, fileobj, archive_name: str) -> AsyncIterator[Tuple[str, AsyncIterator[bytes]]]:
+        """
+        逐个流式读取压缩包中的图片条目，不解压到临时目录
+        产出 (文件名, 分块迭代器)；每个条目必须在读取下一个条目前消费完
+        ZIP需要可随机访问的文件对象，TAR按顺序流式读取
+        压缩包损坏、截断、加密或使用不支持的压缩方式时抛出 ArchiveError
+        """
+        loop = asyncio.get_running_loop()
+        
+        async def iter_member(member) -> AsyncIterator[bytes]:
+            # 解压读取在默认线程池中执行，避免阻塞事件循环
+            while True:
+                chunk = await loop.run_in_executor(None, read_archive, member.read, self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        
+        if archive_name.lower().endswith('.zip'):
+            archive = await loop.run_in_executor(None, read_archive, zipfile.ZipFile, fileobj)
+            with archive:
+                for info in archive.infolist():
+                    if info.is_dir() or not self.is_archive_member_allowed(info.filename):
+                        continue
+                    # 加密或不支持的压缩方式在打开条目时报错
+                    with read_archive(archive.open, info) as member:
+                        yield os.path.basename(info.filename), iter_member(member)
+        else:
+            archive = await loop.run_in_executor(
+                None, read_archive, lambda: tarfile.open(fileobj=fileobj, mode='r|*')
+            )
+            with archive:
+                while True:
+                    info = await loop.run_in_executor(None, read_archive, archive.next)
+                    if info is None:
+                        break
+                    if not info.isfile() or not self.is_archive_member_allowed(info.name):
+                        continue
+                    member = read_archive(archive.extractfile, info)
+                    yield os.path.basename(info.name), iter_member(member)
+    
+    # ============ 断点续传 ============
+    
+    def get_session_path(self, session_id: str) -> str:
+        """获取续传会话的拼装文件路径"""
+        return os.path.join(self.session_dir, f"{session_id}.part")
+    
+    def create_session_file(self, session_id: str, total_size: int):
+        """创建续传会话文件，预先设置为目标大小以便按偏移写入"""
+        with open(self.get_session_path(session_id), 'wb') as f:
+            f.truncate(total_size)
+    
+    async def write_chunk(self, session_id: str, offset: int, chunks: AsyncIterator[bytes], max_size: int) -> int:
+        """
+        将分块流式写入会话文件的指定偏移处
+        返回写入的字节数
+        """
+        written = 0
+        async with aiofiles.open(self.get_session_path(session_id), 'r+b') as f:
+            await f.seek(offset)
+            async for chunk in chunks:
+                written += len(chunk)
+                if written > max_size:
+                    raise ValueError("分块大小超出声明范围")
+                await f.write(chunk)
+        return written
+    
+    async def probe_dimensions(self, file_path: str, header: Optional[bytes] = None) -> Tuple[Optional[int], Optional[int]]:
+        """在线程池中获取图片尺寸，不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.probe_executor, self.probe_image, file_path, header)
+    
+    def probe_image(self, file_path: str, header: Optional[bytes] = None) -> Tuple[Optional[int], Optional[int]]:
+        """优先从内存中的文件头解析尺寸，失败时回退到读取文件"""
+        if header:
+            try:
+                with Image.open(io.BytesIO(header)) as img:
+                    return img.size
+            except Exception:
+                pass
+        return self.get_image_dimensions(file_path)
+    
     def get_image_dimensions(self, file_path: str) -> Tuple[Optional[int], Optional[int]]:
         """获取图片尺寸"""
         try:
@@ -93,10 +387,81 @@ class FileHandler:
         try:
             project_dir = os.path.join(self.upload_dir, project_id)
             if os.path.exists(project_dir):
-                import shutil
+                # 记录项目引用的blob，删除后回收不再被引用的内容
+                digests = [os.path.splitext(name)[0] for name in os.listdir(project_dir)]
                 shutil.rmtree(project_dir)
+                self.release_blobs(digests)
                 return True
             return False
         except Exception:
             return False
+    
+    def remove_project_files(self, project_id: str, max_files: int) -> Tuple[int, int]:
+        """
+        删除项目目录中最多 max_files 个文件（含缩略图等子目录），清空的目录随之删除
+        返回 (删除文件数, 释放字节数)；返回的文件数为 0 时目录已不存在
+        """
+        project_dir = os.path.join(self.upload_dir, project_id)
+        removed = 0
+        freed = 0
+        digests = []
+        failed = set()
+        stack = [project_dir]
+        while stack and removed < max_files:
+            directory = stack[-1]
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                stack.pop()
+                continue
+            subdirs = []
+            for entry in entries:
+                if removed >= max_files:
+                    break
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path not in failed:
+                        subdirs.append(entry.path)
+                    continue
+                try:
+                    freed += entry.stat(follow_symlinks=False).st_size
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                digests.append(os.path.splitext(entry.name)[0])
+            if subdirs:
+                stack.extend(subdirs)
+            elif removed < max_files:
+                # 目录已清空
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    failed.add(directory)
+                stack.pop()
+        self.release_blobs(digests)
+        return removed, freed
+    
+    def list_project_dirs(self) -> List[Tuple[str, float]]:
+        """上传目录中的项目目录：[(项目ID, 修改时间)]"""
+        project_dirs = []
+        with os.scandir(self.upload_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith(self.PROJECT_DIR_PREFIX) and entry.is_dir(follow_symlinks=False):
+                    project_dirs.append((entry.name, entry.stat(follow_symlinks=False).st_mtime))
+        return project_dirs
+    
+    def release_blobs(self, digests) -> int:
+        """删除没有任何项目引用（硬链接数为1）的blob，返回回收数量"""
+        released = 0
+        for digest in digests:
+            if len(digest) != 64:
+                continue
+            blob_path = self.get_blob_path(digest)
+            try:
+                if os.stat(blob_path).st_nlink <= 1:
+                    os.remove(blob_path)
+                    released += 1
+            except OSError:
+                continue
+        return released
 
@@ -2,9 +2,94 @@
 元数据提取服务
 从图片和项目数据中提取元数据用于报告生成
 """
+import re
 import uuid
+import asyncio
+from collections import Counter
 from datetime import datetime
 from typing import Dict, List, Optional
+from PIL import Image
+
+from services.worker_pool import run_in_process
+
+# EXIF标签
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_FOCAL_LENGTH = 0x920A
+
+# XMP读取范围（大疆将XMP写在文件头部）
+XMP_SCAN_SIZE = 256 * 1024
+XMP_PATTERN = re.compile(rb"<x:xmpmeta.*?</x:xmpmeta>", re.DOTALL)
+DJI_FIELD_PATTERN = re.compile(r'drone-dji:(\w+)\s*=\s*"([^"]*)"|<drone-dji:(\w+)>([^<]*)</drone-dji:\w+>')
+
+# 大疆XMP字段与图片表列的对应关系
+DJI_XMP_FIELDS = {
+    "RelativeAltitude": "relative_altitude",
+    "GimbalPitchDegree": "gimbal_pitch",
+    "GimbalYawDegree": "gimbal_yaw",
+    "GimbalRollDegree": "gimbal_roll",
+}
+
+# 单张图片元数据字段（与 images 表列一致）
+IMAGE_METADATA_FIELDS = (
+    "gps_lat", "gps_lng", "gps_alt", "relative_altitude",
+    "gimbal_pitch", "gimbal_yaw", "gimbal_roll",
+    "focal_length", "camera_make", "camera_model", "captured_at"
+)
+
+
+def to_float(value) -> Optional[float]:
+    """将EXIF有理数或字符串转换为浮点数"""
+    try:
+        return float(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def gps_to_degrees(value, ref) -> Optional[float]:
+    """将EXIF度分秒格式转换为十进制度"""
+    try:
+        degrees, minutes, seconds = (float(v) for v in value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    result = degrees + minutes / 60 + seconds / 3600
+    if ref in ("S", "W"):
+        result = -result
+    return round(result, 7)
+
+
+def clean_text(value) -> Optional[str]:
+    """清理EXIF字符串中的空字符与空白"""
+    if value is None:
+        return None
+    return str(value).strip("\x00 ") or None
+
+
+def parse_exif_datetime(value) -> Optional[str]:
+    """将EXIF时间（YYYY:MM:DD HH:MM:SS）转换为ISO格式"""
+    value = clean_text(value)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y:%m:%d %H:%M:%S").isoformat()
+    except ValueError:
+        return None
+
+
+def read_xmp(img, file_path: str) -> str:
+    """读取图片中的XMP数据"""
+    xmp = img.info.get("xmp")
+    if not xmp:
+        with open(file_path, "rb") as f:
+            match = XMP_PATTERN.search(f.read(XMP_SCAN_SIZE))
+        xmp = match.group(0) if match else b""
+    if isinstance(xmp, bytes):
+        xmp = xmp.decode("utf-8", errors="ignore")
+    return xmp
 
 
 class MetadataExtractor:
@@ -70,39 +155,105 @@ class MetadataExtractor:
             'center_lng': sum(lngs) / len(lngs)
         }
     
+    @staticmethod
+    def extract_image_metadata(file_path: str) -> Dict:
+        """
+        解析单张图片的EXIF与大疆XMP元数据（在工作进程中执行）
+        返回 IMAGE_METADATA_FIELDS 中的字段，缺失的字段为 None
+        """
+        metadata = dict.fromkeys(IMAGE_METADATA_FIELDS)
+        try:
+            with Image.open(file_path) as img:
+                exif = img.getexif()
+                exif_ifd = exif.get_ifd(TAG_EXIF_IFD)
+                gps_ifd = exif.get_ifd(TAG_GPS_IFD)
+                xmp = read_xmp(img, file_path)
+        except Exception:
+            return metadata
+        
+        # GPS: 1=纬度参考 2=纬度 3=经度参考 4=经度 5=海拔参考 6=海拔
+        if gps_ifd:
+            metadata["gps_lat"] = gps_to_degrees(gps_ifd.get(2), gps_ifd.get(1))
+            metadata["gps_lng"] = gps_to_degrees(gps_ifd.get(4), gps_ifd.get(3))
+            altitude = to_float(gps_ifd.get(6))
+            if altitude is not None and gps_ifd.get(5) in (1, b"\x01"):
+                altitude = -altitude
+            metadata["gps_alt"] = altitude
+        
+        metadata["camera_make"] = clean_text(exif.get(TAG_MAKE))
+        metadata["camera_model"] = clean_text(exif.get(TAG_MODEL))
+        metadata["focal_length"] = to_float(exif_ifd.get(TAG_FOCAL_LENGTH))
+        metadata["captured_at"] = parse_exif_datetime(
+            exif_ifd.get(TAG_DATETIME_ORIGINAL) or exif.get(TAG_DATETIME)
+        )
+        
+        # 大疆XMP：相对高度、云台角度
+        for match in DJI_FIELD_PATTERN.finditer(xmp):
+            name = match.group(1) or match.group(3)
+            value = match.group(2) if match.group(1) else match.group(4)
+            if name in DJI_XMP_FIELDS:
+                metadata[DJI_XMP_FIELDS[name]] = to_float(value)
+        
+        return metadata
+    
+    @staticmethod
+    async def extract_for_images(images: List[Dict]):
+        """在进程池中并发解析一批图片的元数据，结果写回图片信息"""
+        async def extract(img):
+            try:
+                return await run_in_process(MetadataExtractor.extract_image_metadata, img["file_path"])
+            except Exception as e:
+                print(f"元数据解析失败 {img['file_path']}: {e}")
+                return dict.fromkeys(IMAGE_METADATA_FIELDS)
+        
+        results = await asyncio.gather(*(extract(img) for img in images))
+        for img, metadata in zip(images, results):
+            img.update(metadata)
+    
     @staticmethod
     def extract_time_range(images: List[Dict]) -> Dict:
         """提取拍摄时间范围"""
-        # 模拟提取时间（实际应该从EXIF读取）
-        now = datetime.now()
+        times = sorted(img['captured_at'] for img in images if img.get('captured_at'))
         return {
-            'start_time': now.isoformat(),
-            'end_time': now.isoformat()
+            'start_time': times[0] if times else None,
+            'end_time': times[-1] if times else None
         }
     
     @staticmethod
     def extract_device_info(images: List[Dict]) -> Dict:
-        """提取设备信息"""
-        # 模拟提取（实际应该从EXIF读取）
+        """提取设备信息（取出现次数最多的设备）"""
+        makes = Counter(img['camera_make'] for img in images if img.get('camera_make'))
+        models = Counter(img['camera_model'] for img in images if img.get('camera_model'))
+        focal_lengths = Counter(img['focal_length'] for img in images if img.get('focal_length'))
+        
+        resolution = None
+        sized = [img for img in images if img.get('width') and img.get('height')]
+        if sized:
+            megapixels = max(img['width'] * img['height'] for img in sized) / 1_000_000
+            resolution = f"{round(megapixels)}MP"
+        
         return {
-            'device_make': 'DJI',
-            'device_model': 'Mavic 3',
-            'camera_model': 'Hasselblad L2D-20c',
-            'camera_resolution': '20MP'
+            'device_make': makes.most_common(1)[0][0] if makes else None,
+            'camera_model': models.most_common(1)[0][0] if models else None,
+            'focal_length': focal_lengths.most_common(1)[0][0] if focal_lengths else None,
+            'camera_resolution': resolution
         }
     
     @staticmethod
     def calculate_statistics(images: List[Dict], detection_results: List[Dict]) -> Dict:
         """计算统计信息"""
-        total_size = sum(img.get('file_size', 0) for img in images)
+        total_size = sum(img.get('file_size') or 0 for img in images)
         total_issues = sum(len(r.get('issues', [])) for r in detection_results)
         
+        altitudes = [img['relative_altitude'] for img in images if img.get('relative_altitude') is not None]
+        avg_altitude = f"{round(sum(altitudes) / len(altitudes))}m AGL" if altitudes else None
+        
         return {
             'total_images': len(images),
             'total_size': total_size,
             'total_size_mb': round(total_size / 1024 / 1024, 2),
             'total_issues': total_issues,
-            'avg_altitude': '80m AGL',  # 模拟
+            'avg_altitude': avg_altitude,
             'gsd': '约 2.2 cm/pixel'     # 模拟
         }
     
@@ -2,7 +2,7 @@
 模拟AI服务 - 用于MVP阶段的演示
 """
 import random
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import uuid
 
 
@@ -101,29 +101,32 @@ class MockAIService:
         }
     
     @classmethod
-    def detect_issues(cls, image_id: str, scene_type: str) -> Dict[str, Any]:
+    def generate_issues(cls, scene_type: str, rng: Optional[random.Random] = None) -> Dict[str, Any]:
         """
-        检测单张图片的问题
+        模拟单张图片的推理结果：整体置信度及问题列表
+        传入按图片设定种子的随机数生成器时结果可复现（默认使用全局随机数）
         """
+        rng = rng or random
+
         # 获取场景对应的问题类型
         issue_templates = cls.ISSUE_TYPES.get(scene_type, cls.ISSUE_TYPES["building"])
         
         # 决定是否有问题 (70%概率有问题)
-        has_issue = random.random() > 0.3
+        has_issue = rng.random() > 0.3
         
         issues = []
         if has_issue:
             # 随机生成1-3个问题
-            num_issues = random.randint(1, 3)
-            selected_issues = random.sample(issue_templates, min(num_issues, len(issue_templates)))
+            num_issues = rng.randint(1, 3)
+            selected_issues = rng.sample(issue_templates, min(num_issues, len(issue_templates)))
             
             for issue_template in selected_issues:
                 # 生成问题描述（替换模板变量）
                 description = issue_template["description"]
-                description = description.replace("{length}", str(random.randint(5, 30)))
-                description = description.replace("{direction}", random.choice(["横向", "纵向", "斜向"]))
-                description = description.replace("{type}", random.choice(["网状", "线性", "块状"]))
-                description = description.replace("{size}", str(random.randint(5, 20)))
+                description = description.replace("{length}", str(rng.randint(5, 30)))
+                description = description.replace("{direction}", rng.choice(["横向", "纵向", "斜向"]))
+                description = description.replace("{type}", rng.choice(["网状", "线性", "块状"]))
+                description = description.replace("{size}", str(rng.randint(5, 20)))
                 
                 issues.append({
                     "id": f"issue-{uuid.uuid4().hex[:8]}",
@@ -131,39 +134,18 @@ class MockAIService:
                     "name": issue_template["name"],
                     "severity": issue_template["severity"],
                     "description": description,
-                    "confidence": round(0.6 + random.random() * 0.35, 2),
+                    "confidence": round(0.6 + rng.random() * 0.35, 2),
                     "bbox": {
-                        "x": round(random.random() * 60 + 10, 1),
-                        "y": round(random.random() * 60 + 10, 1),
-                        "width": round(random.random() * 20 + 10, 1),
-                        "height": round(random.random() * 20 + 10, 1)
+                        "x": round(rng.random() * 60 + 10, 1),
+                        "y": round(rng.random() * 60 + 10, 1),
+                        "width": round(rng.random() * 20 + 10, 1),
+                        "height": round(rng.random() * 20 + 10, 1)
                     }
                 })
         
-        # 计算整体置信度
-        overall_confidence = round(0.7 + random.random() * 0.25, 2)
-        
-        # 确定状态
-        if not issues:
-            status = "success"
-            suggestion = "状态良好，无需处理"
-        elif any(i["severity"] == "danger" for i in issues):
-            status = "danger"
-            suggestion = "存在严重问题，建议立即处理"
-        else:
-            status = "warning"
-            suggestion = "存在一般问题，建议安排检修"
-        
         return {
-            "image_id": image_id,
-            "confidence": overall_confidence,
-            "status": status,
-            "issues": issues,
-            "suggestion": suggestion,
-            "gps": {
-                "lat": round(31.2 + random.random() * 0.1, 6),
-                "lng": round(121.4 + random.random() * 0.1, 6)
-            }
+            "confidence": round(0.7 + rng.random() * 0.25, 2),
+            "issues": issues
         }
     
     @classmethod
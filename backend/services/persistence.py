@@ -0,0 +1,125 @@
+"""
+批量持久化服务
+图片入库、检测结果写入通过 executemany 分批执行，由调用方在单个事务内提交
+"""
+import time
+import logging
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from config import BULK_WRITE_BATCH_SIZE
+from services.metadata_extractor import IMAGE_METADATA_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+async def execute_batched(db, sql: str, rows: Sequence[Tuple], batch_size: int = BULK_WRITE_BATCH_SIZE) -> int:
+    """按批次执行 executemany，返回写入行数"""
+    for start in range(0, len(rows), batch_size):
+        await db.executemany(sql, rows[start:start + batch_size])
+    return len(rows)
+
+
+def report_stats(label: str, rows: int, started: float) -> Dict:
+    """记录并返回写入统计"""
+    elapsed = time.perf_counter() - started
+    stats = {
+        "rows": rows,
+        "elapsed_ms": round(elapsed * 1000, 2),
+        "rows_per_sec": round(rows / elapsed, 1) if elapsed > 0 else None
+    }
+    logger.info("%s: %d 行, %.2fms, %s 行/秒", label, rows, stats["elapsed_ms"], stats["rows_per_sec"])
+    return stats
+
+
+# images 表写入列（顺序与 image_rows 一致）
+IMAGE_COLUMNS = (
+    "id", "project_id", "filename", "original_name", "file_path", "file_size", "width", "height",
+    "sha256", "thumbnail_sizes"
+) + IMAGE_METADATA_FIELDS
+
+
+def image_rows(project_id: str, images: Iterable[Dict]) -> List[Tuple]:
+    """将图片信息转换为 images 表的行"""
+    return [
+        (img["id"], project_id, img["filename"], img["original_name"], img["file_path"],
+         img["file_size"], img["width"], img["height"], img.get("sha256"), img.get("thumbnail_sizes"))
+        + tuple(img.get(field) for field in IMAGE_METADATA_FIELDS)
+        for img in images
+    ]
+
+
+async def insert_images(db, project_id: str, images: List[Dict]) -> Dict:
+    """批量写入图片记录（含EXIF/XMP元数据）"""
+    started = time.perf_counter()
+    rows = image_rows(project_id, images)
+    await execute_batched(
+        db,
+        f"""INSERT INTO images ({", ".join(IMAGE_COLUMNS)})
+            VALUES ({", ".join("?" * len(IMAGE_COLUMNS))})""",
+        rows
+    )
+    return report_stats("images", len(rows), started)
+
+
+def issue_rows(detection_id: str, issues: Iterable[Dict]) -> List[Tuple]:
+    """将问题列表转换为 issues 表的行"""
+    return [
+        (issue["id"], detection_id, issue["type"], issue["name"],
+         issue["severity"], issue["description"], issue["confidence"],
+         issue["bbox"]["x"], issue["bbox"]["y"],
+         issue["bbox"]["width"], issue["bbox"]["height"])
+        for issue in issues
+    ]
+
+
+async def insert_issues(db, rows: Sequence[Tuple]) -> int:
+    """批量写入问题记录"""
+    return await execute_batched(
+        db,
+        """INSERT INTO issues 
+           (id, detection_id, issue_type, name, severity, description, confidence,
+            bbox_x, bbox_y, bbox_width, bbox_height)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        rows
+    )
+
+
+def detection_rows(project_id: str, detections: Iterable[Dict]) -> Tuple[List[Tuple], List[Tuple]]:
+    """将检测结果转换为 detection_results 表及 issues 表的行（同一图片只保留最后一条）"""
+    result_rows = []
+    issues = []
+    for detection in {detection["image_id"]: detection for detection in detections}.values():
+        detection_id = f"det-{detection['image_id']}"
+        result_rows.append((
+            detection_id, detection["image_id"], project_id,
+            detection["confidence"], detection["status"], detection["suggestion"]
+        ))
+        issues.extend(issue_rows(detection_id, detection["issues"]))
+    return result_rows, issues
+
+
+async def save_detections(db, project_id: str, detections: List[Dict]) -> Dict:
+    """批量写入检测结果及其问题记录"""
+    started = time.perf_counter()
+    result_rows, issues = detection_rows(project_id, detections)
+    
+    # 重新检测时替换原有的问题记录
+    await execute_batched(
+        db,
+        "DELETE FROM issues WHERE detection_id = ?",
+        [(row[0],) for row in result_rows]
+    )
+    await execute_batched(
+        db,
+        """INSERT OR REPLACE INTO detection_results 
+           (id, image_id, project_id, confidence, status, suggestion)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        result_rows
+    )
+    await insert_issues(db, issues)
+    await execute_batched(
+        db,
+        "UPDATE images SET status = 'detected' WHERE id = ?",
+        [(detection["image_id"],) for detection in detections]
+    )
+    return report_stats("detections", len(result_rows) + len(issues), started)
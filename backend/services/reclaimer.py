@@ -0,0 +1,192 @@
+"""
+项目删除回收
+删除项目时只写入删除标记；回收任务在后台按I/O预算分批删除项目文件、图片及检测数据，
+最后删除项目记录。孤儿清理定期扫描上传目录和分库目录，回收没有项目记录的目录/分库、
+没有项目记录的数据，以及长时间未完成上传的空项目
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from config import (
+    UPLOAD_DIR, CONTENT_ADDRESSED_STORAGE, PROJECT_SHARDS_ENABLED,
+    RECLAIM_BATCH_SIZE, RECLAIM_MAX_BYTES_PER_SEC, RECLAIM_MAX_FILES_PER_SEC, RECLAIM_INTERVAL,
+    ORPHAN_SWEEP_INTERVAL, ORPHAN_GRACE_SECONDS, ORPHAN_SWEEP_MAX_PROJECTS
+)
+from database import PROJECT_ID_PATTERN, project_shards
+from repositories import repository
+from services.file_handler import FileHandler
+
+logger = logging.getLogger(__name__)
+
+
+class ProjectReclaimer:
+    """后台回收已删除项目及孤儿数据"""
+
+    def __init__(self, file_handler: FileHandler, batch_size: int,
+                 max_bytes_per_sec: int, max_files_per_sec: int, interval: int,
+                 sweep_interval: int, grace_seconds: int, sweep_max_projects: int):
+        self.file_handler = file_handler
+        self.batch_size = batch_size
+        self.max_bytes_per_sec = max_bytes_per_sec
+        self.max_files_per_sec = max_files_per_sec
+        self.interval = interval
+        self.sweep_interval = sweep_interval
+        self.grace_seconds = grace_seconds
+        self.sweep_max_projects = sweep_max_projects
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.last_sweep = float("-inf")
+
+        # 统计
+        self.reclaimed_projects = 0
+        self.orphan_projects = 0
+        self.removed_files = 0
+        self.freed_bytes = 0
+        self.purged_images = 0
+        self.sweeps = 0
+        self.failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self):
+        """启动回收任务（启动后立即处理遗留的删除标记并执行一次孤儿清理）"""
+        if self.running:
+            return
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止回收任务；未回收完的项目保留删除标记，下次启动后继续"""
+        if not self.running:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    def wake(self):
+        """有新的删除标记时立即开始回收"""
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def _run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                await self.reclaim_deleted()
+                if time.monotonic() - self.last_sweep >= self.sweep_interval:
+                    self.last_sweep = time.monotonic()
+                    await self.sweep_orphans()
+            except Exception:
+                self.failures += 1
+                logger.exception("项目回收失败")
+
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def reclaim_deleted(self):
+        """回收全部已标记删除的项目"""
+        while True:
+            project_ids = await repository.list_deleted_projects(self.batch_size)
+            if not project_ids:
+                return
+            for project_id in project_ids:
+                await self.reclaim(project_id)
+                self.reclaimed_projects += 1
+
+    async def reclaim(self, project_id: str):
+        """分批删除项目文件、图片及检测数据，最后删除项目记录"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = time.monotonic()
+            removed, freed = await loop.run_in_executor(
+                None, self.file_handler.remove_project_files, project_id, self.batch_size
+            )
+            if not removed:
+                break
+            self.removed_files += removed
+            self.freed_bytes += freed
+            await self.throttle(started, removed, freed)
+
+        while True:
+            started = time.monotonic()
+            purged = await repository.purge_project_images(project_id, self.batch_size)
+            if not purged:
+                break
+            self.purged_images += purged
+            await self.throttle(started, purged, 0)
+
+        await repository.delete_project(project_id)
+
+    async def throttle(self, started: float, files: int, size: int):
+        """按I/O预算等待：本批的文件数和字节数折算的耗时未用完时补足"""
+        budget = max(files / self.max_files_per_sec, size / self.max_bytes_per_sec)
+        await asyncio.sleep(max(0.0, budget - (time.monotonic() - started)))
+
+    async def sweep_orphans(self):
+        """
+        回收孤儿数据：宽限期之前修改、没有项目记录的项目目录及分库，
+        没有项目记录的数据行，以及宽限期之前创建、上传未完成的空项目
+        """
+        loop = asyncio.get_running_loop()
+        cutoff = time.time() - self.grace_seconds
+        before = (datetime.now(timezone.utc) - timedelta(seconds=self.grace_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+        entries = await loop.run_in_executor(None, self.file_handler.list_project_dirs)
+        if PROJECT_SHARDS_ENABLED:
+            entries += await loop.run_in_executor(None, project_shards.list_projects)
+        candidates = sorted({project_id for project_id, mtime in entries if mtime < cutoff})
+
+        orphans: List[str] = []
+        for start in range(0, len(candidates), self.batch_size):
+            orphans += await repository.find_missing_projects(candidates[start:start + self.batch_size])
+        orphans = orphans[:self.sweep_max_projects]
+        orphans += await repository.list_orphan_projects(before, self.sweep_max_projects - len(orphans))
+
+        for project_id in dict.fromkeys(orphans):
+            if not PROJECT_ID_PATTERN.match(project_id):
+                continue
+            # 有项目记录的空项目写入删除标记，与主动删除走同一流程
+            if not await repository.mark_project_deleted(project_id):
+                await self.reclaim(project_id)
+            self.orphan_projects += 1
+
+        self.sweeps += 1
+        if orphans:
+            logger.info("孤儿清理: %d 个项目", len(orphans))
+        await self.reclaim_deleted()
+
+    def stats(self) -> dict:
+        """当前回收状态"""
+        return {
+            "running": self.running,
+            "reclaimed_projects": self.reclaimed_projects,
+            "orphan_projects": self.orphan_projects,
+            "removed_files": self.removed_files,
+            "freed_bytes": self.freed_bytes,
+            "purged_images": self.purged_images,
+            "sweeps": self.sweeps,
+            "failures": self.failures
+        }
+
+
+# 全局回收任务
+project_reclaimer = ProjectReclaimer(
+    FileHandler(UPLOAD_DIR, content_addressed=CONTENT_ADDRESSED_STORAGE, probe_workers=1),
+    batch_size=RECLAIM_BATCH_SIZE,
+    max_bytes_per_sec=RECLAIM_MAX_BYTES_PER_SEC,
+    max_files_per_sec=RECLAIM_MAX_FILES_PER_SEC,
+    interval=RECLAIM_INTERVAL,
+    sweep_interval=ORPHAN_SWEEP_INTERVAL,
+    grace_seconds=ORPHAN_GRACE_SECONDS,
+    sweep_max_projects=ORPHAN_SWEEP_MAX_PROJECTS
+)
@@ -0,0 +1,104 @@
+"""
+缩略图服务
+上传时为每张图片生成多级WebP预览图，审查页面无需下载原图
+"""
+import os
+import asyncio
+from typing import Dict, List, Optional, Sequence, Union
+from PIL import Image, ImageOps
+
+from config import UPLOAD_DIR
+from services.worker_pool import run_in_process
+
+
+def render_thumbnails(source_path: str, output_dir: str, key: str,
+                      sizes: Sequence[int], quality: int) -> List[int]:
+    """
+    生成缩略图金字塔（在工作进程中执行）
+    返回实际生成的尺寸列表，大于原图的级别会被跳过
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    sizes = sorted(sizes, reverse=True)
+    
+    with Image.open(source_path) as img:
+        # JPEG草稿模式：解码时直接按比例缩小，避免完整解码大图
+        img.draft("RGB", (sizes[0], sizes[0]))
+        # 按EXIF方向旋转
+        current = ImageOps.exif_transpose(img)
+        if current.mode not in ("RGB", "RGBA"):
+            current = current.convert("RGBA" if "A" in current.getbands() else "RGB")
+        
+        longest = max(current.size)
+        generated = []
+        for size in sizes:
+            # 仅保留不大于原图的级别，最小级别总是生成
+            if size > longest and size != sizes[-1]:
+                continue
+            output_path = os.path.join(output_dir, f"{key}_{size}.webp")
+            # 逐级从上一级缩小，减少重采样开销
+            current = current.copy()
+            current.thumbnail((size, size), Image.LANCZOS)
+            if not os.path.exists(output_path):
+                current.save(output_path, "WEBP", quality=quality, method=4)
+            generated.append(size)
+    
+    return sorted(generated)
+
+
+class Thumbnailer:
+    """缩略图生成器"""
+    
+    SIZES = (256, 1024, 2048)
+    QUALITY = 80
+    
+    def __init__(self, upload_dir: str, sizes: Sequence[int] = SIZES):
+        self.upload_dir = upload_dir
+        self.sizes = tuple(sizes)
+    
+    def get_thumbnail_dir(self, project_id: str) -> str:
+        """获取项目缩略图目录"""
+        return os.path.join(self.upload_dir, project_id, "thumbs")
+    
+    async def generate(self, project_id: str, file_path: str, key: str) -> List[int]:
+        """
+        在进程池中生成缩略图
+        key 为图片内容哈希，相同内容的缩略图只生成一次
+        """
+        try:
+            return await run_in_process(
+                render_thumbnails,
+                file_path, self.get_thumbnail_dir(project_id), key, self.sizes, self.QUALITY
+            )
+        except Exception as e:
+            print(f"缩略图生成失败 {file_path}: {e}")
+            return []
+    
+    async def generate_for_images(self, project_id: str, images: List[dict]):
+        """为一批新上传的图片并发生成缩略图，结果写回图片信息"""
+        results = await asyncio.gather(*(
+            self.generate(project_id, img["file_path"], img["sha256"]) for img in images
+        ))
+        for img, sizes in zip(images, results):
+            img["thumbnail_sizes"] = self.format_sizes(sizes)
+            img["thumbnails"] = self.get_urls(project_id, img["sha256"], sizes)
+    
+    @staticmethod
+    def format_sizes(sizes: List[int]) -> str:
+        """将尺寸列表格式化为数据库存储格式"""
+        return ",".join(str(size) for size in sizes)
+    
+    @staticmethod
+    def get_urls(project_id: str, key: Optional[str], sizes: Union[str, List[int], None]) -> Dict[str, str]:
+        """获取各级缩略图的访问URL"""
+        if not key or not sizes:
+            return {}
+        if isinstance(sizes, str):
+            sizes = [int(size) for size in sizes.split(",") if size]
+        return {
+            str(size): f"/uploads/{project_id}/thumbs/{key}_{size}.webp"
+            for size in sizes
+        }
+
+
+# 单例实例
+thumbnailer = Thumbnailer(UPLOAD_DIR)
@@ -0,0 +1,43 @@
+"""
+进程池服务
+图片解码等CPU密集型任务在独立进程中执行，避免占用API进程的GIL
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from config import INGEST_WORKERS
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """获取共享进程池（首次使用时创建）"""
+    global _process_pool
+    if _process_pool is None:
+        # 使用spawn避免在持有数据库线程的进程中fork
+        _process_pool = ProcessPoolExecutor(
+            max_workers=INGEST_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+
+def shutdown_process_pool():
+    """关闭共享进程池"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True, cancel_futures=True)
+        _process_pool = None
+
+
+async def run_in_process(func: Callable, *args) -> Any:
+    """在共享进程池中执行函数；工作进程异常退出时重建进程池"""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_process_pool(), func, *args)
+    except BrokenProcessPool:
+        shutdown_process_pool()
+        raise
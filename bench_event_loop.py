@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+事件循环延迟基准测试
+在同一事件循环中并发执行图片上传与积分请求，采样事件循环的调度延迟，
+验证积分接口不会阻塞事件循环（积分流量加入前后延迟应基本持平）
+
+用法: python bench_event_loop.py [--seconds 5] [--max-ratio 3]
+需要 httpx（与 FastAPI TestClient 相同的依赖）
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+# 采样间隔（秒）
+PROBE_INTERVAL = 0.005
+
+
+async def probe_lag(stop: asyncio.Event, samples: list):
+    """定时休眠并记录实际唤醒时间与预期的偏差（毫秒）"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append((loop.time() - started - PROBE_INTERVAL) * 1000)
+
+
+async def upload_worker(client, stop: asyncio.Event, image_bytes: bytes, project_ids: list):
+    """持续上传小批量图片"""
+    while not stop.is_set():
+        files = [("files", (f"bench_{i}.jpg", image_bytes, "image/jpeg")) for i in range(4)]
+        response = await client.post("/api/upload/images", files=files)
+        response.raise_for_status()
+        project_ids.append(response.json()["project_id"])
+
+
+async def credits_worker(client, stop: asyncio.Event, counter: list):
+    """持续发起积分增减及查询请求"""
+    while not stop.is_set():
+        for path, payload in (
+            ("/api/credits/add", {"user_id": 1, "amount": 1, "reason": "基准测试",
+                                  "balance_before": 1100, "balance_after": 1101}),
+            ("/api/credits/deduct", {"user_id": 1, "amount": 1, "reason": "基准测试",
+                                     "balance_before": 1101, "balance_after": 1100}),
+        ):
+            response = await client.post(path, json=payload)
+            assert response.json()["success"], response.json()
+        response = await client.get("/api/user/credit-history", params={"user_id": 1})
+        response.raise_for_status()
+        counter[0] += 3
+
+
+def summarize(samples: list) -> dict:
+    """延迟统计（毫秒）"""
+    ordered = sorted(samples)
+    return {
+        "samples": len(ordered),
+        "p50": statistics.median(ordered),
+        "p99": ordered[int(len(ordered) * 0.99) - 1],
+        "max": ordered[-1]
+    }
+
+
+async def run_scenario(client, seconds: float, image_bytes: bytes, with_credits: bool) -> dict:
+    """运行一个场景：2个上传并发，可选加入4个积分并发"""
+    stop = asyncio.Event()
+    samples, project_ids, credit_requests = [], [], [0]
+    tasks = [asyncio.create_task(probe_lag(stop, samples))]
+    tasks += [asyncio.create_task(upload_worker(client, stop, image_bytes, project_ids)) for _ in range(2)]
+    if with_credits:
+        tasks += [asyncio.create_task(credits_worker(client, stop, credit_requests)) for _ in range(4)]
+
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    # 删除接口只写入删除标记；基准测试不经过应用生命周期（回收任务未启动），直接回收文件及数据
+    from services.reclaimer import project_reclaimer
+    for project_id in project_ids:
+        await client.delete(f"/api/upload/project/{project_id}")
+    await project_reclaimer.reclaim_deleted()
+
+    result = summarize(samples)
+    result["uploads"] = len(project_ids)
+    result["credit_requests"] = credit_requests[0]
+    return result
+
+
+async def main(seconds: float, max_ratio: float) -> int:
+    import httpx
+    from PIL import Image
+
+    # 在 inspection.db 的临时副本上运行，上传文件及项目分库也写入临时目录，避免污染原有数据
+    tmp_dir = tempfile.mkdtemp(prefix="bench_")
+    os.environ["UPLOAD_DIR"] = os.path.join(tmp_dir, "uploads")
+    os.environ["PROJECT_DB_DIR"] = os.path.join(tmp_dir, "project_db")
+
+    import database
+
+    database.DATABASE_PATH = shutil.copy(database.DATABASE_PATH, os.path.join(tmp_dir, "bench.db"))
+    database.db_pool.path = database.DATABASE_PATH
+    await database.init_db()
+    await database.db_pool.open()
+
+    from main import app
+    from services.worker_pool import shutdown_process_pool
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (1600, 1200), "gray").save(buffer, "JPEG", quality=85)
+    image_bytes = buffer.getvalue()
+
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            # 预热进程池与连接池
+            await run_scenario(client, 1, image_bytes, with_credits=True)
+
+            print("🚀 事件循环延迟基准测试\n")
+            uploads_only = await run_scenario(client, seconds, image_bytes, with_credits=False)
+            with_credits = await run_scenario(client, seconds, image_bytes, with_credits=True)
+    finally:
+        await database.db_pool.close()
+        shutdown_process_pool()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    for name, result in (("仅上传", uploads_only), ("上传 + 积分", with_credits)):
+        print(f"📊 {name}: 上传 {result['uploads']} 批, 积分请求 {result['credit_requests']} 次")
+        print(f"   延迟 p50={result['p50']:.2f}ms p99={result['p99']:.2f}ms max={result['max']:.2f}ms "
+              f"({result['samples']} 个采样)")
+
+    # p99 延迟允许的上限：基线的 max_ratio 倍，且至少留出 5ms 的抖动余量
+    limit = max(uploads_only["p99"] * max_ratio, uploads_only["p99"] + 5)
+    if with_credits["p99"] > limit:
+        print(f"\n❌ 积分流量使事件循环 p99 延迟升至 {with_credits['p99']:.2f}ms（上限 {limit:.2f}ms）")
+        return 1
+
+    print(f"\n✅ 事件循环延迟平稳（p99 上限 {limit:.2f}ms）")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="事件循环延迟基准测试")
+    parser.add_argument("--seconds", type=float, default=5, help="每个场景的运行秒数")
+    parser.add_argument("--max-ratio", type=float, default=3, help="允许的 p99 延迟相对基线倍数")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.seconds, args.max_ratio)))
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+推理后端测试
+模拟后端的分批推理与解码失败处理、按图片ID可复现的结果及模拟耗时、检测工作进程池（共享内存批次缓冲区）、
+分块切分及重复框合并；安装 onnxruntime 和 onnx 时另外构造一个小模型
+（置信度等于图片平均亮度）测试 ONNX Runtime 后端的预处理、批次拆分及问题框换算
+
+用法: python test_inference.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import numpy as np
+from PIL import Image
+
+from inference import Tiler, create_backend, decode_image
+
+
+class Checker:
+    """记录检查结果"""
+
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, label: str, condition: bool, detail=None):
+        if condition:
+            print(f"  ✅ {label}")
+        else:
+            self.failures += 1
+            print(f"  ❌ {label}" + (f": {detail}" if detail is not None else ""))
+
+
+def make_images(tmp_dir: str, colors: list) -> list:
+    images = []
+    for index, color in enumerate(colors):
+        path = os.path.join(tmp_dir, f"img_{index}.jpg")
+        Image.new("RGB", (120, 90), color).save(path, "JPEG")
+        images.append({"id": f"img-{index}", "file_path": path})
+    return images
+
+
+def check_mock(c: Checker, tmp_dir: str):
+    print("🔍 模拟后端")
+    backend = create_backend("mock", batch_size=4)
+    backend.load()
+    backend.warmup()
+    c.check("预热后已加载", backend.loaded)
+
+    images = make_images(tmp_dir, ["white"] * 10)
+    images.insert(3, {"id": "missing", "file_path": os.path.join(tmp_dir, "missing.jpg")})
+    warm_batches = backend.batches
+    detections = backend.detect(images, "road")
+    c.check("无法解码的图片跳过", [d["image_id"] for d in detections] == [f"img-{i}" for i in range(10)])
+    c.check("按批次推理", backend.batches - warm_batches == 3, backend.batches - warm_batches)
+    c.check("记录解码失败", backend.decode_failures == 1)
+    c.check("检测结论", all(d["status"] in ("success", "warning", "danger") and d["suggestion"] for d in detections))
+    c.check("解码尺寸", decode_image(images[0]["file_path"], 32).shape == (32, 32, 3))
+
+
+def without_ids(detections: list) -> list:
+    return [{**d, "issues": [{k: v for k, v in i.items() if k != "id"} for i in d["issues"]]} for d in detections]
+
+
+def check_mock_profile(c: Checker, tmp_dir: str):
+    print("\n🔍 模拟后端的可复现结果与耗时")
+    from inference.mock import MockBackend, MockLatency
+
+    images = make_images(tmp_dir, ["white"] * 12)
+    first = without_ids(MockBackend(4, seed="7").detect(images, "road"))
+    second = without_ids(MockBackend(5, seed="7").detect(list(reversed(images)), "road"))
+    c.check("同一种子与图片ID结果相同", first == sorted(second, key=lambda d: int(d["image_id"].split("-")[1])))
+    c.check("不同图片结果不同", len({str(d["issues"]) + str(d["confidence"]) for d in first}) > 1)
+    c.check("种子不同结果不同", first != without_ids(MockBackend(4, seed="8").detect(images, "road")))
+    c.check("种子计入缓存参数", MockBackend(4, seed="7").cache_params() != MockBackend(4, seed="8").cache_params())
+
+    backend = MockBackend(4, seed="7", latency=MockLatency(batch_wait_ms=20, image_cpu_ms=5))
+    started = time.process_time()
+    wall = time.perf_counter()
+    backend.detect(images[:8], "road")
+    cpu, wall = time.process_time() - started, time.perf_counter() - wall
+    c.check("模拟每批等待与每张图片CPU耗时", wall >= 2 * 0.020 + 8 * 0.005 and cpu >= 8 * 0.005 * 0.9, (wall, cpu))
+    c.check("统计中的耗时配置", backend.stats()["latency"]["image_cpu_ms"] == 5)
+
+
+def check_worker_pool(c: Checker, tmp_dir: str):
+    print("\n🔍 检测工作进程池")
+    from services.detection_workers import DetectionWorkerPool
+
+    images = make_images(tmp_dir, ["white"] * 9)
+    images.insert(5, {"id": "missing", "file_path": os.path.join(tmp_dir, "missing.jpg")})
+
+    async def run():
+        pool = DetectionWorkerPool(create_backend("mock", batch_size=4), "mock", workers=2, buffers=2)
+        await pool.start()
+        try:
+            first, second = await asyncio.gather(pool.detect(images, "solar"), pool.detect(images[:3], "solar"))
+            stats = pool.stats()
+
+            # 提交中途失败：已提交的解码结束后才归还缓冲区
+            submit, submitted = pool._submit, []
+
+            def failing_submit(func, *args):
+                if len(submitted) == 2:
+                    raise RuntimeError("提交失败")
+                submitted.append(submit(func, *args))
+                return submitted[-1]
+
+            pool._submit = failing_submit
+            try:
+                await pool.detect(images[:4], "solar")
+            except RuntimeError:
+                pass
+            pool._submit = submit
+            for _ in range(200):
+                if pool.free.qsize() == 2:
+                    break
+                await asyncio.sleep(0.01)
+            partial = (pool.free.qsize(), all(future.done() for future in submitted))
+        finally:
+            await pool.stop()
+        return first, second, stats, partial, [shm.name for shm in pool.buffers]
+
+    first, second, stats, partial, buffers = asyncio.run(run())
+    c.check("工作进程中解码及推理", [d["image_id"] for d in first] == [f"img-{i}" for i in range(9)])
+    c.check("工作进程中结果可复现", without_ids(first) == without_ids(create_backend("mock").detect(images, "solar")))
+    c.check("并发批次各自返回", len(second) == 3)
+    c.check("解码失败计入统计", stats["decode_failures"] == 1, stats)
+    c.check("缓冲区全部归还", stats["free_buffers"] == 2, stats)
+    c.check("提交中途失败时等已提交的解码结束再归还缓冲区", partial == (2, True), partial)
+    c.check("停止后释放共享内存", not buffers)
+
+
+def make_issue(issue_type: str, confidence: float, x: float, y: float, w: float, h: float) -> dict:
+    return {"id": f"issue-{issue_type}-{x}", "type": issue_type, "name": issue_type, "severity": "warning",
+            "description": "", "confidence": confidence, "bbox": {"x": x, "y": y, "width": w, "height": h}}
+
+
+def check_tiling(c: Checker, tmp_dir: str):
+    print("\n🔍 分块切分与合并")
+    tiler = Tiler(1024, 0.2)
+    grid = tiler.grid(2500, 900, 1024)
+    c.check("分块覆盖整图且末块贴边", grid[:, 2].max() == 2500 and grid[:, 3].max() == 900 and grid[:, 0].min() == 0)
+    c.check("相邻分块重叠", sorted(set(grid[:, 0].tolist())) == [0, 819, 1476], grid[:, 0].tolist())
+    c.check("小图只有一块", tiler.grid(300, 200, 1024).tolist() == [[0, 0, 300, 200]])
+
+    # 左右两块各检出同一条裂缝的一部分（以分块百分比坐标表示），右块另有一处污渍
+    regions = np.array([[0, 0, 60, 100], [40, 0, 60, 100]], dtype=np.float64)
+    issues = [make_issue("crack", 0.9, 70, 10, 30, 20), make_issue("crack", 0.6, 10, 10, 20, 20),
+              make_issue("stain", 0.8, 10, 10, 20, 20)]
+    merged = tiler.merge_issues(issues, regions[[0, 1, 1]])
+    c.check("NMS 合并同类重复框", sorted(i["type"] for i in merged) == ["crack", "stain"], merged)
+    crack = next(i for i in merged if i["type"] == "crack")
+    c.check("保留最高分框并换算到整图", crack["confidence"] == 0.9 and crack["bbox"]["x"] == 42.0, crack)
+
+    wbf = Tiler(1024, 0.2, merge="wbf", metric="iou", threshold=0.3)
+    fused = wbf.merge_issues([make_issue("crack", 0.75, 10, 10, 20, 20), make_issue("crack", 0.25, 14, 10, 20, 20)],
+                             np.array([[0, 0, 100, 100]] * 2, dtype=np.float64))
+    c.check("WBF 按置信度加权融合", len(fused) == 1 and fused[0]["bbox"]["x"] == 11.0 and fused[0]["confidence"] == 0.5, fused)
+
+    rng = np.random.default_rng(0)
+    many = [make_issue(str(k % 3), float(rng.random()), *(rng.random(2) * 90).tolist(), 5.0, 5.0) for k in range(5000)]
+    started = time.perf_counter()
+    tiler.merge_issues(many, np.array([[0, 0, 100, 100]] * len(many), dtype=np.float64))
+    c.check("5000 个框合并耗时", time.perf_counter() - started < 2.0, time.perf_counter() - started)
+
+    path = os.path.join(tmp_dir, "large.jpg")
+    Image.new("RGB", (3000, 2000), "white").save(path, "JPEG")
+    backend = create_backend("mock", batch_size=4, tiling=True)
+    frame, tile = backend.tiler.open(path, backend.input_size)
+    c.check("按分块缩放比例草稿解码", max(frame.size) < 3000 and tile < 1024, (frame.size, tile))
+    detections = backend.detect([{"id": "large", "file_path": path}], "building")
+    stats = backend.stats()
+    c.check("分块分批推理", stats["tiles"] == 4 * 3 + 1 and stats["batches"] == 4, stats)
+    c.check("问题框位于整图内", all(0 <= i["bbox"]["x"] <= 100 and i["bbox"]["x"] + i["bbox"]["width"] <= 100.05
+                                    for i in detections[0]["issues"]))
+
+    async def run():
+        from services.detection_workers import DetectionWorkerPool
+        pool = DetectionWorkerPool(create_backend("mock", batch_size=4, tiling=True), "mock", workers=2, buffers=1)
+        await pool.start()
+        try:
+            return await pool.detect([{"id": "large", "file_path": path}] * 3, "building"), pool.stats()
+        finally:
+            await pool.stop()
+
+    detections, stats = asyncio.run(run())
+    c.check("工作进程中分块推理", len(detections) == 3 and stats["tiles"] == 39, stats)
+
+
+def build_model(path: str, size: int, batch):
+    """输出 [N, 1, 6]：固定框 (10%, 20%) - (50%, 60%)，置信度为平均亮度，类别 1"""
+    import numpy as np
+    from onnx import TensorProto, helper, numpy_helper, save
+
+    box = np.array([[[0.1, 0.2, 0.5, 0.6]]], dtype=np.float32) * size
+    nodes = [
+        helper.make_node("ReduceMean", ["images"], ["mean"], axes=[1, 2, 3], keepdims=1),
+        helper.make_node("Reshape", ["mean", "score_shape"], ["score"]),
+        helper.make_node("Shape", ["images"], ["input_shape"]),
+        helper.make_node("Slice", ["input_shape", "zero", "one"], ["n"]),
+        helper.make_node("Concat", ["n", "box_dims"], ["box_shape"], axis=0),
+        helper.make_node("Expand", ["box", "box_shape"], ["boxes"]),
+        helper.make_node("Concat", ["n", "class_dims"], ["class_shape"], axis=0),
+        helper.make_node("Expand", ["cls", "class_shape"], ["classes"]),
+        helper.make_node("Concat", ["boxes", "score", "classes"], ["output"], axis=2),
+    ]
+    initializers = [
+        numpy_helper.from_array(np.array([-1, 1, 1], dtype=np.int64), "score_shape"),
+        numpy_helper.from_array(np.array([0], dtype=np.int64), "zero"),
+        numpy_helper.from_array(np.array([1], dtype=np.int64), "one"),
+        numpy_helper.from_array(np.array([1, 4], dtype=np.int64), "box_dims"),
+        numpy_helper.from_array(np.array([1, 1], dtype=np.int64), "class_dims"),
+        numpy_helper.from_array(box, "box"),
+        numpy_helper.from_array(np.array([[[1.0]]], dtype=np.float32), "cls"),
+    ]
+    graph = helper.make_graph(
+        nodes, "brightness",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, [batch, 3, size, size])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [batch, 1, 6])],
+        initializers
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    save(model, path)
+
+
+def check_onnx(c: Checker, tmp_dir: str):
+    try:
+        import onnx  # noqa: F401
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        print("\n⏭️ 未安装 onnxruntime/onnx，跳过 ONNX 后端")
+        return
+
+    from inference.onnx_runtime import OnnxBackend
+
+    images = make_images(tmp_dir, ["white", "black", "white", "black", "white"])
+    for label, batch in (("动态批次", "N"), ("固定批次", 1)):
+        print(f"\n🔍 ONNX 后端（{label}）")
+        model_path = os.path.join(tmp_dir, f"model_{batch}.onnx")
+        build_model(model_path, 32, batch)
+        backend = OnnxBackend(model_path, 32, batch_size=2, labels=["crack", "pothole"], score_threshold=0.5)
+        backend.load()
+        backend.warmup()
+        c.check("模型版本含文件摘要", backend.model_version.startswith(f"model_{batch}.onnx@"), backend.model_version)
+
+        detections = backend.detect(images, "road")
+        c.check("结果与输入一一对应", [d["image_id"] for d in detections] == [img["id"] for img in images])
+        statuses = [d["status"] for d in detections]
+        c.check("亮图有问题、暗图无问题", statuses == ["danger", "success", "danger", "success", "danger"], statuses)
+
+        issue = detections[0]["issues"][0]
+        c.check("类别映射为问题类型", (issue["type"], issue["name"], issue["severity"]) == ("pothole", "坑洞", "danger"), issue)
+        c.check("问题框换算为百分比",
+                issue["bbox"] == {"x": 10.0, "y": 20.0, "width": 40.0, "height": 40.0}, issue["bbox"])
+        c.check("无问题图片的置信度", detections[1]["confidence"] == 1.0, detections[1]["confidence"])
+
+    print("\n🔍 ONNX 后端（分块推理）")
+    path = os.path.join(tmp_dir, "half.png")
+    half = Image.new("RGB", (200, 100), "black")
+    half.paste(Image.new("RGB", (100, 100), "white"))
+    half.save(path)
+    model_path = os.path.join(tmp_dir, "model_N.onnx")
+    backend = OnnxBackend(model_path, 32, batch_size=2, labels=["crack", "pothole"], score_threshold=0.5)
+    backend.tiler = Tiler(100, 0.0, full_frame=False)
+    backend.load()
+    issues = backend.detect([{"id": "half", "file_path": path}], "road")[0]["issues"]
+    c.check("只有亮的分块检出", len(issues) == 1, issues)
+    c.check("分块问题框换算到整图", issues[0]["bbox"] == {"x": 5.0, "y": 20.0, "width": 20.0, "height": 40.0}, issues)
+
+
+def main() -> int:
+    c = Checker()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        check_mock(c, tmp_dir)
+        check_mock_profile(c, tmp_dir)
+        check_worker_pool(c, tmp_dir)
+        check_tiling(c, tmp_dir)
+        check_onnx(c, tmp_dir)
+
+    if c.failures:
+        print(f"\n❌ {c.failures} 项检查失败")
+        return 1
+
+    print("\n🎉 全部检查通过")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
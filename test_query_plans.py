@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+热点查询执行计划检查
+在临时数据库上执行全部迁移，对各路由中的热点查询运行 EXPLAIN QUERY PLAN，
+确认没有查询对表做全表扫描（SCAN），全部走索引查找（SEARCH）；
+ORDERED_SCANS 中的查询按索引顺序读取前 LIMIT 行，允许使用索引的有序扫描
+
+用法: python test_query_plans.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import aiosqlite
+
+from migrations import run_migrations
+
+# (说明, SQL, 参数)
+HOT_QUERIES = [
+    ("项目图片列表", "SELECT * FROM images WHERE project_id = ?", ("p",)),
+    ("待分析图片计数",
+     """SELECT COUNT(*) as image_count,
+               SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END) as pending_count
+        FROM images WHERE project_id = ?""", ("p",)),
+    ("标记已分析图片", "UPDATE images SET status = ? WHERE project_id = ? AND status = ?",
+     ("analyzed", "p", "pending")),
+    ("项目图片按拍摄时间排序",
+     "SELECT id, captured_at FROM images WHERE project_id = ? ORDER BY captured_at", ("p",)),
+    ("项目图片按地理范围筛选",
+     """SELECT id FROM images WHERE project_id = ?
+        AND gps_lat BETWEEN ? AND ? AND gps_lng BETWEEN ? AND ?""", ("p", 31.0, 31.5, 121.0, 121.5)),
+    ("待检测图片",
+     """SELECT i.id, i.filename, i.file_path, i.sha256, i.thumbnail_sizes
+        FROM images i
+        LEFT JOIN detection_results dr ON dr.image_id = i.id
+        WHERE i.project_id = ? AND dr.id IS NULL""", ("p",)),
+    ("待检测图片数",
+     """SELECT COUNT(*) AS count FROM images i WHERE i.project_id = ?
+        AND NOT EXISTS (SELECT 1 FROM detection_results dr WHERE dr.image_id = i.id)""", ("p",)),
+    ("分批读取待检测图片",
+     """SELECT i.id, i.filename, i.file_path, i.sha256, i.thumbnail_sizes
+        FROM images i
+        LEFT JOIN detection_results dr ON dr.image_id = i.id
+        WHERE i.project_id = ? AND i.id > ? AND dr.id IS NULL
+        ORDER BY i.id LIMIT ?""", ("p", "i", 32)),
+    ("检测结果分页",
+     """SELECT dr.*, i.filename, i.original_name, i.sha256, i.thumbnail_sizes
+        FROM detection_results dr
+        JOIN images i ON dr.image_id = i.id
+        WHERE dr.project_id = ? AND dr.image_id > ?
+        ORDER BY dr.image_id LIMIT ?""", ("p", "", 100)),
+    ("一批检测结果的问题", "SELECT * FROM issues WHERE detection_id IN (?, ?, ?)", ("a", "b", "c")),
+    ("恢复未完成的检测任务",
+     "SELECT * FROM detection_jobs WHERE status IN (?, ?) ORDER BY created_at LIMIT ?",
+     ("queued", "running", 100)),
+    ("可领取的检测任务",
+     """SELECT * FROM detection_jobs
+        WHERE status IN ('queued', 'running')
+          AND (status = 'queued' OR lease_expires_at IS NULL OR lease_expires_at <= CURRENT_TIMESTAMP)
+        ORDER BY created_at LIMIT ?""", (100,)),
+    ("领取检测任务",
+     """UPDATE detection_jobs SET status = 'running', owner = ?, lease_expires_at = datetime('now', ?)
+        WHERE id = ? AND status IN ('queued', 'running')
+          AND (status = 'queued' OR lease_expires_at IS NULL OR lease_expires_at <= CURRENT_TIMESTAMP)""",
+     ("w", "+60 seconds", "j")),
+    ("项目未完成的检测任务",
+     "SELECT * FROM detection_jobs WHERE project_id = ? AND status IN ('queued', 'running')", ("p",)),
+    ("读取检测结果缓存", "SELECT key, result FROM detection_cache WHERE key IN (?, ?)", ("a", "b")),
+    ("更新缓存使用时间", "UPDATE detection_cache SET last_used_at = CURRENT_TIMESTAMP WHERE key = ?", ("a",)),
+    ("淘汰最久未使用的缓存", "SELECT key, size FROM detection_cache ORDER BY last_used_at LIMIT ?", (500,)),
+    ("删除缓存条目", "DELETE FROM detection_cache WHERE key = ?", ("a",)),
+    ("项目检测结果",
+     """SELECT dr.*, i.filename, i.original_name, i.sha256, i.thumbnail_sizes
+        FROM detection_results dr
+        JOIN images i ON dr.image_id = i.id
+        WHERE dr.project_id = ?""", ("p",)),
+    ("检测结果的问题列表", "SELECT * FROM issues WHERE detection_id = ?", ("d",)),
+    ("按图片查找检测结果", "SELECT id FROM detection_results WHERE project_id = ? AND image_id = ?",
+     ("p", "i")),
+    ("检测统计",
+     """SELECT COUNT(*) as total,
+               SUM(CASE WHEN status = 'danger' THEN 1 ELSE 0 END) as danger_count,
+               AVG(confidence) as avg_confidence
+        FROM detection_results WHERE project_id = ?""", ("p",)),
+    ("项目问题计数",
+     """SELECT COUNT(*) as count FROM issues
+        WHERE detection_id IN (SELECT id FROM detection_results WHERE project_id = ?)""", ("p",)),
+    ("删除项目问题",
+     "DELETE FROM issues WHERE detection_id IN (SELECT id FROM detection_results WHERE project_id = ?)",
+     ("p",)),
+    ("删除项目检测结果", "DELETE FROM detection_results WHERE project_id = ?", ("p",)),
+    ("删除项目图片", "DELETE FROM images WHERE project_id = ?", ("p",)),
+    ("待回收项目", "SELECT id FROM projects WHERE deleted_at IS NOT NULL ORDER BY deleted_at LIMIT ?", (100,)),
+    ("分批回收图片", "SELECT id FROM images WHERE project_id = ? LIMIT ?", ("p", 200)),
+    ("回收图片的问题",
+     "DELETE FROM issues WHERE detection_id IN (SELECT id FROM detection_results WHERE image_id = ?)",
+     ("i",)),
+    ("回收图片的检测结果", "DELETE FROM detection_results WHERE image_id = ?", ("i",)),
+    ("续传已接收分块",
+     "SELECT chunk_index FROM upload_session_chunks WHERE session_id = ? ORDER BY chunk_index", ("s",)),
+    ("积分历史分页",
+     """SELECT * FROM credit_history WHERE user_id = ?
+        ORDER BY timestamp DESC LIMIT ? OFFSET ?""", (1, 10, 0)),
+    ("积分记录计数", "SELECT COUNT(*) FROM credit_history WHERE user_id = ?", (1,)),
+    ("用户快照列表",
+     """SELECT id, step_index, step_route, name, created_at FROM step_snapshots
+        WHERE user_id = ? ORDER BY created_at DESC""", (1,)),
+    ("覆盖同步骤快照", "DELETE FROM step_snapshots WHERE user_id = ? AND step_index = ?", (1, 0)),
+]
+
+# 按索引顺序读取前 LIMIT 行的查询（不会读取整张表）
+ORDERED_SCANS = {"淘汰最久未使用的缓存"}
+
+
+def find_scans(plan_rows, ordered: bool = False) -> list:
+    """执行计划中的扫描步骤；ordered=True 时忽略按索引顺序的扫描"""
+    return [row[3] for row in plan_rows
+            if row[3].startswith("SCAN ") and not (ordered and " USING INDEX " in row[3])]
+
+
+async def check_query_plans() -> int:
+    """检查全部热点查询的执行计划"""
+    print("🚀 检查热点查询执行计划...\n")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        async with aiosqlite.connect(os.path.join(tmp_dir, "plans.db")) as db:
+            applied = await run_migrations(db)
+            print(f"已应用迁移: {applied}\n")
+
+            # 迁移可重复执行
+            assert await run_migrations(db) == [], "重复执行迁移不应再应用任何版本"
+
+            failures = 0
+            for label, sql, params in HOT_QUERIES:
+                cursor = await db.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                scans = find_scans(await cursor.fetchall(), ordered=label in ORDERED_SCANS)
+                if scans:
+                    failures += 1
+                    print(f"❌ {label}: {'; '.join(scans)}")
+                else:
+                    print(f"✅ {label}")
+
+    if failures:
+        print(f"\n❌ {failures} 个热点查询存在全表扫描")
+        return 1
+
+    print(f"\n🎉 {len(HOT_QUERIES)} 个热点查询均使用索引")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(check_query_plans()))